@@ -0,0 +1,213 @@
+"""
+LLM 토큰 예산 + 비용 기반 진입 제어
+
+테넌트별/일별(UTC) 실제 사용량(응답의 usage)으로 지출을 누적하고,
+호출 전에 프롬프트 토큰을 로컬에서 추정해 예상 비용을 먼저 예약(reserve)한다.
+예약 덕분에 업로드가 몰려도 동시에 들어온 호출들이 한꺼번에 한도를 넘기지 못한다.
+
+예산 사용률에 따라 단계적으로 줄인다 (mode):
+  full        - 제한 없음
+  deferred    - LLM_BUDGET_DEFER_AT 이상: 배치(파일 분류) LLM 보정은 미루고 룰 결과 + LLM_DEFERRED 표시
+  cached_only - LLM_BUDGET_CACHED_AT 이상: 새 LLM 호출 없음, 캐시/학습 결과만 사용
+  rules_only  - 한도 도달: 룰 기반 결과만
+
+지출 장부는 프로세스 메모리에 있다 (워커가 여럿이면 워커별 한도가 된다).
+"""
+
+from ..utils.costs import estimate_cost
+from ..utils.metrics import REGISTRY
+from typing import Dict, List, Optional
+import os, datetime, threading
+
+LLM_BUDGET_ENABLED = os.getenv("LLM_BUDGET_ENABLED", "true").lower() not in ("0", "false", "no")
+LLM_BUDGET_TENANT_DAILY_USD = float(os.getenv("LLM_BUDGET_TENANT_DAILY_USD", "0.5"))
+LLM_BUDGET_GLOBAL_DAILY_USD = float(os.getenv("LLM_BUDGET_GLOBAL_DAILY_USD", "0"))  # 0 = 전체 한도 없음
+LLM_BUDGET_DEFER_AT = float(os.getenv("LLM_BUDGET_DEFER_AT", "0.8"))
+LLM_BUDGET_CACHED_AT = float(os.getenv("LLM_BUDGET_CACHED_AT", "0.95"))
+LLM_BUDGET_EST_OUTPUT = int(os.getenv("LLM_BUDGET_EST_OUTPUT", "200"))  # max_tokens 가 없을 때 예약할 출력 토큰
+LLM_BUDGET_KEEP_DAYS = 2
+
+FULL, DEFERRED, CACHED_ONLY, RULES_ONLY = "full", "deferred", "cached_only", "rules_only"
+MODES = (FULL, DEFERRED, CACHED_ONLY, RULES_ONLY)
+
+BUDGET_REJECTED = REGISTRY.counter("llm_budget_rejected_total", "예산 초과로 보내지 않은 LLM 호출", ("mode",))
+BUDGET_DEGRADED = REGISTRY.counter("llm_budget_degraded_total", "예산 때문에 낮춘 처리 경로", ("path", "mode"))
+
+class BudgetExceeded(RuntimeError):
+    """예산 한도로 LLM 을 부르지 않음 - 호출부는 룰/캐시 결과로 대체"""
+
+    def __init__(self, tenant: str, mode: str, needed: float = 0.0):
+        super().__init__(f"LLM budget {mode} for tenant {tenant or '(anonymous)'} (needed ${needed:.5f})")
+        self.tenant = tenant
+        self.mode = mode
+
+# ── 토큰 추정 ─────────────────────────────────────────────
+_encoders: Dict[str, object] = {}
+
+def _encoder(model: str):
+    """tiktoken 이 있으면 모델 인코더, 없으면 None (휴리스틱)"""
+    if model not in _encoders:
+        try:
+            import tiktoken
+            try:
+                _encoders[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encoders[model] = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoders[model] = None
+    return _encoders[model]
+
+def count_tokens(text: str, model: str = "") -> int:
+    enc = _encoder(model)
+    if enc is not None:
+        return len(enc.encode(text))
+    # 휴리스틱: 한글 등 비ASCII 는 글자당 1토큰, ASCII 는 4글자당 1토큰 (실측보다 약간 크게 잡힌다)
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return non_ascii + (len(text) - non_ascii + 3) // 4
+
+def estimate_prompt_tokens(messages: List[dict], model: str = "") -> int:
+    # 메시지당 역할/구분자 오버헤드 4토큰 + 응답 프라이밍 3토큰
+    return sum(count_tokens(str(m.get("content") or ""), model) + 4 for m in messages) + 3
+
+# ── 지출 장부 ─────────────────────────────────────────────
+def _today() -> str:
+    return datetime.datetime.utcnow().strftime("%Y-%m-%d")
+
+class _Ledger:
+    def __init__(self):
+        self._spent: Dict[tuple, List[float]] = {}  # (테넌트, 일자) → [USD, 입력 토큰, 출력 토큰, 호출 수]
+        self._reserved: Dict[tuple, float] = {}
+        self._typical = 0.0  # 최근 예약 금액 EWMA - 단계 판정 시 "다음 호출 1건" 만큼 여유를 본다
+        self._lock = threading.Lock()
+
+    def _prune(self, day: str):
+        if len({k[1] for k in self._spent}) > LLM_BUDGET_KEEP_DAYS:
+            for k in [k for k in self._spent if k[1] < day]:
+                self._spent.pop(k, None)
+                self._reserved.pop(k, None)
+
+    def _used(self, key: tuple) -> float:
+        return self._spent.get(key, [0.0])[0] + self._reserved.get(key, 0.0)
+
+    def _global_used(self, day: str) -> float:
+        return sum(v[0] for k, v in self._spent.items() if k[1] == day) + \
+               sum(v for k, v in self._reserved.items() if k[1] == day)
+
+    def fraction(self, tenant: str, day: str) -> float:
+        with self._lock:
+            used = self._used((tenant, day)) + self._typical
+            frac = used / LLM_BUDGET_TENANT_DAILY_USD if LLM_BUDGET_TENANT_DAILY_USD > 0 else 0.0
+            if LLM_BUDGET_GLOBAL_DAILY_USD > 0:
+                frac = max(frac, (self._global_used(day) + self._typical) / LLM_BUDGET_GLOBAL_DAILY_USD)
+            return frac
+
+    def reserve(self, tenant: str, day: str, usd: float) -> bool:
+        with self._lock:
+            self._typical = usd if not self._typical else 0.8 * self._typical + 0.2 * usd
+            key = (tenant, day)
+            if LLM_BUDGET_TENANT_DAILY_USD > 0 and self._used(key) + usd > LLM_BUDGET_TENANT_DAILY_USD:
+                return False
+            if LLM_BUDGET_GLOBAL_DAILY_USD > 0 and self._global_used(day) + usd > LLM_BUDGET_GLOBAL_DAILY_USD:
+                return False
+            self._reserved[key] = self._reserved.get(key, 0.0) + usd
+            return True
+
+    def settle(self, tenant: str, day: str, reserved: float, usage: Optional[dict], usd: float):
+        with self._lock:
+            key = (tenant, day)
+            self._reserved[key] = max(self._reserved.get(key, 0.0) - reserved, 0.0)
+            if usage is not None:
+                row = self._spent.setdefault(key, [0.0, 0.0, 0.0, 0.0])
+                row[0] += usd
+                row[1] += usage.get("prompt_tokens", 0) or 0
+                row[2] += usage.get("completion_tokens", 0) or 0
+                row[3] += 1
+                self._prune(day)
+
+    def snapshot(self, tenant: str, day: str) -> dict:
+        with self._lock:
+            usd, tin, tout, calls = self._spent.get((tenant, day), [0.0, 0.0, 0.0, 0.0])
+            return {"spent_usd": round(usd, 6), "reserved_usd": round(self._reserved.get((tenant, day), 0.0), 6),
+                    "prompt_tokens": int(tin), "completion_tokens": int(tout), "calls": int(calls)}
+
+    def tenants(self, day: str) -> List[str]:
+        with self._lock:
+            return [k[0] for k in self._spent if k[1] == day]
+
+_ledger = _Ledger()
+
+def mode(tenant: Optional[str]) -> str:
+    """현재 예산 단계"""
+    if not LLM_BUDGET_ENABLED:
+        return FULL
+    frac = _ledger.fraction(tenant or "", _today())
+    if frac >= 1.0:
+        return RULES_ONLY
+    if frac >= LLM_BUDGET_CACHED_AT:
+        return CACHED_ONLY
+    if frac >= LLM_BUDGET_DEFER_AT:
+        return DEFERRED
+    return FULL
+
+def allows(tenant: Optional[str], deferrable: bool = False) -> bool:
+    """새 LLM 호출을 시작해도 되는지 - 배치성 작업(deferrable)은 deferred 단계부터 미룬다"""
+    m = mode(tenant)
+    return m == FULL or (m == DEFERRED and not deferrable)
+
+def degraded(path: str, tenant: Optional[str]) -> str:
+    """낮춘 처리 경로 기록 후 현재 단계 반환"""
+    m = mode(tenant)
+    BUDGET_DEGRADED.inc(path=path, mode=m)
+    return m
+
+class Reservation:
+    """호출 1건의 예상 비용 예약 - 응답 usage 로 정산하거나 실패 시 해제"""
+
+    def __init__(self, tenant: str, model: str, messages: List[dict], max_output: Optional[int] = None):
+        self.tenant = tenant
+        self.day = _today()
+        self.prompt_tokens = estimate_prompt_tokens(messages, model)
+        self.usd = estimate_cost(self.prompt_tokens, max_output or LLM_BUDGET_EST_OUTPUT)
+        self._open = False
+
+    def acquire(self) -> "Reservation":
+        current = mode(self.tenant)
+        if current in (CACHED_ONLY, RULES_ONLY):
+            BUDGET_REJECTED.inc(mode=current)
+            raise BudgetExceeded(self.tenant, current, self.usd)
+        if LLM_BUDGET_ENABLED and not _ledger.reserve(self.tenant, self.day, self.usd):
+            BUDGET_REJECTED.inc(mode=RULES_ONLY)
+            raise BudgetExceeded(self.tenant, RULES_ONLY, self.usd)
+        self._open = LLM_BUDGET_ENABLED
+        return self
+
+    def settle(self, usage: Optional[dict], usd: float):
+        """실제 사용량으로 정산 (usage=None 이면 예약만 해제)"""
+        if self._open:
+            _ledger.settle(self.tenant, self.day, self.usd, usage, usd)
+            self._open = False
+        elif usage is not None:
+            _ledger.settle(self.tenant, self.day, 0.0, usage, usd)
+
+    def release(self):
+        self.settle(None, 0.0)
+
+def reserve(tenant: Optional[str], model: str, messages: List[dict], max_output: Optional[int] = None) -> Reservation:
+    """예상 비용 예약 - 한도를 넘기면 BudgetExceeded"""
+    return Reservation(tenant or "", model, messages, max_output).acquire()
+
+def status(tenant: Optional[str]) -> dict:
+    tenant = tenant or ""
+    day = _today()
+    return {"tenant": tenant, "day": day, "mode": mode(tenant),
+            "limit_usd": LLM_BUDGET_TENANT_DAILY_USD or None,
+            "global_limit_usd": LLM_BUDGET_GLOBAL_DAILY_USD or None,
+            **_ledger.snapshot(tenant, day)}
+
+def _tenants_by_mode() -> Dict[tuple, float]:
+    counts = {m: 0.0 for m in MODES}
+    for t in _ledger.tenants(_today()):
+        counts[mode(t)] += 1
+    return {(m,): v for m, v in counts.items()}
+
+REGISTRY.gauge("llm_budget_tenants", "오늘 LLM 을 쓴 테넌트 수 (예산 단계별)", ("mode",), fn=_tenants_by_mode)
@@ -0,0 +1,174 @@
+"""
+LLM 호출 회로 차단기 + 재시도 백오프
+
+모델별로 최근 LLM_CB_WINDOW 초의 결과(성공/실패, 지연)를 보고
+실패율 또는 느린 호출 비율이 임계치를 넘으면 회로를 연다(open).
+열린 동안은 업스트림을 부르지 않고 즉시 실패 → 호출부는 룰 기반 결과를 그대로 쓴다.
+대기 시간이 지나면 반개방(half-open)으로 소수의 탐색 호출만 보내 회복 여부를 본다.
+429 의 Retry-After 는 모델 단위로 기억해 그 시각까지 모든 스레드가 같이 기다리지 않고 즉시 실패한다.
+"""
+
+from ..utils.metrics import REGISTRY
+from collections import deque
+from typing import Dict, Optional, Tuple
+import os, time, random, threading
+
+LLM_CB_WINDOW = float(os.getenv("LLM_CB_WINDOW", "30"))
+LLM_CB_MIN_CALLS = int(os.getenv("LLM_CB_MIN_CALLS", "10"))
+LLM_CB_ERROR_RATE = float(os.getenv("LLM_CB_ERROR_RATE", "0.5"))
+LLM_CB_SLOW_SECONDS = float(os.getenv("LLM_CB_SLOW_SECONDS", "10"))
+LLM_CB_SLOW_RATE = float(os.getenv("LLM_CB_SLOW_RATE", "0.8"))
+LLM_CB_OPEN_SECONDS = float(os.getenv("LLM_CB_OPEN_SECONDS", "10"))
+LLM_CB_MAX_OPEN_SECONDS = float(os.getenv("LLM_CB_MAX_OPEN_SECONDS", "120"))
+LLM_CB_HALF_OPEN_PROBES = int(os.getenv("LLM_CB_HALF_OPEN_PROBES", "2"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.25"))
+LLM_BACKOFF_CAP = float(os.getenv("LLM_BACKOFF_CAP", "4"))
+LLM_RETRY_BUDGET = float(os.getenv("LLM_RETRY_BUDGET", "6"))  # 한 번의 call_openai 가 재시도로 쓸 수 있는 최대 시간
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUE = {CLOSED: 0.0, HALF_OPEN: 1.0, OPEN: 2.0}
+
+# 재시도할 HTTP 상태 (그 외 4xx 는 요청 자체 문제라 바로 실패)
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+CIRCUIT_REJECTED = REGISTRY.counter("llm_circuit_rejected_total", "회로 차단으로 즉시 실패한 LLM 호출", ("model", "reason"))
+CIRCUIT_TRANSITIONS = REGISTRY.counter("llm_circuit_transitions_total", "회로 상태 전이", ("model", "state"))
+LLM_RETRIES = REGISTRY.counter("llm_retries_total", "LLM 재시도 횟수", ("model", "reason"))
+
+class CircuitOpenError(RuntimeError):
+    """회로가 열려 있어 호출하지 않음"""
+
+    def __init__(self, model: str, retry_in: float, reason: str = "open"):
+        super().__init__(f"LLM circuit {reason} for {model} (retry in {retry_in:.1f}s)")
+        self.model = model
+        self.retry_in = retry_in
+        self.reason = reason
+
+class CircuitBreaker:
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self._calls: deque = deque()  # (시각, 성공 여부, 느린 호출 여부)
+        self._opened_at = 0.0
+        self._open_for = LLM_CB_OPEN_SECONDS
+        self._probes = 0
+        self._blocked_until = 0.0     # Retry-After
+        self._lock = threading.Lock()
+
+    def _transition(self, state: str):
+        if state != self.state:
+            self.state = state
+            CIRCUIT_TRANSITIONS.inc(model=self.name, state=state)
+
+    def _trim(self, now: float):
+        while self._calls and now - self._calls[0][0] > LLM_CB_WINDOW:
+            self._calls.popleft()
+
+    def before_call(self):
+        """호출 가능하면 통과, 아니면 CircuitOpenError"""
+        now = time.monotonic()
+        with self._lock:
+            if now < self._blocked_until:
+                CIRCUIT_REJECTED.inc(model=self.name, reason="retry_after")
+                raise CircuitOpenError(self.name, self._blocked_until - now, "rate-limited")
+            if self.state == OPEN:
+                if now - self._opened_at < self._open_for:
+                    CIRCUIT_REJECTED.inc(model=self.name, reason="open")
+                    raise CircuitOpenError(self.name, self._open_for - (now - self._opened_at))
+                self._transition(HALF_OPEN)
+                self._probes = 0
+            if self.state == HALF_OPEN:
+                if self._probes >= LLM_CB_HALF_OPEN_PROBES:
+                    CIRCUIT_REJECTED.inc(model=self.name, reason="half_open")
+                    raise CircuitOpenError(self.name, 0.0, "half-open")
+                self._probes += 1
+
+    def release(self):
+        """before_call 로 잡은 반개방 탐색 자리를 결과 없이 반납 (헤지에 져서 취소된 호출 등)"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probes = max(self._probes - 1, 0)
+
+    def record(self, ok: bool, seconds: float, retry_after: Optional[float] = None):
+        now = time.monotonic()
+        slow = seconds >= LLM_CB_SLOW_SECONDS
+        with self._lock:
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, now + retry_after)
+            if self.state == HALF_OPEN:
+                self._probes = max(self._probes - 1, 0)
+                if ok and not slow:
+                    self._transition(CLOSED)
+                    self._calls.clear()
+                    self._open_for = LLM_CB_OPEN_SECONDS
+                else:
+                    # 탐색 실패 - 대기 시간을 늘려 다시 연다
+                    self._open_for = min(self._open_for * 2, LLM_CB_MAX_OPEN_SECONDS)
+                    self._opened_at = now
+                    self._transition(OPEN)
+                return
+            self._calls.append((now, ok, slow))
+            self._trim(now)
+            n = len(self._calls)
+            if self.state == CLOSED and n >= LLM_CB_MIN_CALLS:
+                failures = sum(1 for _, o, _ in self._calls if not o)
+                slows = sum(1 for _, _, s in self._calls if s)
+                if failures / n >= LLM_CB_ERROR_RATE or slows / n >= LLM_CB_SLOW_RATE:
+                    self._opened_at = now
+                    self._transition(OPEN)
+
+    def snapshot(self) -> Dict[str, float]:
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            n = len(self._calls)
+            return {"state": self.state, "calls": n,
+                    "error_rate": round(sum(1 for _, o, _ in self._calls if not o) / n, 3) if n else 0.0,
+                    "retry_in": round(max(self._opened_at + self._open_for - now, 0.0), 2) if self.state == OPEN else 0.0,
+                    "blocked_for": round(max(self._blocked_until - now, 0.0), 2)}
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+def breaker(model: str) -> CircuitBreaker:
+    b = _breakers.get(model)
+    if b is None:
+        with _breakers_lock:
+            b = _breakers.setdefault(model, CircuitBreaker(model))
+    return b
+
+def states() -> Dict[str, Dict[str, float]]:
+    return {name: b.snapshot() for name, b in list(_breakers.items())}
+
+def is_open(model: str) -> bool:
+    b = _breakers.get(model)
+    return b is not None and b.state == OPEN
+
+def reset():
+    with _breakers_lock:
+        _breakers.clear()
+
+REGISTRY.gauge("llm_circuit_state", "LLM 회로 상태 (0=closed, 1=half_open, 2=open)", ("model",),
+               fn=lambda: {(name,): _STATE_VALUE[b.state] for name, b in list(_breakers.items())})
+
+def classify_error(e: Exception) -> Tuple[bool, Optional[int], Optional[float]]:
+    """예외 → (재시도 가능 여부, HTTP 상태, Retry-After 초) - SDK/직접 HTTP 오류 모두 처리"""
+    status = getattr(e, "status", None) or getattr(e, "status_code", None)
+    retry_after = getattr(e, "retry_after", None)
+    if retry_after is None:
+        headers = getattr(getattr(e, "response", None), "headers", None)
+        value = headers.get("retry-after") if headers is not None else None
+        try:
+            retry_after = float(value) if value else None
+        except ValueError:
+            retry_after = None
+    if status is None:
+        return True, None, retry_after  # 연결 오류/타임아웃
+    return status in RETRYABLE_STATUS, status, retry_after
+
+def backoff(attempt: int, retry_after: Optional[float] = None) -> float:
+    """지수 백오프 + full jitter, Retry-After 가 있으면 그보다 짧게 기다리지 않는다"""
+    delay = random.uniform(0, min(LLM_BACKOFF_CAP, LLM_BACKOFF_BASE * (2 ** attempt)))
+    if retry_after:
+        delay = max(delay, retry_after)
+    return delay
@@ -0,0 +1,330 @@
+"""
+LLM 요청 헤징 + 모델 대체 체인
+
+주 모델이 최근 지연 분포의 백분위(기본 p95) 안에 답하지 않으면
+더 싸고 빠른 대체 모델로 같은 요청을 한 번 더 보내고, 먼저 도착한 "유효한" JSON 을 쓴다.
+진 쪽은 취소 신호(Cancel)를 받아 진행 중인 HTTP 연결을 끊고 남은 재시도를 하지 않는다.
+주 모델이 실패/무효 응답/회로 차단이면 기다리지 않고 바로 대체 모델로 넘어간다.
+
+끊을 수 있는 호출(abortable, 직접 HTTP)은 주 모델을 호출 스레드에서 그대로 실행한다 - 헤지가 이기면
+연결을 끊어 호출 스레드를 바로 깨운다. 끊을 수 없는 호출(SDK)은 주 모델을 전용 풀에서 실행하고
+호출 스레드는 먼저 끝난 쪽을 기다린다 - 진 주 모델 요청은 워커에서 마저 끝나고 결과는 버린다.
+헤지 호출은 별도 풀을 써서 업스트림이 느려져도 헤지 대기열이 주 모델 호출을 막지 않게 한다.
+
+헤지는 최근 호출 중 LLM_HEDGE_MAX_RATE 비율까지만 허용해 비용이 두 배로 늘지 않게 한다.
+엔드포인트별 설정: LLM_HEDGE_POLICY="classify-entry=p95:gpt-4.1-nano,refine=p90,batch=off"
+  (pNN=백분위 마감, 1.5s=고정 마감, off=헤지 끔 / 콜론 뒤는 대체 모델)
+"""
+
+from ..utils.metrics import REGISTRY
+from .budget import BudgetExceeded
+from .circuit import CircuitOpenError
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+import os, time, heapq, itertools, threading
+
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() not in ("0", "false", "no")
+OPENAI_MODEL_FALLBACK = os.getenv("OPENAI_MODEL_FALLBACK", "gpt-4.1-nano")
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "3"))  # 표본이 모이기 전 마감
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.3"))
+LLM_HEDGE_MAX_DELAY = float(os.getenv("LLM_HEDGE_MAX_DELAY", "10"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_WINDOW = int(os.getenv("LLM_HEDGE_WINDOW", "200"))
+LLM_HEDGE_MAX_RATE = float(os.getenv("LLM_HEDGE_MAX_RATE", "0.1"))
+LLM_HEDGE_WORKERS = int(os.getenv("LLM_HEDGE_WORKERS", "16"))
+LLM_HEDGE_PRIMARY_WORKERS = int(os.getenv("LLM_HEDGE_PRIMARY_WORKERS", "64"))  # 끊을 수 없는 주 모델 호출용
+LLM_HEDGE_POLICY = os.getenv("LLM_HEDGE_POLICY", "")
+
+HEDGE_CALLS = REGISTRY.counter("llm_hedge_total", "헤지 결과 (primary=마감 내 응답, primary_won/hedge_won=경쟁 승자, "
+                               "fallback=주 모델 실패 후 대체, failed=모두 실패)", ("endpoint", "outcome"))
+HEDGE_SUPPRESSED = REGISTRY.counter("llm_hedge_suppressed_total", "헤지 비율 상한으로 헤지하지 않은 느린 호출", ("endpoint",))
+
+class InvalidResponse(ValueError):
+    """응답은 왔지만 쓸 수 없는 JSON"""
+
+class Cancel(threading.Event):
+    """취소 신호 - set() 하면 등록된 중단 콜백(진행 중 HTTP 연결 끊기)도 바로 호출"""
+
+    def __init__(self):
+        super().__init__()
+        self._callbacks: List[Callable[[], None]] = []
+        self._cb_lock = threading.Lock()
+
+    def on_cancel(self, fn: Callable[[], None]) -> Callable[[], None]:
+        """중단 콜백 등록 → 등록 해제 함수 (이미 취소됐으면 바로 호출)"""
+        with self._cb_lock:
+            if not self.is_set():
+                self._callbacks.append(fn)
+                return lambda: self._discard(fn)
+        fn()
+        return lambda: None
+
+    def _discard(self, fn):
+        with self._cb_lock:
+            if fn in self._callbacks:
+                self._callbacks.remove(fn)
+
+    def set(self):
+        with self._cb_lock:
+            super().set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn()
+            except Exception:
+                pass
+
+class Policy:
+    def __init__(self, endpoint: str, percentile: Optional[float] = LLM_HEDGE_PERCENTILE,
+                 fixed_delay: Optional[float] = None, fallback: str = OPENAI_MODEL_FALLBACK):
+        self.endpoint = endpoint
+        self.percentile = percentile
+        self.fixed_delay = fixed_delay
+        self.fallback = fallback
+
+    @property
+    def hedging(self) -> bool:
+        return LLM_HEDGE_ENABLED and (self.percentile is not None or self.fixed_delay is not None)
+
+    def deadline(self, model: str) -> float:
+        if self.fixed_delay is not None:
+            return self.fixed_delay
+        return latency(model).percentile(self.percentile)
+
+def parse_policies(spec: str) -> Dict[str, Policy]:
+    policies: Dict[str, Policy] = {}
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        endpoint, _, rule = item.partition("=")
+        rule, _, fallback = rule.strip().partition(":")
+        p = Policy(endpoint.strip(), fallback=fallback.strip() or OPENAI_MODEL_FALLBACK)
+        if rule == "off":
+            p.percentile = None
+        elif rule.endswith("s"):
+            p.percentile, p.fixed_delay = None, float(rule[:-1])
+        elif rule.startswith("p"):
+            p.percentile = float(rule[1:])
+        policies[p.endpoint] = p
+    return policies
+
+_policies = parse_policies(LLM_HEDGE_POLICY)
+
+def policy_for(endpoint: str) -> Policy:
+    return _policies.get(endpoint) or Policy(endpoint)
+
+class LatencyWindow:
+    """모델별 최근 성공 호출 지연 (헤지 마감 계산용)"""
+
+    def __init__(self):
+        self._samples: deque = deque(maxlen=LLM_HEDGE_WINDOW)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> float:
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < LLM_HEDGE_MIN_SAMPLES:
+            return LLM_HEDGE_DEFAULT_DELAY
+        value = samples[min(int(len(samples) * pct / 100.0), len(samples) - 1)]
+        return min(max(value, LLM_HEDGE_MIN_DELAY), LLM_HEDGE_MAX_DELAY)
+
+_latency: Dict[str, LatencyWindow] = {}
+_hedged: Dict[str, deque] = {}  # 엔드포인트별 최근 호출의 헤지 여부 (비율 상한)
+_state_lock = threading.Lock()
+
+def latency(model: str) -> LatencyWindow:
+    w = _latency.get(model)
+    if w is None:
+        with _state_lock:
+            w = _latency.setdefault(model, LatencyWindow())
+    return w
+
+def _note(endpoint: str, hedged: bool):
+    with _state_lock:
+        _hedged.setdefault(endpoint, deque(maxlen=LLM_HEDGE_WINDOW)).append(hedged)
+
+def _may_hedge(endpoint: str) -> bool:
+    with _state_lock:
+        window = _hedged.get(endpoint) or ()
+        # 처음 몇 건은 분모를 LLM_HEDGE_MIN_SAMPLES 로 잡아 시작하자마자 헤지가 몰리지 않게
+        return sum(window) < LLM_HEDGE_MAX_RATE * max(len(window), LLM_HEDGE_MIN_SAMPLES)
+
+def stats() -> Dict[str, dict]:
+    with _state_lock:
+        rates = {ep: round(sum(w) / len(w), 3) for ep, w in _hedged.items() if w}
+    return {"hedge_rate": rates,
+            "deadline": {m: round(policy_for("").deadline(m), 3) for m in list(_latency)}}
+
+REGISTRY.gauge("llm_hedge_deadline_seconds", "모델별 현재 헤지 마감 (기본 백분위)", ("model",),
+               fn=lambda: {(m,): policy_for("").deadline(m) for m in list(_latency)})
+
+# 헤지 호출 전용 - 주 모델 호출은 이 풀을 쓰지 않는다
+_pool = ThreadPoolExecutor(max_workers=LLM_HEDGE_WORKERS, thread_name_prefix="llm-hedge")
+# 끊을 수 없는 주 모델 호출 전용 - 헤지가 이기면 호출 스레드는 이 워커를 기다리지 않는다
+_primary_pool = ThreadPoolExecutor(max_workers=LLM_HEDGE_PRIMARY_WORKERS, thread_name_prefix="llm-primary")
+
+class _Superseded(Exception):
+    """헤지가 먼저 이겨 끊을 수 없는 주 모델 호출을 더 기다리지 않음"""
+
+class _Timers:
+    """헤지 마감 타이머 - 호출마다 스레드를 만들지 않고 스레드 하나가 힙 순서로 실행"""
+
+    def __init__(self):
+        self._heap: list = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self, delay: float, fn: Callable[[], None]) -> list:
+        entry = [time.monotonic() + delay, next(self._seq), fn]
+        with self._cond:
+            heapq.heappush(self._heap, entry)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="llm-hedge-timer", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return entry
+
+    @staticmethod
+    def cancel(entry: list):
+        entry[2] = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                fn = heapq.heappop(self._heap)[2]
+            if fn is not None:
+                try:
+                    fn()
+                except Exception:
+                    pass
+
+_timers = _Timers()
+
+def _attempt(call: Callable, model: str, messages: list, accept: Callable[[dict], Optional[dict]],
+             cancel: Cancel, record: bool, kwargs: dict):
+    started = time.perf_counter()
+    resp = call(model, messages, cancel=cancel, **kwargs)
+    if record:
+        latency(model).record(time.perf_counter() - started)
+    parsed = accept(resp)
+    if parsed is None:
+        raise InvalidResponse(f"invalid JSON from {model}")
+    return resp, parsed, model
+
+def _without_hedge(call: Callable, endpoint: str, model: str, fallback: Optional[str], messages: list,
+                   accept: Callable[[dict], Optional[dict]], kwargs: dict):
+    """헤지 없이 호출 스레드에서 주 모델 → (실패 시) 대체 모델"""
+    try:
+        result = _attempt(call, model, messages, accept, Cancel(), True, kwargs)
+        HEDGE_CALLS.inc(endpoint=endpoint, outcome="primary")
+        return result + ("primary",)
+    except Exception as e:
+        if fallback is None:
+            HEDGE_CALLS.inc(endpoint=endpoint, outcome="failed")
+            raise
+        first_err = e
+    # 대체 체인: 주 모델이 실패/무효/차단 → 대체 모델을 바로 호출
+    try:
+        result = _attempt(call, fallback, messages, accept, Cancel(), False, kwargs)
+        HEDGE_CALLS.inc(endpoint=endpoint, outcome="fallback")
+        return result + ("fallback",)
+    except Exception:
+        HEDGE_CALLS.inc(endpoint=endpoint, outcome="failed")
+        raise first_err
+
+def run(call: Callable, endpoint: str, model: str, messages: list,
+        accept: Callable[[dict], Optional[dict]], abortable: bool = True, **kwargs) -> Tuple[dict, dict, str, str]:
+    """
+    헤지 호출 → (응답, accept 결과, 응답한 모델, outcome)
+    call 은 call_openai 시그니처 (model, messages, cancel=Cancel, **kwargs)
+    accept 는 응답에서 쓸 수 있는 dict 를 꺼내거나 None(무효) 반환
+    abortable=False 면 call 이 Cancel 로 진행 중인 요청을 끊지 못하므로 주 모델을 워커에서 실행한다
+    """
+    policy = policy_for(endpoint)
+    fallback = policy.fallback if policy.fallback and policy.fallback != model else None
+    if not (policy.hedging and fallback):
+        _note(endpoint, False)
+        return _without_hedge(call, endpoint, model, fallback, messages, accept, kwargs)
+
+    cancel_primary, cancel_hedge = Cancel(), Cancel()
+    lock = threading.Lock()
+    race = {"done": False, "hedge": None, "won": None}
+    wake = threading.Event()  # 끊을 수 없는 주 모델을 기다리는 호출 스레드 깨우기
+
+    def hedge_done(f):
+        try:
+            result = f.result()
+        except Exception:
+            return  # 실패는 주 모델이 끝난 뒤 호출 스레드가 확인
+        with lock:
+            if race["done"]:
+                return
+            race["won"] = result
+        cancel_primary.set()  # 주 모델 연결을 끊어 호출 스레드를 깨운다
+        wake.set()
+
+    def launch():
+        # 마감 초과 - 대체 모델로 헤지 (비율 상한을 넘으면 주 모델을 계속 기다린다)
+        with lock:
+            if race["done"]:
+                return
+            if not _may_hedge(endpoint):
+                HEDGE_SUPPRESSED.inc(endpoint=endpoint)
+                return
+            race["hedge"] = _pool.submit(_attempt, call, fallback, messages, accept, cancel_hedge, False, kwargs)
+        race["hedge"].add_done_callback(hedge_done)
+
+    def primary_call():
+        if abortable:
+            return _attempt(call, model, messages, accept, cancel_primary, True, kwargs)
+        future = _primary_pool.submit(_attempt, call, model, messages, accept, cancel_primary, True, kwargs)
+        future.add_done_callback(lambda f: wake.set())
+        wake.wait()
+        if not future.done():
+            raise _Superseded()  # 헤지가 이겼다 - 주 모델 요청은 워커에서 마저 끝나고 결과는 버린다
+        return future.result()
+
+    timer = _timers.schedule(policy.deadline(model), launch)
+    try:
+        primary, primary_err = primary_call(), None
+    except Exception as e:
+        primary, primary_err = None, e
+    _timers.cancel(timer)
+    with lock:
+        race["done"] = True
+        hedge, won = race["hedge"], race["won"]
+    _note(endpoint, hedge is not None)
+
+    if won is not None:
+        HEDGE_CALLS.inc(endpoint=endpoint, outcome="hedge_won")
+        return won + ("hedge_won",)
+    if primary is not None:
+        if hedge is not None:
+            cancel_hedge.set()
+        outcome = "primary_won" if hedge is not None else "primary"
+        HEDGE_CALLS.inc(endpoint=endpoint, outcome=outcome)
+        return primary + (outcome,)
+    if hedge is None:
+        # 마감 전에 실패 - 대체 모델을 바로 호출
+        try:
+            result = _attempt(call, fallback, messages, accept, cancel_hedge, False, kwargs)
+            HEDGE_CALLS.inc(endpoint=endpoint, outcome="fallback")
+            return result + ("fallback",)
+        except Exception:
+            HEDGE_CALLS.inc(endpoint=endpoint, outcome="failed")
+            raise primary_err
+    try:
+        result = hedge.result()
+        HEDGE_CALLS.inc(endpoint=endpoint, outcome="hedge_won")
+        return result + ("hedge_won",)
+    except Exception as e:
+        HEDGE_CALLS.inc(endpoint=endpoint, outcome="failed")
+        # 회로 차단/예산 초과가 섞여 있으면 그것을 올려 호출부가 룰 결과로 즉시 대체하게 한다
+        raise next((x for x in (primary_err, e) if isinstance(x, (CircuitOpenError, BudgetExceeded))), primary_err)
@@ -1,14 +1,112 @@
-import os, time, json
-from typing import Dict, Any, List, Optional
+import os, time, json, socket, threading, http.client
+from urllib.parse import urlsplit
+from typing import Dict, Any, Iterator, List, Optional
 from ..utils.logger import log_jsonl
 from ..utils.costs import estimate_cost
+from ..utils.metrics import observe_llm_call, CACHE_REQUESTS, LLM_JSON_PARSE
+from ..utils.json_stream import repair_json
+from ..validators.classify import CLASSIFICATION_SCHEMA, coerce_classification
+from cachetools import TTLCache
+from ..services.prompts import PromptTemplate, get_template
+from . import budget, circuit, hedging
 
 # YouArePlan EasyTax v8 - OpenAI API 클라이언트
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 OPENAI_MODEL_CLASSIFY = os.getenv("OPENAI_MODEL_CLASSIFY", "gpt-4o-mini")
+CLASSIFY_PROMPT = os.getenv("CLASSIFY_PROMPT", "classify_entry_v1")  # prompts/templates.yaml 템플릿 이름
 OPENAI_MODEL_ANALYSIS = os.getenv("OPENAI_MODEL_ANALYSIS", "gpt-4o")
 OPENAI_MAX_TOKENS = int(os.getenv("OPENAI_MAX_TOKENS", "1000"))
 OPENAI_TEMPERATURE = float(os.getenv("OPENAI_TEMPERATURE", "0.3"))
+# OpenAI 호환 엔드포인트 (예: 로컬 mock_openai_server.py, 프록시) - 설정하면 데모 응답 대신 실제 HTTP 호출
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "").rstrip("/")
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "30"))
+CLASSIFY_CACHE_SIZE = int(os.getenv("CLASSIFY_CACHE_SIZE", "4096"))
+CLASSIFY_CACHE_TTL = float(os.getenv("CLASSIFY_CACHE_TTL", str(7 * 24 * 3600)))
+# 구조화 출력 (response_format): auto(구형 모델은 json_object, 나머지는 json_schema strict) | json_schema | json_object | off
+OPENAI_STRUCTURED_OUTPUT = os.getenv("OPENAI_STRUCTURED_OUTPUT", "auto").lower()
+# json_schema 를 지원하지 않는 모델 (auto 에서 json_object 사용)
+_LEGACY_MODEL_PREFIXES = ("gpt-3.5", "gpt-4-")
+
+class OpenAIHTTPError(RuntimeError):
+    """HTTP 오류 응답 - 재시도 판단용 상태 코드와 Retry-After(초), 오류 본문의 param"""
+
+    def __init__(self, status: int, message: str, retry_after: Optional[float] = None,
+                 param: Optional[str] = None):
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+        self.retry_after = retry_after
+        self.param = param
+
+    @classmethod
+    def from_response(cls, resp, payload: bytes) -> "OpenAIHTTPError":
+        retry_after = resp.getheader("Retry-After")
+        message, param = payload[:200].decode("utf-8", "replace"), None
+        try:
+            error = json.loads(payload).get("error") or {}
+            message, param = str(error.get("message") or message), error.get("param")
+        except (ValueError, AttributeError):
+            pass
+        return cls(resp.status, message, float(retry_after) if retry_after else None, param)
+
+# response_format 을 400 으로 거부한 모델 - 프로세스가 떠 있는 동안 보내지 않는다
+_no_structured: set = set()
+
+def _response_format(model: str, schema: Optional[dict]) -> Optional[dict]:
+    """schema → 모델에 맞는 response_format (보내지 않으면 None)"""
+    mode = OPENAI_STRUCTURED_OUTPUT
+    if schema is None or mode == "off" or model in _no_structured:
+        return None
+    if mode == "auto":
+        legacy = model == "gpt-4" or model.startswith(_LEGACY_MODEL_PREFIXES)
+        mode = "json_object" if legacy else "json_schema"
+    if mode == "json_object":
+        return {"type": "json_object"}
+    return {"type": "json_schema", "json_schema": {"name": "response", "strict": True, "schema": schema}}
+
+def _structured_rejected(model: str, kwargs: dict, e: Exception) -> bool:
+    """response_format 때문에 400 이면 빼고 다시 보낼 수 있게 kwargs 수정 후 True
+    컨텍스트 길이 초과/콘텐츠 필터 같은 다른 400 은 해당 없음 - 오류의 param 이나 메시지가 형식을 가리킬 때만"""
+    if "response_format" not in kwargs or circuit.classify_error(e)[1] != 400:
+        return False
+    param = str(getattr(e, "param", None) or "")
+    detail = f"{param} {e} {getattr(e, 'body', '') or ''}"
+    if not (param.startswith("response_format") or "response_format" in detail or "json_schema" in detail):
+        return False
+    _no_structured.add(model)
+    kwargs.pop("response_format")
+    log_jsonl({"event":"openai_structured_rejected","model":model,"error":str(e)[:200]})
+    return True
+
+def parse_json_content(content: str, model: str = "") -> Optional[dict]:
+    """LLM 응답 content → dict (깨진 JSON 은 repair_json 으로 복구) - 결과를 llm_json_parse_total 에 기록"""
+    obj, repaired = repair_json(content)
+    LLM_JSON_PARSE.inc(outcome="failed" if obj is None else "repaired" if repaired else "strict")
+    if obj is not None and repaired:
+        log_jsonl({"event":"llm_json_repaired","model":model,"content":(content or "")[:200]})
+    return obj
+
+def _demo_mode() -> bool:
+    return OPENAI_API_KEY.startswith("sk-proj-demo") and not OPENAI_BASE_URL
+
+def _demo_content(messages: List[dict]) -> str:
+    """데모 모드 응답 - 사용자 메시지에서 키워드를 기반으로 한 스마트 응답 생성"""
+    user_content = ""
+    for msg in messages:
+        if msg.get("role") == "user":
+            user_content += msg.get("content", "")
+    
+    # 한국어 세무 관련 키워드 기반 분류
+    demo_response = {
+        "account_code": "소모품비" if any(k in user_content for k in ["문구", "사무", "용품"]) else
+                       "복리후생비" if any(k in user_content for k in ["카페", "커피", "식대", "회식"]) else
+                       "통신비" if any(k in user_content for k in ["통신", "인터넷", "전화"]) else
+                       "임차료" if any(k in user_content for k in ["임대", "월세", "사무실"]) else
+                       "기타비용",
+        "tax_type": "과세",
+        "confidence": 0.85,
+        "reasoning": "데모 모드 - AI 기반 자동 분류 시뮬레이션"
+    }
+    return json.dumps(demo_response, ensure_ascii=False)
 
 def _sdk_available():
     try:
@@ -17,9 +115,22 @@ def _sdk_available():
     except Exception:
         return False
 
+def _uses_sdk() -> bool:
+    return bool(OPENAI_API_KEY or OPENAI_BASE_URL) and _sdk_available()
+
+_sdk_client = None
+
+def _get_sdk_client():
+    """SDK 클라이언트 재사용 (연결 풀 유지) - 재시도는 call_openai 가 담당하므로 SDK 자체 재시도는 끈다"""
+    global _sdk_client
+    if _sdk_client is None:
+        from openai import OpenAI
+        _sdk_client = OpenAI(api_key=OPENAI_API_KEY or "unused", base_url=OPENAI_BASE_URL or None,
+                             timeout=OPENAI_TIMEOUT, max_retries=0)
+    return _sdk_client
+
 def _call_sdk(model: str, messages: List[dict], **kwargs) -> Dict[str, Any]:
-    from openai import OpenAI
-    client = OpenAI(api_key=OPENAI_API_KEY)
+    client = _get_sdk_client()
     resp = client.chat.completions.create(model=model, messages=messages, **kwargs)
     usage = getattr(resp, "usage", None)
     usage_dict = {
@@ -31,65 +142,287 @@ def _call_sdk(model: str, messages: List[dict], **kwargs) -> Dict[str, Any]:
     return {"model": model, "messages": messages, "usage": usage_dict,
             "choices":[{"message":{"role":"assistant","content":content}}]}
 
-def call_openai(model: str, messages: list, retries: int = 2, **kwargs) -> Dict[str, Any]:
-    """OpenAI API 호출 (데모 모드 지원)"""
+_conn_local = threading.local()
+
+def _abort(conn):
+    """다른 스레드에서 진행 중인 요청 중단 - 소켓을 닫아 블록된 read 를 바로 깨운다"""
+    sock = conn.sock
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+def _call_http(model: str, messages: List[dict], cancel: Optional[threading.Event] = None,
+               **kwargs) -> Dict[str, Any]:
+    """SDK 없이 OPENAI_BASE_URL 의 /chat/completions 직접 호출 (스레드별 keep-alive 연결)
+    cancel 이 hedging.Cancel 이면 취소 즉시 연결을 끊는다 (헤지 경쟁에서 진 호출)"""
+    url = urlsplit(OPENAI_BASE_URL)
+    conn = getattr(_conn_local, "conn", None)
+    if conn is None:
+        cls = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+        conn = _conn_local.conn = cls(url.netloc, timeout=OPENAI_TIMEOUT)
+    body = json.dumps({"model": model, "messages": messages, **kwargs}, ensure_ascii=False).encode("utf-8")
+    headers = {"Content-Type": "application/json", "Authorization": f"Bearer {OPENAI_API_KEY}"}
+    unregister = cancel.on_cancel(lambda: _abort(conn)) if isinstance(cancel, hedging.Cancel) else None
+    try:
+        conn.request("POST", f"{url.path}/chat/completions", body=body, headers=headers)
+        resp = conn.getresponse()
+        payload = resp.read()
+    except Exception:
+        conn.close()
+        _conn_local.conn = None
+        raise
+    finally:
+        if unregister:
+            unregister()
+    if resp.status >= 400:
+        raise OpenAIHTTPError.from_response(resp, payload)
+    data = json.loads(payload)
+    usage = data.get("usage") or {}
+    content = (data.get("choices") or [{}])[0].get("message", {}).get("content", "")
+    return {"model": data.get("model", model), "messages": messages,
+            "usage": {k: usage.get(k, 0) for k in ("prompt_tokens", "completion_tokens", "total_tokens")},
+            "choices": [{"message": {"role": "assistant", "content": content}}]}
+
+def call_openai(model: str, messages: list, retries: int = 2, cancel: Optional[threading.Event] = None,
+                tenant: Optional[str] = None, schema: Optional[dict] = None, **kwargs) -> Dict[str, Any]:
+    """
+    OpenAI API 호출 (데모 모드 지원)
+    - cancel 이 설정되면 남은 재시도를 하지 않는다 (헤지 경쟁에서 진 호출)
+    - tenant 를 주면 예상 비용을 먼저 예약하고 실제 usage 로 정산 (한도 초과 시 budget.BudgetExceeded)
+    - schema(JSON Schema) 를 주면 구조화 출력 요청 - 모델이 거부(400)하면 빼고 바로 다시 보낸다
+    """
+    response_format = _response_format(model, schema)
+    if response_format:
+        kwargs["response_format"] = response_format
+    reservation = budget.reserve(tenant, model, messages, kwargs.get("max_tokens")) if tenant is not None else None
     # 데모용 키인 경우 시뮬레이션된 응답 반환
-    if OPENAI_API_KEY.startswith("sk-proj-demo"):
-        # 사용자 메시지에서 키워드를 기반으로 한 스마트 응답 생성
-        user_content = ""
-        for msg in messages:
-            if msg.get("role") == "user":
-                user_content += msg.get("content", "")
-        
-        # 한국어 세무 관련 키워드 기반 분류
-        demo_response = {
-            "account_code": "소모품비" if any(k in user_content for k in ["문구", "사무", "용품"]) else
-                           "복리후생비" if any(k in user_content for k in ["카페", "커피", "식대", "회식"]) else
-                           "통신비" if any(k in user_content for k in ["통신", "인터넷", "전화"]) else
-                           "임차료" if any(k in user_content for k in ["임대", "월세", "사무실"]) else
-                           "기타비용",
-            "tax_type": "과세",
-            "confidence": 0.85,
-            "reasoning": "데모 모드 - AI 기반 자동 분류 시뮬레이션"
-        }
-        
+    if _demo_mode():
         data = {
             "model": f"{model} (demo)",
             "messages": messages,
             "usage": {"prompt_tokens": 150, "completion_tokens": 50, "total_tokens": 200},
-            "choices": [{"message": {"role": "assistant", "content": json.dumps(demo_response, ensure_ascii=False)}}],
+            "choices": [{"message": {"role": "assistant", "content": _demo_content(messages)}}],
             "demo_mode": True
         }
         cost = estimate_cost(150, 50)
         log_jsonl({"event":"openai_call","model":model,"usage":data["usage"],"est_cost":cost,"demo_mode":True,"ok":True})
+        observe_llm_call(model, 0.0, True, data["usage"], cost)
+        if reservation:
+            reservation.settle(data["usage"], cost)
         data["est_cost"] = cost
         return data
     
     # 실제 API 호출
-    use_sdk = bool(OPENAI_API_KEY) and _sdk_available()
+    use_sdk = _uses_sdk()
+    remote = use_sdk or bool(OPENAI_BASE_URL)
+    breaker = circuit.breaker(model)
     last_err = None
-    for attempt in range(retries + 1):
+    started = time.perf_counter()
+    attempt = 0
+    while attempt <= retries:
+        attempt_started = time.perf_counter()
+        held = False  # before_call 로 잡은 반개방 탐색 자리 - 결과를 기록하지 못하면 finally 에서 반납
         try:
+            if cancel is not None and cancel.is_set():
+                last_err = "cancelled"
+                break
+            if remote:
+                # 회로가 열려 있으면 업스트림을 부르지 않고 즉시 실패 (호출부가 룰 결과로 대체)
+                breaker.before_call()
+                held = True
             if use_sdk:
                 data = _call_sdk(model, messages, **kwargs)
+            elif OPENAI_BASE_URL:
+                data = _call_http(model, messages, cancel=cancel, **kwargs)
             else:
                 data = {"model": model, "messages": messages,
                         "usage": {"prompt_tokens":512, "completion_tokens":128, "total_tokens":640},
                         "choices":[{"message":{"role":"assistant","content":"(stub)"}}]}
+            if remote:
+                held = False
+                breaker.record(True, time.perf_counter() - attempt_started)
             usage = data.get("usage", {})
             cost = estimate_cost(usage.get("prompt_tokens",0), usage.get("completion_tokens",0))
             log_jsonl({"event":"openai_call","model":model,"usage":usage,"est_cost":cost,"ok":True})
+            observe_llm_call(model, time.perf_counter() - started, True, usage, cost)
+            if reservation:
+                reservation.settle(usage, cost)
             data["est_cost"] = cost
             return data
+        except circuit.CircuitOpenError as e:
+            last_err = str(e)
+            log_jsonl({"event":"openai_call","model":model,"error":last_err,"ok":False,"circuit":e.reason})
+            observe_llm_call(model, time.perf_counter() - started, False)
+            if reservation:
+                reservation.release()
+            raise
         except Exception as e:
             last_err = str(e)
-            time.sleep(0.4*(attempt+1))
+            if cancel is not None and cancel.is_set():
+                last_err = "cancelled"  # 헤지 경쟁에서 져서 끊긴 호출 - 업스트림 장애가 아니므로 회로에 넣지 않는다
+                break
+            held = False
+            if _structured_rejected(model, kwargs, e):
+                # 업스트림 장애가 아니라 요청 형식 문제 - 응답은 온 것이므로 회로엔 성공, 재시도 횟수엔 넣지 않고 즉시 재전송
+                breaker.record(True, time.perf_counter() - attempt_started)
+                continue
+            retryable, status, retry_after = circuit.classify_error(e)
+            reason = str(status or type(e).__name__)
+            breaker.record(False, time.perf_counter() - attempt_started, retry_after if status == 429 else None)
+            if not retryable or attempt >= retries or breaker.state == circuit.OPEN:
+                break
+        finally:
+            if held:
+                breaker.release()
+        # 재시도 예산(LLM_RETRY_BUDGET)을 넘기는 대기는 하지 않는다 - 장애 시 꼬리 지연 상한
+        delay = circuit.backoff(attempt, retry_after)
+        if time.perf_counter() - started + delay > circuit.LLM_RETRY_BUDGET:
+            break
+        circuit.LLM_RETRIES.inc(model=model, reason=reason)
+        if cancel is not None:
+            cancel.wait(delay)
+        else:
+            time.sleep(delay)
+        attempt += 1
     log_jsonl({"event":"openai_call","model":model,"error":last_err,"ok":False})
+    observe_llm_call(model, time.perf_counter() - started, False)
+    if reservation:
+        reservation.release()
     raise RuntimeError(f"OpenAI call failed: {last_err}")
 
+def _stream_sdk(model: str, messages: List[dict], usage: dict, **kwargs) -> Iterator[str]:
+    stream = _get_sdk_client().chat.completions.create(model=model, messages=messages, stream=True,
+                                                       stream_options={"include_usage": True}, **kwargs)
+    for chunk in stream:
+        if getattr(chunk, "usage", None):
+            usage.update(prompt_tokens=chunk.usage.prompt_tokens, completion_tokens=chunk.usage.completion_tokens,
+                         total_tokens=chunk.usage.total_tokens)
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+def _stream_http(model: str, messages: List[dict], usage: dict, **kwargs) -> Iterator[str]:
+    """OPENAI_BASE_URL 로 stream=true 요청 후 SSE data 줄 파싱 (스트림마다 전용 연결)"""
+    url = urlsplit(OPENAI_BASE_URL)
+    cls = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+    conn = cls(url.netloc, timeout=OPENAI_TIMEOUT)
+    body = json.dumps({"model": model, "messages": messages, "stream": True,
+                       "stream_options": {"include_usage": True}, **kwargs}, ensure_ascii=False).encode("utf-8")
+    try:
+        conn.request("POST", f"{url.path}/chat/completions", body=body,
+                     headers={"Content-Type": "application/json", "Authorization": f"Bearer {OPENAI_API_KEY}"})
+        resp = conn.getresponse()
+        if resp.status >= 400:
+            raise OpenAIHTTPError.from_response(resp, resp.read())
+        for line in resp:
+            line = line.strip()
+            if not line.startswith(b"data:"):
+                continue
+            data = line[5:].strip()
+            if data == b"[DONE]":
+                break
+            event = json.loads(data)
+            if event.get("usage"):
+                usage.update({k: event["usage"].get(k, 0) for k in ("prompt_tokens", "completion_tokens", "total_tokens")})
+            delta = ((event.get("choices") or [{}])[0].get("delta") or {}).get("content")
+            if delta:
+                yield delta
+    finally:
+        conn.close()
+
+def stream_openai(model: str, messages: list, tenant: Optional[str] = None, schema: Optional[dict] = None,
+                  usage: Optional[Dict[str, int]] = None, **kwargs) -> Iterator[str]:
+    """
+    스트리밍 호출 - 응답 content 조각을 도착하는 대로 내보낸다
+    첫 조각을 보낸 뒤에는 재시도할 수 없으므로 재시도 없이 한 번만 보내고, 실패는 호출부가 처리한다.
+    (구조화 출력을 거부한 400 만 첫 조각 전이므로 response_format 을 빼고 한 번 다시 연다)
+    회로 차단/예산 예약은 call_openai 와 같고, 정산은 마지막 usage 청크(없으면 로컬 추정)로 한다.
+    usage dict 를 주면 스트림이 끝날 때 정산에 쓴 토큰 수를 채운다.
+    """
+    response_format = _response_format(model, schema)
+    if response_format:
+        kwargs["response_format"] = response_format
+    reservation = budget.reserve(tenant, model, messages, kwargs.get("max_tokens")) if tenant is not None else None
+    demo = _demo_mode()
+    use_sdk = not demo and _uses_sdk()
+    remote = use_sdk or (not demo and bool(OPENAI_BASE_URL))
+    breaker = circuit.breaker(model)
+    usage = usage if usage is not None else {}
+    parts: List[str] = []
+    started = time.perf_counter()
+    ok = False
+    held = False  # before_call 로 잡은 반개방 탐색 자리 - 클라이언트가 끊어 GeneratorExit 이 나도 finally 에서 반납
+    try:
+        if remote:
+            breaker.before_call()
+            held = True
+        if demo:
+            content = _demo_content(messages)
+            source = iter([content[i:i + 4] for i in range(0, len(content), 4)])
+            usage.update(prompt_tokens=150, completion_tokens=50, total_tokens=200)
+        elif remote:
+            source = (_stream_sdk if use_sdk else _stream_http)(model, messages, usage, **kwargs)
+            try:
+                first = next(source, None)
+            except Exception as e:
+                if not _structured_rejected(model, kwargs, e):
+                    raise
+                source = (_stream_sdk if use_sdk else _stream_http)(model, messages, usage, **kwargs)
+                first = next(source, None)
+            if first is not None:
+                parts.append(first)
+                yield first
+        else:
+            source = iter(["(stub)"])
+        for delta in source:
+            parts.append(delta)
+            yield delta
+        ok = True
+    except circuit.CircuitOpenError as e:
+        log_jsonl({"event":"openai_call","model":model,"error":str(e),"ok":False,"circuit":e.reason,"stream":True})
+        raise
+    except Exception as e:
+        if held:
+            held = False
+            _, status, retry_after = circuit.classify_error(e)
+            breaker.record(False, time.perf_counter() - started, retry_after if status == 429 else None)
+        log_jsonl({"event":"openai_call","model":model,"error":str(e),"ok":False,"stream":True})
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        if not usage and parts:
+            # usage 청크를 주지 않는 호환 서버 - 로컬 토큰 추정으로 정산
+            prompt = budget.estimate_prompt_tokens(messages, model)
+            completion = budget.count_tokens("".join(parts), model)
+            usage.update(prompt_tokens=prompt, completion_tokens=completion, total_tokens=prompt + completion)
+        cost = estimate_cost(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)) if usage else 0.0
+        if ok and held:
+            breaker.record(True, elapsed)
+        elif held:
+            breaker.release()
+        if ok:
+            log_jsonl({"event":"openai_call","model":model,"usage":usage,"est_cost":cost,"ok":True,"stream":True,
+                       "demo_mode":demo})
+        observe_llm_call(model, elapsed, ok, usage, cost)
+        if reservation:
+            # 중간에 끊긴 스트림도 받은 만큼은 과금된다
+            reservation.settle(usage or None, cost)
+
+def call_hedged(endpoint: str, model: str, messages: list, accept, **kwargs):
+    """헤지 + 대체 모델 체인 호출 → (응답, accept 결과, 응답한 모델, outcome) - 정책은 hedging.LLM_HEDGE_POLICY"""
+    # SDK 호출은 진행 중인 요청을 끊을 수 없다 - 헤지가 이기면 기다리지 않도록 주 모델을 워커에서 실행
+    abortable = _demo_mode() or not _uses_sdk()
+    return hedging.run(call_openai, endpoint, model, messages, accept, abortable=abortable, **kwargs)
+
+def _accept_classification(resp: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """분류 응답 → 결과 dict (구형 모델의 깨진 JSON/표기는 복구·보정) - 계정과목·세금유형이 없으면 None"""
+    content = resp["choices"][0]["message"]["content"]
+    return coerce_classification(parse_json_content(content, resp.get("model", "")))
+
 def validate_api_key() -> Dict[str, Any]:
     """OpenAI API 키 유효성 검증"""
-    if not OPENAI_API_KEY or OPENAI_API_KEY.startswith("sk-test-placeholder"):
+    if not OPENAI_BASE_URL and (not OPENAI_API_KEY or OPENAI_API_KEY.startswith("sk-test-placeholder")):
         return {
             "valid": False,
             "error": "API 키가 설정되지 않았거나 테스트 키입니다",
@@ -97,7 +430,7 @@ def validate_api_key() -> Dict[str, Any]:
         }
     
     # 데모용 테스트 키인 경우 데모 모드로 간주
-    if OPENAI_API_KEY.startswith("sk-proj-demo"):
+    if _demo_mode():
         return {
             "valid": True,
             "demo_mode": True,
@@ -105,6 +438,13 @@ def validate_api_key() -> Dict[str, Any]:
             "model": "gpt-4o-mini (demo)"
         }
     
+    if OPENAI_BASE_URL and not _sdk_available():
+        return {
+            "valid": True,
+            "base_url": OPENAI_BASE_URL,
+            "message": "OpenAI 호환 엔드포인트로 직접 HTTP 호출합니다"
+        }
+
     if not _sdk_available():
         return {
             "valid": False,
@@ -113,8 +453,7 @@ def validate_api_key() -> Dict[str, Any]:
         }
     
     try:
-        from openai import OpenAI
-        client = OpenAI(api_key=OPENAI_API_KEY)
+        client = _get_sdk_client()
         # 간단한 테스트 요청으로 API 키 검증
         response = client.chat.completions.create(
             model="gpt-4o-mini",
@@ -133,51 +472,71 @@ def validate_api_key() -> Dict[str, Any]:
             "message": "API 키가 유효하지 않거나 요청 중 오류가 발생했습니다"
         }
 
-def classify_transaction(vendor: str, amount: float, memo: str) -> Dict[str, Any]:
-    """거래 내역 AI 자동 분류"""
-    messages = [
-        {
-            "role": "system",
-            "content": """
-당신은 한국의 전문 세무사입니다. 거래 내역을 분석하여 정확한 계정과목과 세금유형을 분류해주세요.
-
-분류 기준:
-- 계정과목: 매출, 소모품비, 기타비용, 복리후생, 통신비, 임차료 등
-- 세금유형: 과세, 불공제, 영세, 면세
-- 불공제 항목: 접대비, 복리후생비 등
-
-JSON 형식으로 응답해주세요:
-{
-  "account_code": "계정과목",
-  "tax_type": "세금유형",
-  "confidence": 0.85,
-  "reasoning": "분류 근거"
-}
-"""
-        },
-        {
-            "role": "user",
-            "content": f"거래처: {vendor}, 금액: {amount:,.0f}원, 메모: {memo}"
-        }
-    ]
+def classification_messages(vendor: str, amount: float, memo: str,
+                            tpl: Optional[PromptTemplate] = None) -> List[dict]:
+    """거래 분류 프롬프트 (prompts/templates.yaml 의 classify_entry_v1)"""
+    tpl = tpl or get_template(CLASSIFY_PROMPT)
+    return tpl.messages(vendor=vendor, amount=amount or 0, memo=memo)
+
+# (테넌트, 모델, 프롬프트 버전, 입출금 구분, 거래처, 메모) → LLM 분류 결과
+# 같은 거래를 다시 묻지 않고, 예산 cached_only 단계에서는 이것만 쓴다. 테넌트를 키에 넣어
+# 다른 테넌트가 비용을 낸 결과를 가져다 쓰지 않게 하고, 금액은 부호(매출/비용)만 키에 넣는다
+_classify_cache: TTLCache = TTLCache(maxsize=CLASSIFY_CACHE_SIZE, ttl=CLASSIFY_CACHE_TTL)
+_classify_lock = threading.Lock()
+
+def _classify_key(tpl: PromptTemplate, vendor: str, amount: float, memo: str, user_id: Optional[str]) -> tuple:
+    return (user_id or "", OPENAI_MODEL_CLASSIFY, tpl.hash, (amount or 0) > 0,
+            (vendor or "").strip(), (memo or "").strip())
+
+def _cached_classification(tpl: PromptTemplate, vendor: str, amount: float, memo: str, user_id: Optional[str]):
+    """(캐시 키, 캐시된 결과) - 예산 단계가 캐시만 허용하는데 캐시가 없으면 budget.BudgetExceeded"""
+    key = _classify_key(tpl, vendor, amount, memo, user_id)
+    mode = budget.mode(user_id) if user_id is not None else budget.FULL
+    if mode != budget.RULES_ONLY:
+        with _classify_lock:
+            cached = _classify_cache.get(key)
+        CACHE_REQUESTS.inc(cache="llm_classify", result="hit" if cached else "miss")
+        if cached:
+            return key, dict(cached, cache="hit")
+    if mode in (budget.CACHED_ONLY, budget.RULES_ONLY):
+        raise budget.BudgetExceeded(user_id or "", mode)
+    return key, None
+
+def classify_transaction(vendor: str, amount: float, memo: str, endpoint: str = "classify-entry",
+                         user_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    거래 내역 AI 자동 분류 (주 모델이 느리면 대체 모델로 헤지)
+    user_id 를 주면 테넌트 예산을 적용 - 한도에 가까우면 캐시 결과만, 넘으면 budget.BudgetExceeded
+    """
+    tpl = get_template(CLASSIFY_PROMPT)
+    key, cached = _cached_classification(tpl, vendor, amount, memo, user_id)
+    if cached:
+        return cached
+    messages = classification_messages(vendor, amount, memo, tpl)
     
     try:
-        response = call_openai(OPENAI_MODEL_CLASSIFY, messages, max_tokens=200, temperature=0.1)
-        content = response["choices"][0]["message"]["content"]
-        
-        # JSON 파싱 시도
-        try:
-            result = json.loads(content)
-            return result
-        except json.JSONDecodeError:
-            # JSON 파싱 실패 시 기본값 반환
-            return {
-                "account_code": "기타비용",
-                "tax_type": "과세",
-                "confidence": 0.5,
-                "reasoning": "AI 응답 파싱 실패로 기본 분류 적용"
-            }
-            
+        response, result, model_used, outcome = call_hedged(
+            endpoint, OPENAI_MODEL_CLASSIFY, messages, _accept_classification,
+            tenant=user_id, schema=CLASSIFICATION_SCHEMA, max_tokens=200, temperature=0.1)
+        result["reasoning"] = result.get("reasoning") or result.pop("reason", "")
+        result["model_used"] = model_used
+        result["hedge"] = outcome
+        result["usage"] = response.get("usage")
+        if response.get("demo_mode"):
+            result["demo_mode"] = True
+        with _classify_lock:
+            _classify_cache[key] = dict(result)
+        return result
+    except hedging.InvalidResponse:
+        # 주/대체 모델 모두 복구해도 계정과목·세금유형이 없는 응답 - 기본값 반환
+        return {
+            "account_code": "기타비용",
+            "tax_type": "과세",
+            "confidence": 0.5,
+            "reasoning": "AI 응답 파싱 실패로 기본 분류 적용"
+        }
+    except (circuit.CircuitOpenError, budget.BudgetExceeded):
+        raise  # 호출부가 룰 기반 결과로 즉시 대체
     except Exception as e:
         # API 호출 실패 시 기본값 반환
         return {
@@ -187,6 +546,44 @@ JSON 형식으로 응답해주세요:
             "reasoning": f"AI 분류 실패: {str(e)}"
         }
 
+def classify_transaction_stream(vendor: str, amount: float, memo: str,
+                                user_id: Optional[str] = None) -> Iterator[tuple]:
+    """
+    스트리밍 분류 - json_stream.ObjectStream 이벤트를 도착하는 대로 내보낸다
+      ("field", 키, 값) / ("partial", "reasoning", 추가 글자) / 마지막에 ("result", None, 결과 dict)
+    결과가 분류로 쓸 수 없으면 ("result", None, None). 캐시 적중 시 LLM 없이 바로 필드를 내보낸다.
+    """
+    from ..utils.json_stream import ObjectStream
+
+    tpl = get_template(CLASSIFY_PROMPT)
+    key, cached = _cached_classification(tpl, vendor, amount, memo, user_id)
+    if cached:
+        for k in ("account_code", "tax_type", "confidence", "reasoning"):
+            if k in cached:
+                yield "field", k, cached[k]
+        yield "result", None, cached
+        return
+    parser = ObjectStream(partial_keys={"reasoning", "reason"})
+    parts = []
+    usage: Dict[str, int] = {}
+    for delta in stream_openai(OPENAI_MODEL_CLASSIFY, classification_messages(vendor, amount, memo, tpl),
+                               tenant=user_id, schema=CLASSIFICATION_SCHEMA, usage=usage,
+                               max_tokens=200, temperature=0.1):
+        parts.append(delta)
+        yield from parser.feed(delta)
+    # 닫는 괄호 없이 잘린 응답도 repair_json 이 완성된 필드까지 살린다
+    result = _accept_classification({"choices": [{"message": {"content": "".join(parts)}}],
+                                     "model": OPENAI_MODEL_CLASSIFY})
+    if result is not None:
+        result["reasoning"] = result.get("reasoning") or result.pop("reason", "")
+        result["model_used"] = OPENAI_MODEL_CLASSIFY
+        result["usage"] = dict(usage)
+        if _demo_mode():
+            result["demo_mode"] = True
+        with _classify_lock:
+            _classify_cache[key] = dict(result)
+    yield "result", None, result
+
 def get_api_status() -> Dict[str, Any]:
     """API 상태 정보 반환"""
     validation = validate_api_key()
@@ -196,8 +593,12 @@ def get_api_status() -> Dict[str, Any]:
         "api_key_valid": validation["valid"],
         "demo_mode": validation.get("demo_mode", False),
         "sdk_available": _sdk_available(),
+        "base_url": OPENAI_BASE_URL or None,
+        "circuits": circuit.states(),
+        "hedging": hedging.stats(),
         "models": {
             "classify": OPENAI_MODEL_CLASSIFY,
+            "fallback": hedging.OPENAI_MODEL_FALLBACK,
             "analysis": OPENAI_MODEL_ANALYSIS
         },
         "settings": {
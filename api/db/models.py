@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Integer, ForeignKey, Numeric, Text
+from sqlalchemy import Column, String, DateTime, Integer, ForeignKey, Numeric, Text, UniqueConstraint, Index, text
 from .database import Base
 import datetime, uuid
 
@@ -14,17 +14,27 @@ class User(Base):
 
 class RawFile(Base):
     __tablename__ = "raw_files"
+    # 테넌트별 중복 업로드 판정 + user_id 선행 인덱스 (테넌트 조회 비용이 전체 테넌트 수와 무관)
+    # UNIQUE(user_id, checksum) 은 user_id 가 NULL(익명 테넌트)이면 중복을 막지 못하므로 부분 유니크 인덱스를 따로 둔다
+    __table_args__ = (UniqueConstraint("user_id", "checksum", name="uq_raw_files_user_checksum"),
+                      Index("uq_raw_files_anon_checksum", "checksum", unique=True,
+                            sqlite_where=text("user_id IS NULL"), postgresql_where=text("user_id IS NULL")),
+                      Index("ix_raw_files_user_period", "user_id", "period"))
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = Column(String, ForeignKey("users.id"), nullable=True)
     period = Column(String)
     source = Column(String)
     mime = Column(String)
-    checksum = Column(String, unique=True)
+    checksum = Column(String)
     s3_uri = Column(String)
     uploaded_at = Column(DateTime, default=now)
 
 class NormalizedEntry(Base):
     __tablename__ = "normalized_entries"
+    # analytics.data_version 의 테넌트별 count/max 는 (user_id, updated_at) 인덱스만 읽는다
+    __table_args__ = (Index("ix_normalized_entries_user_date", "user_id", "trx_date"),
+                      Index("ix_normalized_entries_user_file", "user_id", "file_id"),
+                      Index("ix_normalized_entries_user_updated", "user_id", "updated_at"))
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(String, ForeignKey("users.id"), nullable=True)
     file_id = Column(String, ForeignKey("raw_files.id"), nullable=True)
@@ -35,6 +45,8 @@ class NormalizedEntry(Base):
     vat = Column(Numeric(18,2))
     memo = Column(Text)
     created_at = Column(DateTime, default=now)
+    # 금액/날짜 수정도 다른 워커의 analytics.data_version 에 잡히도록 수정 시각 갱신
+    updated_at = Column(DateTime, default=now, onupdate=now)
 
 class ClassifiedEntry(Base):
     __tablename__ = "classified_entries"
@@ -45,10 +57,12 @@ class ClassifiedEntry(Base):
     model_used = Column(Text)
     reason = Column(Text)
     flags = Column(Text)
-    updated_at = Column(DateTime, default=now)
+    # 재분류도 analytics.data_version 에 잡히도록 수정 시각 갱신
+    updated_at = Column(DateTime, default=now, onupdate=now)
 
 class PrepItem(Base):
     __tablename__ = "prep_items"
+    __table_args__ = (Index("ix_prep_items_user_period_type", "user_id", "period", "type"),)
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(String, nullable=True)
     period = Column(String)
@@ -57,3 +71,29 @@ class PrepItem(Base):
     status = Column(String)
     fix_hint = Column(Text)
     updated_at = Column(DateTime, default=now)
+
+class Vendor(Base):
+    __tablename__ = "vendors"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(Text, unique=True, index=True)  # 정규화된 대표 거래처명
+    created_at = Column(DateTime, default=now)
+
+class VendorAlias(Base):
+    __tablename__ = "vendor_aliases"
+    raw_name = Column(Text, primary_key=True)  # 원본 거래처 문자열
+    vendor_id = Column(Integer, ForeignKey("vendors.id"), index=True)
+    created_at = Column(DateTime, default=now)
+
+class ClassificationMemory(Base):
+    __tablename__ = "classification_memory"
+    # corrections.CorrectionMemory 의 테넌트 버전(count/max updated_at) 은 (user_id, updated_at) 인덱스만 읽는다
+    __table_args__ = (UniqueConstraint("user_id", "vendor_canonical", "memo_signature", name="uq_classification_memory_key"),
+                      Index("ix_classification_memory_user_updated", "user_id", "updated_at"))
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(String, nullable=False, default="")  # 익명 테넌트는 ""
+    vendor_canonical = Column(Text, nullable=False)
+    memo_signature = Column(Text, nullable=False, default="")
+    account_code = Column(Text)
+    tax_type = Column(Text)
+    hits = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=now, onupdate=now)
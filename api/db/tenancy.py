@@ -0,0 +1,86 @@
+"""
+테넌트(user_id) 범위 쿼리 헬퍼
+
+모든 조회는 tenant_filter / scoped 를 거쳐 요청한 사용자의 행만 읽는다.
+user_id 가 없는 요청(로그인 전/단일 사용자 설치)은 익명 테넌트("")로 보고 user_id IS NULL 행을 쓴다.
+"""
+
+from sqlalchemy.orm import Session, Query
+from sqlalchemy.exc import IntegrityError
+from .models import User
+from typing import Dict, Optional
+import threading
+
+ANONYMOUS = ""
+
+_known_users = set()
+_known_lock = threading.Lock()
+
+def stamp(user_id: Optional[str]) -> Optional[str]:
+    """DB 에 기록할 user_id 값 (익명 테넌트는 NULL)"""
+    return user_id or None
+
+def tenant_filter(model, user_id: Optional[str]):
+    """model.user_id 기준 테넌트 조건"""
+    if user_id:
+        return model.user_id == user_id
+    return model.user_id.is_(None)
+
+def scoped(q: Query, model, user_id: Optional[str]) -> Query:
+    return q.filter(tenant_filter(model, user_id))
+
+def ensure_user(db: Session, user_id: Optional[str]) -> Optional[str]:
+    """users 행이 없으면 생성 (FK 대상) - 프로세스 내에서 한 번 확인한 id 는 다시 조회하지 않는다"""
+    if not user_id:
+        return None
+    with _known_lock:
+        if user_id in _known_users:
+            return user_id
+    if db.get(User, user_id) is None:
+        try:
+            with db.begin_nested():
+                db.add(User(id=user_id))
+        except IntegrityError:
+            pass  # 다른 요청이 동시에 생성
+        db.commit()
+    with _known_lock:
+        _known_users.add(user_id)
+    return user_id
+
+def forget_users():
+    """ensure_user 의 확인 캐시 비우기 - users 행을 지운 뒤 호출해야 다음 요청에서 다시 생성된다"""
+    with _known_lock:
+        _known_users.clear()
+
+class TenantVersions:
+    """테넌트별 로컬 데이터 버전 + 재적재 잠금
+
+    인메모리 파생 데이터(분석 컬럼 스토어, kNN 색인 등)를 테넌트 단위로 무효화하고,
+    한 테넌트의 재적재가 다른 테넌트 요청을 막지 않도록 잠금도 테넌트마다 따로 둔다.
+    """
+
+    def __init__(self):
+        self._versions: Dict[str, int] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._epoch = 0  # 전체 무효화
+        self._lock = threading.Lock()
+
+    def get(self, user_id: Optional[str]) -> tuple:
+        return (self._epoch, self._versions.get(user_id or ANONYMOUS, 0))
+
+    def bump(self, user_id: Optional[str] = None):
+        """user_id 가 None 이면 모든 테넌트 무효화"""
+        with self._lock:
+            if user_id is None:
+                self._epoch += 1
+            else:
+                key = user_id or ANONYMOUS
+                self._versions[key] = self._versions.get(key, 0) + 1
+
+    def lock(self, user_id: Optional[str]) -> threading.Lock:
+        key = user_id or ANONYMOUS
+        with self._lock:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.Lock()
+        return lock
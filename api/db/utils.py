@@ -1,4 +1,107 @@
+from sqlalchemy import inspect, text, MetaData
+from sqlalchemy.schema import AddConstraint, CreateTable
 from .database import engine, Base
+import os, logging
+
+logger = logging.getLogger(__name__)
+
+# PostgreSQL 전용: normalized_entries 를 user_id 해시 파티션으로 생성 (0 이면 일반 테이블)
+TENANT_PARTITIONS = int(os.getenv("TENANT_PARTITIONS", "0"))
+
+def _create_partitioned_entries(conn, partitions: int):
+    """normalized_entries 를 PARTITION BY HASH (user_id) 로 생성 - 테이블이 없을 때만
+
+    파티션 테이블의 PK/UNIQUE 는 파티션 키를 포함해야 하므로 id 에는 일반 인덱스만 둔다.
+    """
+    conn.execute(text("""
+        CREATE TABLE normalized_entries (
+            id BIGSERIAL NOT NULL,
+            user_id VARCHAR REFERENCES users(id),
+            file_id VARCHAR REFERENCES raw_files(id),
+            raw_line INTEGER,
+            trx_date VARCHAR,
+            vendor TEXT,
+            amount NUMERIC(18, 2),
+            vat NUMERIC(18, 2),
+            memo TEXT,
+            created_at TIMESTAMP WITHOUT TIME ZONE,
+            updated_at TIMESTAMP WITHOUT TIME ZONE
+        ) PARTITION BY HASH (user_id)
+    """))
+    for i in range(partitions):
+        conn.execute(text(f"CREATE TABLE normalized_entries_p{i} PARTITION OF normalized_entries "
+                          f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {i})"))
+    conn.execute(text("CREATE INDEX ix_normalized_entries_id ON normalized_entries (id)"))
+    logger.info(f"normalized_entries 해시 파티션 생성: {partitions}개")
+
+# 체크섬 전역 UNIQUE 가 남아 있는 기존 DB (마이그레이션 실패) - 업로드 중복 검사를 전역으로 유지해야 한다
+LEGACY_GLOBAL_CHECKSUM = False
+
+def _legacy_checksum_constraints(conn) -> list:
+    """raw_files 의 checksum 단독 UNIQUE 제약 (이전 스키마의 전역 중복 판정) 목록"""
+    return [uc for uc in inspect(conn).get_unique_constraints("raw_files")
+            if uc["column_names"] == ["checksum"]]
+
+def _migrate_raw_files_unique(engine):
+    """raw_files 중복 판정을 전역 checksum → (user_id, checksum) 으로 변경
+
+    SQLite 는 제약을 지울 수 없어 테이블을 새 스키마로 다시 만들어 복사한다 (인덱스는 init_db 가 다시 만든다).
+    그 외(PostgreSQL)는 이전 제약을 지우고 새 제약을 추가한다.
+    """
+    global LEGACY_GLOBAL_CHECKSUM
+    try:
+        with engine.begin() as conn:
+            legacy = _legacy_checksum_constraints(conn)
+            if not legacy:
+                return
+            table = Base.metadata.tables["raw_files"]
+            if conn.dialect.name == "sqlite":
+                meta = MetaData()
+                Base.metadata.tables["users"].to_metadata(meta)  # FK 대상
+                rebuilt = table.to_metadata(meta, name="raw_files_new")
+                cols = ", ".join(c.name for c in table.columns)
+                conn.execute(CreateTable(rebuilt))
+                conn.execute(text(f"INSERT INTO raw_files_new ({cols}) SELECT {cols} FROM raw_files"))
+                conn.execute(text("DROP TABLE raw_files"))
+                conn.execute(text("ALTER TABLE raw_files_new RENAME TO raw_files"))
+            else:
+                for uc in legacy:
+                    conn.execute(text(f'ALTER TABLE raw_files DROP CONSTRAINT "{uc["name"]}"'))
+                if not any(uc["name"] == "uq_raw_files_user_checksum"
+                           for uc in inspect(conn).get_unique_constraints("raw_files")):
+                    conn.execute(AddConstraint(next(c for c in table.constraints
+                                                    if c.name == "uq_raw_files_user_checksum")))
+        logger.info("raw_files 마이그레이션: checksum 전역 UNIQUE → (user_id, checksum)")
+        LEGACY_GLOBAL_CHECKSUM = False
+    except Exception as e:
+        logger.error(f"raw_files 마이그레이션 실패 - 업로드 중복 검사를 전역으로 유지: {e}")
+        LEGACY_GLOBAL_CHECKSUM = True
+
+def _add_missing_columns(engine):
+    """기존 테이블에 나중에 추가된 nullable 컬럼 생성 (create_all 은 이미 있는 테이블을 건드리지 않는다)"""
+    with engine.begin() as conn:
+        insp = inspect(conn)
+        for table in Base.metadata.sorted_tables:
+            if not insp.has_table(table.name):
+                continue
+            existing = {c["name"] for c in insp.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable and not column.primary_key:
+                    col_type = column.type.compile(dialect=conn.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'))
+                    logger.info(f"{table.name}.{column.name} 컬럼 추가")
 
 def init_db():
+    if TENANT_PARTITIONS > 0 and engine.dialect.name == "postgresql" \
+            and not inspect(engine).has_table("normalized_entries"):
+        tables = Base.metadata.tables
+        Base.metadata.create_all(bind=engine, tables=[tables["users"], tables["raw_files"]])
+        with engine.begin() as conn:
+            _create_partitioned_entries(conn, TENANT_PARTITIONS)
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns(engine)
+    _migrate_raw_files_unique(engine)
+    # 기존 DB 에도 새로 추가된 인덱스 생성 (create_all 은 이미 있는 테이블을 건드리지 않는다)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
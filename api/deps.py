@@ -4,7 +4,9 @@ Database dependency 안전가드
 
 from sqlalchemy.orm import Session
 from .db.database import SessionLocal
-from fastapi import Depends
+from .db.tenancy import ANONYMOUS
+from fastapi import Depends, Header, Query
+from typing import Optional
 import logging
 
 logger = logging.getLogger(__name__)
@@ -22,4 +24,14 @@ def get_db() -> Session:
         raise
     finally:
         if db:
-            db.close()
\ No newline at end of file
+            db.close()
+
+# 테넌트 식별 헤더 (인증 프록시가 설정) - 없으면 기존 user_id 쿼리 파라미터, 둘 다 없으면 익명 테넌트
+USER_ID_HEADER = "X-User-Id"
+
+def get_user_id(
+    x_user_id: Optional[str] = Header(None, alias=USER_ID_HEADER, max_length=64),
+    user_id: Optional[str] = Query(None, max_length=64, description="사용자(테넌트) ID")
+) -> str:
+    """요청 테넌트 ID 의존성 - 모든 조회는 이 값으로 범위가 제한된다"""
+    return (x_user_id or user_id or ANONYMOUS).strip()
@@ -2,9 +2,14 @@ from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse, FileResponse
+from fastapi.responses import RedirectResponse, FileResponse, PlainTextResponse
 from .routers import ai, ingest, tax, prep, entries, debug
 from .db.utils import init_db
+from .services.search import ensure_search_index
+from .services.vendors import load_aliases
+from .db.database import engine, SessionLocal
+from .utils.logger import shutdown_logs, log_stats
+from .utils import metrics
 import time
 from cachetools import TTLCache
 import os
@@ -61,9 +66,61 @@ async def add_cache_and_security_headers(request: Request, call_next):
     
     return response
 
+def _route_template(request: Request) -> str:
+    """매칭된 라우트의 경로 템플릿 (/entries/direct/{entry_id} 형태)"""
+    route = request.scope.get("route")
+    template = getattr(route, "path", None)
+    if not template:
+        return "unmatched"
+    regex = getattr(route, "path_regex", None)
+    path = request.url.path
+    if regex is not None and not regex.match(path):
+        # FastAPI 버전에 따라 include_router 의 prefix 가 빠진 원본 라우트가 들어오므로 보정
+        for i in range(1, len(path)):
+            if path[i] == "/" and regex.match(path[i:]):
+                return path[:i] + template
+    return template
+
+# 요청 메트릭 (라우트 템플릿 기준 지연시간 히스토그램, 처리 중 요청 수)
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    if not metrics.METRICS_ENABLED:
+        return await call_next(request)
+    metrics.HTTP_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.HTTP_IN_FLIGHT.dec()
+        template = _route_template(request)
+        metrics.HTTP_LATENCY.observe(time.perf_counter() - start, route=template, method=request.method)
+        metrics.HTTP_REQUESTS.inc(route=template, method=request.method, status=status)
+
+metrics.register_db_pool(engine)
+metrics.register_log_writer(log_stats)
+
 @app.on_event("startup")
 def _startup():
     init_db()
+    ensure_search_index(engine)
+    db = SessionLocal()
+    try:
+        load_aliases(db, force=True)
+    finally:
+        db.close()
+
+@app.on_event("shutdown")
+def _shutdown():
+    # 큐에 남은 JSONL 로그를 모두 기록한 뒤 종료
+    shutdown_logs()
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    """Prometheus 텍스트 포맷 메트릭"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 @app.get("/health", include_in_schema=False)
 def health():
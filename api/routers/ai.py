@@ -1,6 +1,13 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from typing import List, Optional, Literal, Dict, Any
+from sqlalchemy.orm import Session
+from typing import Iterator, List, Optional, Literal, Dict, Any
+import os, json, re
+from ..clients import budget
+from ..clients.circuit import CircuitOpenError
+from ..deps import get_db, get_user_id
+from ..services.rulesets import current_ruleset
 
 router = APIRouter()
 
@@ -31,49 +38,100 @@ class ClassifyInput(RequestBase):
 class ClassifyOutput(ResponseBase):
     data: Dict[str, Any]
 
+CLASSIFY_BATCH_MAX = int(os.getenv("CLASSIFY_BATCH_MAX", "1000"))
+
+class BatchItem(BaseModel):
+    text_context: Optional[str] = None
+    vendor: Optional[str] = None
+    amount: float = 0
+    memo: Optional[str] = None
+
+class ClassifyBatchInput(RequestBase):
+    items: List[BatchItem] = Field(..., max_length=CLASSIFY_BATCH_MAX)
+    use_llm: bool = True
+
+class ClassifyBatchOutput(BaseModel):
+    context_id: Optional[str] = None
+    ok: bool = True
+    count: int = 0
+    unique: int = 0
+    paths: Dict[str, int] = {}
+    tokens: Tokens = Tokens()
+    items: List[Dict[str, Any]] = []
+
+def _parse_text_context(text: str):
+    """텍스트에서 거래처, 금액, 메모 추출 시도 → (거래처, 금액, 메모)"""
+    vendor = "추정거래처"
+    amount = 0
+    memo = text
+    
+    # 간단한 파싱 로직
+    if "원" in text:
+        amount_match = re.search(r'([\d,]+)원', text)
+        if amount_match:
+            amount = int(amount_match.group(1).replace(',', ''))
+    
+    if "거래처:" in text:
+        parts = text.split("거래처:")
+        if len(parts) > 1:
+            vendor = parts[1].split()[0]
+    return vendor, amount, memo
+
+def _rules_fallback(vendor: str, memo: str, e: Exception, tenant: str):
+    """LLM 을 쓸 수 없을 때 룰셋 분류 결과 → (data, model_used)"""
+    ruleset = current_ruleset()
+    pred = ruleset.classify(vendor, memo)
+    if isinstance(e, CircuitOpenError):
+        note, flag = f"LLM 차단(장애 감지, {e.retry_in:.0f}초 후 재시도)", "LLM_차단"
+    elif isinstance(e, budget.BudgetExceeded):
+        budget.degraded("classify_entry", tenant)
+        note, flag = f"LLM 생략(예산 {e.mode})", "예산_제한"
+    else:
+        note, flag = f"LLM 오류: {e}", "LLM_오류"
+    result = {
+        "account_code": pred["account_code"],
+        "tax_type": pred["tax_type"],
+        "confidence": pred["confidence"],
+        "reason": f"{pred['reason']} | {note}",
+        "rule_flags": [flag],
+        "demo_mode": False
+    }
+    return result, ruleset.tag
+
 @router.post("/classify-entry", response_model=ClassifyOutput)
-def classify_entry(body: ClassifyInput):
+def classify_entry(body: ClassifyInput, user_id: str = Depends(get_user_id)):
     """거래 내역 AI 자동 분류 (데모 모드 지원)"""
+    tenant = user_id or (body.user_id or "").strip()
     if body.use_llm:
+        vendor, amount, memo = _parse_text_context(body.text_context)
         try:
-            from ..clients.openai_client import call_openai, classify_transaction
-            
-            # 텍스트에서 거래처, 금액, 메모 추출 시도
-            text = body.text_context
-            vendor = "추정거래처"
-            amount = 0
-            memo = text
-            
-            # 간단한 파싱 로직
-            if "원" in text:
-                import re
-                amount_match = re.search(r'([\d,]+)원', text)
-                if amount_match:
-                    amount = int(amount_match.group(1).replace(',', ''))
-            
-            if "거래처:" in text:
-                parts = text.split("거래처:")
-                if len(parts) > 1:
-                    vendor = parts[1].split()[0]
+            from ..clients.openai_client import classify_transaction
             
             # OpenAI 클라이언트의 classify_transaction 사용
-            classification = classify_transaction(vendor, amount, memo)
+            classification = classify_transaction(vendor, amount, memo, user_id=tenant)
             
             result = {
                 "account_code": classification["account_code"],
                 "tax_type": classification["tax_type"], 
                 "confidence": classification["confidence"],
                 "reason": classification["reasoning"],
-                "rule_flags": ["AI_분류"],
+                "rule_flags": ["AI_분류"] + (["LLM_헤지"] if classification.get("hedge") == "hedge_won" else []),
                 "demo_mode": classification.get("demo_mode", False)
             }
+            model_used = classification.get("model_used", "gpt-4o-mini")
             
             return ClassifyOutput(
                 context_id=body.context_id,
                 data=result,
-                model_used="gpt-4o-mini (demo)" if result.get("demo_mode") else "gpt-4o-mini",
-                tokens=Tokens(input=150, output=50, cache="none")
+                model_used=f"{model_used} (demo)" if result.get("demo_mode") else model_used,
+                tokens=Tokens(input=0, output=0, cache="hit") if classification.get("cache") == "hit"
+                       else Tokens(input=(classification.get("usage") or {}).get("prompt_tokens", 150),
+                                   output=(classification.get("usage") or {}).get("completion_tokens", 50), cache="miss")
             )
+        except (CircuitOpenError, budget.BudgetExceeded) as e:
+            # LLM 업스트림 장애 또는 테넌트 예산 한도 - 기다리지 않고 룰셋 분류 결과 반환
+            result, model_used = _rules_fallback(vendor, memo, e, tenant)
+            return ClassifyOutput(context_id=body.context_id, data=result, model_used=model_used)
         except Exception as e:
             # 오류 발생 시 기본값 반환
             result = {
@@ -91,3 +149,102 @@ def classify_entry(body: ClassifyInput):
               "reason":"키워드 기반 규칙 매칭","rule_flags":["복리후생_키워드매칭"]}
     return ClassifyOutput(context_id=body.context_id, data=result, model_used="rule-based",
                           tokens=Tokens(input=0, output=0, cache="hit"))
+
+@router.post("/classify-batch", response_model=ClassifyBatchOutput)
+def classify_batch(body: ClassifyBatchInput, db: Session = Depends(get_db), user_id: str = Depends(get_user_id)):
+    """
+    거래 여러 건 일괄 분류 - 요청 한 번에 최대 CLASSIFY_BATCH_MAX 건
+    같은 거래는 한 번만 분류하고 룰/학습/kNN 으로 확정되지 않은 건만 LLM 에 동시에 보낸다.
+    항목마다 path(memory/rules/knn/cache/llm/dedup), model_used, tokens 를 입력 순서대로 반환.
+    """
+    from ..services.classification import classify_batch as _classify_batch
+
+    tenant = user_id or (body.user_id or "").strip()
+    parsed = []
+    for item in body.items:
+        if item.vendor is not None or item.memo is not None:
+            parsed.append((item.vendor or "", item.amount, item.memo or ""))
+        else:
+            parsed.append(_parse_text_context(item.text_context or ""))
+    results = _classify_batch(db, tenant, parsed, use_llm=body.use_llm)
+    paths: Dict[str, int] = {}
+    for r in results:
+        paths[r["path"]] = paths.get(r["path"], 0) + 1
+    return ClassifyBatchOutput(
+        context_id=body.context_id, count=len(results), unique=len(results) - paths.get("dedup", 0), paths=paths,
+        tokens=Tokens(input=sum(r["tokens"]["input"] for r in results),
+                      output=sum(r["tokens"]["output"] for r in results),
+                      cache="miss" if paths.get("llm") else "hit" if paths.get("cache") else "none"),
+        items=results)
+
+def _sse(event: str, data: Dict[str, Any]) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+def _classify_events(body: ClassifyInput, tenant: str) -> Iterator[bytes]:
+    from ..clients.openai_client import classify_transaction_stream
+
+    vendor, amount, memo = _parse_text_context(body.text_context)
+    sent: Dict[str, Any] = {}
+    try:
+        for kind, key, value in classify_transaction_stream(vendor, amount, memo, user_id=tenant):
+            if kind == "field" and key in ("account_code", "tax_type", "confidence") and key not in sent:
+                sent[key] = value
+                yield _sse("field", {"key": key, "value": value})
+            elif kind == "partial" or (kind == "field" and key in ("reasoning", "reason") and key not in sent):
+                # 조각으로 이미 보낸 근거는 완성 필드로 다시 보내지 않는다 (캐시 적중은 한 번에)
+                sent[key] = True
+                yield _sse("reasoning", {"delta": value})
+            elif kind == "result":
+                if value is None:
+                    raise ValueError("AI 응답 파싱 실패")
+                data = {
+                    "account_code": value["account_code"],
+                    "tax_type": value["tax_type"],
+                    "confidence": value.get("confidence"),
+                    "reason": value.get("reasoning", ""),
+                    "rule_flags": ["AI_분류"],
+                    "demo_mode": value.get("demo_mode", False)
+                }
+                cache = "hit" if value.get("cache") == "hit" else "miss"
+                usage = value.get("usage") or {}
+                yield _sse("done", ClassifyOutput(
+                    context_id=body.context_id, data=data,
+                    model_used=value.get("model_used", "gpt-4o-mini") + (" (demo)" if data["demo_mode"] else ""),
+                    tokens=Tokens(cache=cache) if cache == "hit"
+                           else Tokens(input=usage.get("prompt_tokens", 0), output=usage.get("completion_tokens", 0),
+                                       cache=cache)
+                ).model_dump())
+    except Exception as e:
+        # 아직 확정 필드를 보내기 전이면 룰 결과로 대체, 이미 일부를 보냈으면 오류만 알린다
+        if sent.keys() & {"account_code", "tax_type"}:
+            yield _sse("error", {"message": str(e)})
+            return
+        data, model_used = _rules_fallback(vendor, memo, e, tenant)
+        for key in ("account_code", "tax_type", "confidence"):
+            yield _sse("field", {"key": key, "value": data[key]})
+        yield _sse("done", ClassifyOutput(context_id=body.context_id, data=data, model_used=model_used).model_dump())
+
+@router.post("/classify-entry/stream")
+def classify_entry_stream(body: ClassifyInput, user_id: str = Depends(get_user_id)):
+    """
+    거래 분류 SSE 스트리밍 (항상 LLM 경로, use_llm 무시)
+    event: field     {"key": "account_code"|"tax_type"|"confidence", "value": ...} - 값이 완성되는 즉시
+    event: reasoning {"delta": "..."} - 분류 근거를 받는 대로
+    event: done      /classify-entry 와 같은 응답 본문
+    event: error     {"message": "..."} - 필드를 일부 보낸 뒤 실패한 경우
+    """
+    tenant = user_id or (body.user_id or "").strip()
+    return StreamingResponse(_classify_events(body, tenant), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.get("/budget")
+def budget_status(user_id: str = Depends(get_user_id)):
+    """테넌트 오늘의 LLM 예산 사용량과 현재 단계 (full/deferred/cached_only/rules_only)"""
+    return {"ok": True, **budget.status(user_id)}
+
+@router.post("/refine-deferred")
+def refine_deferred(limit: int = Query(100, ge=1, le=1000), db: Session = Depends(get_db),
+                    user_id: str = Depends(get_user_id)):
+    """예산 때문에 LLM 보정을 미룬 분류 행을 다시 보정 (예산이 회복된 뒤 호출)"""
+    from ..services.classification import refine_deferred as _refine
+    return {"ok": True, **_refine(db, user_id, limit)}
@@ -5,7 +5,12 @@
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 from ..deps import get_db
-from ..db.models import User, RawFile, NormalizedEntry, ClassifiedEntry, PrepItem
+from ..db.models import (User, RawFile, NormalizedEntry, ClassifiedEntry, PrepItem,
+                         Vendor, VendorAlias, ClassificationMemory)
+from ..db.tenancy import forget_users
+from ..services import analytics, checklist, neighbors
+from ..services.corrections import MEMORY
+from ..services.vendors import load_aliases
 from ..schemas import BaseResponse
 import logging, os, sys, platform
 from datetime import datetime
@@ -97,6 +102,31 @@ def list_endpoints():
         message=f"{len(routes)}개 엔드포인트 등록됨"
     )
 
+@router.get("/rulesets", response_model=BaseResponse)
+def list_rulesets(reload: bool = False):
+    """로드된 룰셋 버전 목록 (reload=true 면 파일 변경 즉시 확인)"""
+    from ..services.rulesets import REGISTRY
+
+    if reload:
+        REGISTRY.reload()
+    current = REGISTRY.current()
+    return BaseResponse(
+        data={
+            "active": current.version,
+            "tag": current.tag,
+            "versions": REGISTRY.versions()
+        },
+        message=f"활성 룰셋 v{current.version}"
+    )
+
+@router.get("/prompts", response_model=BaseResponse)
+def list_prompts():
+    """로드된 프롬프트 템플릿과 내용 해시"""
+    from ..services.prompts import REGISTRY
+
+    versions = REGISTRY.versions()
+    return BaseResponse(data=versions, message=f"{len(versions)}개 프롬프트 템플릿")
+
 @router.get("/sample-data", response_model=BaseResponse)  
 def generate_sample_data(db: Session = Depends(get_db)):
     """샘플 데이터 생성 (개발용)"""
@@ -186,10 +216,21 @@ def clear_all_data(db: Session = Depends(get_db)):
         db.query(PrepItem).delete()
         db.query(NormalizedEntry).delete()
         db.query(RawFile).delete()
+        db.query(ClassificationMemory).delete()
+        db.query(VendorAlias).delete()
+        db.query(Vendor).delete()
         db.query(User).delete()
         
         db.commit()
         
+        # 지운 데이터를 들고 있는 프로세스 내 캐시도 비운다 (users 확인 캐시가 남으면 사용자 행이 다시 생성되지 않음)
+        forget_users()
+        MEMORY.invalidate()
+        analytics.invalidate()
+        neighbors.invalidate()
+        checklist.invalidate()
+        load_aliases(db, force=True)
+        
         return BaseResponse(
             data={"cleared": True},
             message="모든 데이터가 삭제되었습니다"
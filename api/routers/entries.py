@@ -1,35 +1,63 @@
-from fastapi import APIRouter, Query, Depends, HTTPException, Path
+from fastapi import APIRouter, Body, Query, Depends, HTTPException, Path
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import Optional
-from ..deps import get_db
+from sqlalchemy import func
+from typing import Optional, Iterator
+from ..deps import get_db, get_user_id
+from ..db.tenancy import tenant_filter, stamp, ensure_user
+from ..db.database import SessionLocal
 from ..db.models import NormalizedEntry, ClassifiedEntry
+from ..services import analytics, search, neighbors
+from ..services.corrections import MEMORY
+from ..services.classification import vendor_index
 from ..schemas import (
     EntriesListResponse, EntryResponse, BaseResponse,
     DirectEntryRequest, DirectEntryUpdate, DirectEntryResponse,
-    TaxCalculationResponse
+    TaxCalculationResponse, ClassificationUpdate
 )
 from decimal import Decimal
 from datetime import datetime
-import logging
+import csv, io, json, logging, os
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# 내보내기 시 서버 측 커서에서 한 번에 가져올 행 수
+EXPORT_YIELD_PER = int(os.getenv("EXPORT_YIELD_PER", "2000"))
+EXPORT_COLUMNS = ["id", "trx_date", "vendor", "amount", "vat", "memo", "account_code", "tax_type"]
+
+# /list 정렬 옵션 (금액은 수입/지출 구분 없이 절대값 기준)
+SORT_OPTIONS = {
+    "date_desc": (NormalizedEntry.trx_date.desc(), NormalizedEntry.id.desc()),
+    "date_asc": (NormalizedEntry.trx_date.asc(), NormalizedEntry.id.asc()),
+    "amount_desc": (func.abs(NormalizedEntry.amount).desc(), NormalizedEntry.id.desc()),
+    "amount_asc": (func.abs(NormalizedEntry.amount).asc(), NormalizedEntry.id.asc()),
+    "vendor_asc": (NormalizedEntry.vendor.asc(), NormalizedEntry.id.asc()),
+    "vendor_desc": (NormalizedEntry.vendor.desc(), NormalizedEntry.id.desc()),
+}
+
 @router.get("/list", response_model=EntriesListResponse)
 def list_entries(
     period: Optional[str] = Query(None, description="기간 필터 (YYYY-MM)"),
     page: int = Query(1, ge=1, description="페이지 번호"),
     per_page: int = Query(50, ge=1, le=200, description="페이지당 항목 수"),
+    q_text: Optional[str] = Query(None, alias="q", max_length=200, description="거래처/메모 검색어 (공백 구분 AND)"),
+    sort: Optional[str] = Query(None, description="정렬 (date_desc, date_asc, amount_desc, amount_asc, vendor_asc, vendor_desc)"),
+    transaction_type: Optional[str] = Query(None, alias="type", description="거래 유형 (income/expense)"),
+    user_id: str = Depends(get_user_id),
     db: Session = Depends(get_db)
 ):
     """가계부 목록 조회 - 방어코딩 적용"""
     try:
+        if sort and sort not in SORT_OPTIONS:
+            raise HTTPException(status_code=400, detail=f"지원하지 않는 정렬입니다: {sort}")
+        
         # 베이스 쿼리 구성
         q = db.query(NormalizedEntry, ClassifiedEntry).join(
             ClassifiedEntry, 
             ClassifiedEntry.entry_id == NormalizedEntry.id, 
             isouter=True
-        )
+        ).filter(tenant_filter(NormalizedEntry, user_id))
         
         # 기간 필터링
         if period:
@@ -37,10 +65,23 @@ def list_entries(
                 raise HTTPException(status_code=400, detail="기간은 최소 YYYY 형식이어야 합니다")
             q = q.filter(NormalizedEntry.trx_date.like(f"{period}%"))
         
+        # 거래 유형 필터링
+        if transaction_type == 'income':
+            q = q.filter(NormalizedEntry.amount > 0)
+        elif transaction_type == 'expense':
+            q = q.filter(NormalizedEntry.amount <= 0)
+        
+        # 서버 측 검색 (테넌트별 bigram 색인, PostgreSQL 은 3글자 이상 pg_trgm)
+        if q_text:
+            cond = search.search_filter(db, q_text, user_id)
+            if cond is not None:
+                q = q.filter(cond)
+        
         # 전체 개수 계산
         total = q.count()
         
-        # 페이지네이션
+        # 정렬 및 페이지네이션
+        q = q.order_by(*SORT_OPTIONS.get(sort, (NormalizedEntry.id.asc(),)))
         offset = (page - 1) * per_page
         results = q.offset(offset).limit(per_page).all()
         
@@ -80,27 +121,21 @@ def list_entries(
 @router.get("/summary")
 def get_summary(
     period: Optional[str] = Query(None, description="기간 필터 (YYYY-MM)"),
+    user_id: str = Depends(get_user_id),
     db: Session = Depends(get_db)
 ):
     """가계부 요약 정보"""
     try:
-        q = db.query(NormalizedEntry)
+        if period and len(period) < 4:
+            raise HTTPException(status_code=400, detail="기간은 최소 YYYY 형식이어야 합니다")
         
-        if period:
-            if len(period) < 4:
-                raise HTTPException(status_code=400, detail="기간은 최소 YYYY 형식이어야 합니다")
-            q = q.filter(NormalizedEntry.trx_date.like(f"{period}%"))
-        
-        entries = q.all()
-        
-        total_amount = sum(float(e.amount or 0) for e in entries)
-        total_vat = sum(float(e.vat or 0) for e in entries)
+        totals = analytics.totals(db, metrics=["amount", "vat", "count"], user_id=user_id, period=period)
         
         return BaseResponse(
             data={
-                "total_amount": total_amount,
-                "total_vat": total_vat,
-                "entry_count": len(entries),
+                "total_amount": totals["amount"],
+                "total_vat": totals["vat"],
+                "entry_count": totals["count"],
                 "period": period or "전체"
             },
             message="요약 정보 조회 완료"
@@ -112,16 +147,96 @@ def get_summary(
         logger.error(f"요약 정보 조회 오류: {e}")
         raise HTTPException(status_code=500, detail="요약 정보 조회 중 오류가 발생했습니다")
 
+def _iter_export_rows(period: Optional[str], user_id: str) -> Iterator[dict]:
+    """서버 측 커서로 엔트리를 한 행씩 흘려보냄 (결과 전체를 메모리에 올리지 않음)"""
+    # 응답 스트리밍이 끝날 때까지 살아 있어야 하므로 요청 세션과 별도로 연다
+    db = SessionLocal()
+    try:
+        q = db.query(
+            NormalizedEntry.id, NormalizedEntry.trx_date, NormalizedEntry.vendor,
+            NormalizedEntry.amount, NormalizedEntry.vat, NormalizedEntry.memo,
+            ClassifiedEntry.account_code, ClassifiedEntry.tax_type
+        ).join(
+            ClassifiedEntry,
+            ClassifiedEntry.entry_id == NormalizedEntry.id,
+            isouter=True
+        )
+        q = q.filter(tenant_filter(NormalizedEntry, user_id))
+        if period:
+            q = q.filter(NormalizedEntry.trx_date.like(f"{period}%"))
+        q = q.order_by(NormalizedEntry.id).execution_options(stream_results=True).yield_per(EXPORT_YIELD_PER)
+        for row in q:
+            yield {
+                "id": row.id,
+                "trx_date": row.trx_date or "",
+                "vendor": row.vendor or "",
+                "amount": float(row.amount or 0),
+                "vat": float(row.vat or 0),
+                "memo": row.memo or "",
+                "account_code": row.account_code,
+                "tax_type": row.tax_type
+            }
+    finally:
+        db.close()
+
+def _ndjson_stream(rows: Iterator[dict]) -> Iterator[bytes]:
+    buf = []
+    for r in rows:
+        buf.append(json.dumps(r, ensure_ascii=False))
+        if len(buf) >= EXPORT_YIELD_PER:
+            yield ("\n".join(buf) + "\n").encode("utf-8")
+            buf = []
+    if buf:
+        yield ("\n".join(buf) + "\n").encode("utf-8")
+
+def _csv_stream(rows: Iterator[dict], bom: bool) -> Iterator[bytes]:
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=EXPORT_COLUMNS, lineterminator="\r\n")
+    if bom:
+        out.write("\ufeff")  # Excel 한글 깨짐 방지
+    writer.writeheader()
+    n = 0
+    for r in rows:
+        writer.writerow(r); n += 1
+        if n % EXPORT_YIELD_PER == 0:
+            yield out.getvalue().encode("utf-8")
+            out.seek(0); out.truncate(0)
+    if out.tell():
+        yield out.getvalue().encode("utf-8")
+
+@router.get("/export")
+def export_entries(
+    fmt: str = Query("ndjson", alias="format", description="내보내기 형식 (ndjson/csv)"),
+    period: Optional[str] = Query(None, description="기간 필터 (YYYY 또는 YYYY-MM)"),
+    bom: bool = Query(False, description="CSV에 UTF-8 BOM 추가 (Excel용)"),
+    user_id: str = Depends(get_user_id)
+):
+    """가계부 전체 스트리밍 내보내기 - 페이지네이션/count 없이 일정한 메모리로 전송"""
+    if fmt not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format은 ndjson 또는 csv여야 합니다")
+    if period and len(period) < 4:
+        raise HTTPException(status_code=400, detail="기간은 최소 YYYY 형식이어야 합니다")
+
+    rows = _iter_export_rows(period, user_id)
+    filename = f"entries_{period or 'all'}.{fmt}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if fmt == "csv":
+        return StreamingResponse(_csv_stream(rows, bom), media_type="text/csv; charset=utf-8", headers=headers)
+    return StreamingResponse(_ndjson_stream(rows), media_type="application/x-ndjson", headers=headers)
+
 # 직접 입력 CRUD API
 @router.post("/direct", response_model=BaseResponse)
 def create_direct_entry(
     entry: DirectEntryRequest,
+    user_id: str = Depends(get_user_id),
     db: Session = Depends(get_db)
 ):
     """직접 입력 거래 생성"""
     try:
         # 새 엔트리 생성
+        ensure_user(db, user_id)
         new_entry = NormalizedEntry(
+            user_id=stamp(user_id),
             file_id=None,  # 직접 입력은 파일 없음
             raw_line=0,
             trx_date=entry.trx_date,
@@ -134,6 +249,7 @@ def create_direct_entry(
         db.add(new_entry)
         db.commit()
         db.refresh(new_entry)
+        analytics.invalidate(user_id)
         
         logger.info(f"직접 입력 생성: ID={new_entry.id}, 거래처={entry.vendor}")
         
@@ -162,12 +278,16 @@ def get_direct_entries(
     page: int = Query(1, ge=1, description="페이지 번호"),
     per_page: int = Query(50, ge=1, le=200, description="페이지당 항목 수"),
     transaction_type: Optional[str] = Query(None, description="거래 유형 (income/expense)"),
+    user_id: str = Depends(get_user_id),
     db: Session = Depends(get_db)
 ):
     """직접 입력 거래 목록 조회"""
     try:
         # 직접 입력 데이터만 조회 (file_id가 None인 것들)
-        q = db.query(NormalizedEntry).filter(NormalizedEntry.file_id.is_(None))
+        q = db.query(NormalizedEntry).filter(
+            tenant_filter(NormalizedEntry, user_id),
+            NormalizedEntry.file_id.is_(None)
+        )
         
         # 거래 유형 필터링
         if transaction_type:
@@ -218,12 +338,14 @@ def get_direct_entries(
 @router.get("/direct/{entry_id}", response_model=BaseResponse)
 def get_direct_entry(
     entry_id: int = Path(..., description="거래 ID"),
+    user_id: str = Depends(get_user_id),
     db: Session = Depends(get_db)
 ):
     """특정 직접 입력 거래 조회"""
     try:
         entry = db.query(NormalizedEntry).filter(
             NormalizedEntry.id == entry_id,
+            tenant_filter(NormalizedEntry, user_id),
             NormalizedEntry.file_id.is_(None)
         ).first()
         
@@ -256,12 +378,14 @@ def get_direct_entry(
 def update_direct_entry(
     entry_id: int = Path(..., description="거래 ID"),
     update_data: DirectEntryUpdate = None,
+    user_id: str = Depends(get_user_id),
     db: Session = Depends(get_db)
 ):
     """직접 입력 거래 수정"""
     try:
         entry = db.query(NormalizedEntry).filter(
             NormalizedEntry.id == entry_id,
+            tenant_filter(NormalizedEntry, user_id),
             NormalizedEntry.file_id.is_(None)
         ).first()
         
@@ -282,6 +406,7 @@ def update_direct_entry(
         
         db.commit()
         db.refresh(entry)
+        analytics.invalidate(user_id)
         
         logger.info(f"직접 입력 수정: ID={entry_id}, 거래처={entry.vendor}")
         
@@ -309,12 +434,14 @@ def update_direct_entry(
 @router.delete("/direct/{entry_id}", response_model=BaseResponse)
 def delete_direct_entry(
     entry_id: int = Path(..., description="거래 ID"),
+    user_id: str = Depends(get_user_id),
     db: Session = Depends(get_db)
 ):
     """직접 입력 거래 삭제"""
     try:
         entry = db.query(NormalizedEntry).filter(
             NormalizedEntry.id == entry_id,
+            tenant_filter(NormalizedEntry, user_id),
             NormalizedEntry.file_id.is_(None)
         ).first()
         
@@ -329,6 +456,7 @@ def delete_direct_entry(
         # 엔트리 삭제
         db.delete(entry)
         db.commit()
+        analytics.invalidate(user_id)
         
         logger.info(f"직접 입력 삭제: ID={entry_id}, 거래처={vendor_name}")
         
@@ -344,39 +472,78 @@ def delete_direct_entry(
         logger.error(f"직접 입력 삭제 오류 (ID: {entry_id}): {e}")
         raise HTTPException(status_code=500, detail="거래 삭제 중 오류가 발생했습니다")
 
+@router.put("/{entry_id}/classification", response_model=BaseResponse)
+def update_entry_classification(
+    entry_id: int = Path(..., description="거래 ID"),
+    update_data: ClassificationUpdate = Body(...),
+    user_id: str = Depends(get_user_id),
+    db: Session = Depends(get_db)
+):
+    """계정과목/세금유형 수정 - 같은 거래처·메모의 다음 거래는 이 값으로 자동 분류"""
+    try:
+        entry = db.query(NormalizedEntry).filter(
+            NormalizedEntry.id == entry_id,
+            tenant_filter(NormalizedEntry, user_id)
+        ).first()
+        if not entry:
+            raise HTTPException(status_code=404, detail="해당 거래를 찾을 수 없습니다")
+
+        db.merge(ClassifiedEntry(entry_id=entry.id,
+                                 account_code=update_data.account_code,
+                                 tax_type=update_data.tax_type,
+                                 confidence="1.0",
+                                 model_used="user",
+                                 reason="사용자 수정",
+                                 flags="[]",
+                                 updated_at=datetime.utcnow()))
+        MEMORY.learn(db, entry.user_id, entry.vendor, entry.memo,
+                     update_data.account_code, update_data.tax_type, vendor_index())
+        db.commit()
+        analytics.invalidate(user_id)
+        neighbors.invalidate(user_id)
+
+        logger.info(f"분류 수정: ID={entry_id}, 계정={update_data.account_code}, 세금유형={update_data.tax_type}")
+
+        return BaseResponse(
+            data={
+                "id": entry.id,
+                "account_code": update_data.account_code,
+                "tax_type": update_data.tax_type
+            },
+            message="분류가 수정되었습니다"
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        logger.error(f"분류 수정 오류 (ID: {entry_id}): {e}")
+        raise HTTPException(status_code=500, detail="분류 수정 중 오류가 발생했습니다")
+
 @router.get("/tax-calculation", response_model=BaseResponse)
 def calculate_taxes(
     period: Optional[str] = Query(None, description="기간 필터 (YYYY-MM)"),
+    user_id: str = Depends(get_user_id),
     db: Session = Depends(get_db)
 ):
     """실시간 세무 계산"""
     try:
-        # 모든 엔트리 조회 (직접입력 + CSV 업로드)
-        q = db.query(NormalizedEntry)
-        
-        if period:
-            if len(period) < 4:
-                raise HTTPException(status_code=400, detail="기간은 최소 YYYY 형식이어야 합니다")
-            q = q.filter(NormalizedEntry.trx_date.like(f"{period}%"))
-        
-        entries = q.all()
-        
-        # 세무 계산
-        total_income = Decimal('0')
-        total_expense = Decimal('0')
-        sales_tax = Decimal('0')  # 매출세액 (수입 거래의 VAT)
-        purchase_tax = Decimal('0')  # 매입세액 (지출 거래의 VAT)
-        
-        for entry in entries:
-            amount = Decimal(str(entry.amount or 0))
-            vat = Decimal(str(entry.vat or 0))
-            
-            if amount > 0:  # 수입
-                total_income += amount
-                sales_tax += vat
-            else:  # 지출
-                total_expense += abs(amount)
-                purchase_tax += abs(vat)
+        if period and len(period) < 4:
+            raise HTTPException(status_code=400, detail="기간은 최소 YYYY 형식이어야 합니다")
+        
+        # 모든 엔트리 (직접입력 + CSV 업로드) 를 수입/지출로 나눠 집계
+        by_direction = {r["direction"]: r for r in analytics.query(
+            db, group_by=["direction"], metrics=["amount", "vat", "abs_amount", "abs_vat", "count"],
+            user_id=user_id, period=period
+        )}
+        income = by_direction.get("income", {})
+        expense = by_direction.get("expense", {})
+        
+        total_income = Decimal(str(income.get("amount", 0)))
+        sales_tax = Decimal(str(income.get("vat", 0)))  # 매출세액 (수입 거래의 VAT)
+        total_expense = Decimal(str(expense.get("abs_amount", 0)))
+        purchase_tax = Decimal(str(expense.get("abs_vat", 0)))  # 매입세액 (지출 거래의 VAT)
+        entry_count = income.get("count", 0) + expense.get("count", 0)
         
         # 납부세액 = 매출세액 - 매입세액
         payable_tax = sales_tax - purchase_tax
@@ -390,7 +557,7 @@ def calculate_taxes(
                 "total_income": float(total_income),
                 "total_expense": float(total_expense),
                 "net_profit": float(net_profit),
-                "entry_count": len(entries),
+                "entry_count": entry_count,
                 "period": period or "전체",
                 "calculation_time": datetime.utcnow().isoformat()
             },
@@ -1,10 +1,15 @@
 from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException
 from sqlalchemy.orm import Session
-from ..deps import get_db
+from ..deps import get_db, get_user_id
 from ..db.models import RawFile, NormalizedEntry
+from ..db.tenancy import ensure_user, stamp, tenant_filter
+from ..db import utils as db_utils
 from ..schemas import BaseResponse, UploadFileRequest
+from ..utils.metrics import INGEST_ROWS, INGEST_SECONDS
+from ..services.vendors import register_vendors
+from ..services.classification import vendor_index
 from pydantic import BaseModel, field_validator
-import hashlib, os, csv, io, logging
+import hashlib, os, csv, io, logging, time
 from typing import List, Optional
 
 logger = logging.getLogger(__name__)
@@ -39,7 +44,8 @@ async def upload_file(
     period: str = Form("2025-09", description="기간 (YYYY-MM)"),
     source: str = Form("manual_upload", description="데이터 소스"),
     file: UploadFile = File(..., description="업로드할 CSV/Excel 파일"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    user_id: str = Depends(get_user_id)
 ):
     """CSV/Excel 파일 업로드 및 처리 - 고도화된 방어코딩"""
     try:
@@ -72,8 +78,13 @@ async def upload_file(
         # 체크섬 및 파일 저장
         checksum = sha256sum(content)
         
-        # 중복 파일 체크
-        existing_file = db.query(RawFile).filter(RawFile.checksum == checksum).first()
+        # 중복 파일 체크 (같은 테넌트 안에서만)
+        existing_file = db.query(RawFile).filter(RawFile.checksum == checksum,
+                                                 tenant_filter(RawFile, user_id)).first()
+        if existing_file is None and db_utils.LEGACY_GLOBAL_CHECKSUM \
+                and db.query(RawFile.id).filter(RawFile.checksum == checksum).first():
+            # raw_files 마이그레이션 전 - 다른 테넌트의 같은 파일이 전역 UNIQUE 에 걸린다
+            raise HTTPException(status_code=409, detail="같은 파일이 다른 계정에 이미 업로드되어 있습니다")
         if existing_file:
             logger.info(f"중복 파일 감지: {file.filename} (체크섬: {checksum[:8]})")
             return BaseResponse(
@@ -96,7 +107,9 @@ async def upload_file(
         logger.info(f"파일 저장 완료: {local_path}")
         
         # 데이터베이스에 파일 정보 저장
+        ensure_user(db, user_id)
         raw_file = RawFile(
+            user_id=stamp(user_id),
             period=period,
             source=source,
             mime=file.content_type or "application/octet-stream",
@@ -113,6 +126,7 @@ async def upload_file(
         parsing_errors = []
         
         if file_ext == '.csv':
+            parse_started = time.perf_counter()
             try:
                 # 인코딩 자동 감지 (UTF-8 우선, CP949 대비)
                 try:
@@ -129,6 +143,7 @@ async def upload_file(
                 csv_reader = csv.DictReader(io.StringIO(text))
                 batch_size = 100  # 배치 처리
                 batch = []
+                vendors_seen = set()
                 
                 for idx, row in enumerate(csv_reader, start=1):
                     try:
@@ -136,6 +151,7 @@ async def upload_file(
                         entry_data = CSVEntryModel(**row)
                         
                         entry = NormalizedEntry(
+                            user_id=raw_file.user_id,
                             file_id=raw_file.id,
                             raw_line=idx,
                             trx_date=entry_data.date[:10] if entry_data.date else "",  # YYYY-MM-DD만
@@ -145,6 +161,7 @@ async def upload_file(
                             memo=(entry_data.memo or "")[:1000]  # 메모 길이 제한
                         )
                         batch.append(entry)
+                        vendors_seen.add(entry.vendor)
                         entry_count += 1
                         
                         # 배치 저장
@@ -164,6 +181,14 @@ async def upload_file(
                     db.commit()
                     
                 logger.info(f"CSV 파싱 완료: {entry_count}개 엔트리, {len(parsing_errors)}개 오류")
+                INGEST_ROWS.inc(entry_count)
+                INGEST_SECONDS.inc(time.perf_counter() - parse_started)
+                
+                # 원본 거래처명 → 대표 거래처 매핑 저장 (실패해도 업로드는 유지)
+                try:
+                    register_vendors(db, vendors_seen, vendor_index())
+                except Exception as e:
+                    logger.warning(f"거래처 매핑 저장 실패: {e}")
                 
             except Exception as e:
                 logger.error(f"CSV 파싱 오류: {e}")
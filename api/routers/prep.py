@@ -2,11 +2,11 @@ from fastapi import APIRouter, Query, Depends
 from pydantic import BaseModel
 from typing import Optional
 from ..db.database import SessionLocal
+from ..deps import get_user_id
 from sqlalchemy.orm import Session
 from ..services.prep import detect_signals
-from ..db.models import PrepItem
-from ..clients.openai_client import call_openai
-import yaml, pathlib
+from ..services.checklist import get_checklist, upsert_prep_items
+from ..services import anomalies
 
 router = APIRouter()
 
@@ -14,6 +14,7 @@ class PrepRefreshRequest(BaseModel):
     period: str
     business_type: Optional[str] = "일반"
     taxType: Optional[str] = "VAT"
+    user_id: Optional[str] = None
 
 def get_db():
     db = SessionLocal()
@@ -23,42 +24,43 @@ def get_db():
         db.close()
 
 @router.post("/refresh")
-def refresh_prep_post(request: PrepRefreshRequest, db: Session = Depends(get_db)):
+def refresh_prep_post(request: PrepRefreshRequest, db: Session = Depends(get_db),
+                      user_id: str = Depends(get_user_id)):
     """POST 방식 체크리스트 생성 (Smoke Test 호환)"""
-    return _generate_checklist(request.period, request.taxType, db)
+    return _generate_checklist(request.period, request.taxType, db, user_id or (request.user_id or "").strip())
 
 @router.get("/refresh")
-def refresh_prep_get(period: str = Query(...), taxType: str = Query("VAT"), db: Session = Depends(get_db)):
+def refresh_prep_get(period: str = Query(...), taxType: str = Query("VAT"),
+                     db: Session = Depends(get_db), user_id: str = Depends(get_user_id)):
     """GET 방식 체크리스트 생성 (기존 호환)"""
-    return _generate_checklist(period, taxType, db)
+    return _generate_checklist(period, taxType, db, user_id)
 
-def _generate_checklist(period: str, taxType: str, db: Session):
-    """공통 체크리스트 생성 로직"""
+@router.get("/anomalies")
+def detect_anomalies(period: Optional[str] = Query(None, description="기간 필터 (YYYY 또는 YYYY-MM)"),
+                     window_days: int = Query(anomalies.DUPLICATE_WINDOW_DAYS, ge=0, le=31, description="중복 판정 기간 (일)"),
+                     limit: int = Query(100, ge=0, le=1000, description="유형별 반환 건수"),
+                     persist: bool = Query(False, description="PrepItem 으로 저장 (기본은 조회만)"),
+                     db: Session = Depends(get_db), user_id: str = Depends(get_user_id)):
+    """중복 의심 / 부가세 불일치 / 금액 이상치 탐지"""
+    result = anomalies.report(db, user_id=user_id, period=period, window_days=window_days,
+                              limit=limit, persist=persist)
+    return {"ok": True, **result}
+
+def _generate_checklist(period: str, taxType: str, db: Session, user_id: str = ""):
+    """공통 체크리스트 생성 로직 - LLM 체크리스트는 백그라운드에서 만들고 캐시된 결과를 반환"""
     try:
-        signals = detect_signals(db, period)
-        
-        # 템플릿 파일 경로 확인 및 로드
-        TPL_PATH = pathlib.Path(__file__).resolve().parents[2] / "prompts" / "templates.yaml"
-        if TPL_PATH.exists():
-            tpl = yaml.safe_load(open(TPL_PATH, "r", encoding="utf-8"))
-            sys = tpl["checklist_v1"]["system"]
-            user_t = tpl["checklist_v1"]["user_template"]
-            signals_text = "\n".join([f"- {s['code']}: {s['desc']}" for s in signals]) or "- NONE"
-            _ = call_openai(model="gpt-4o-mini", messages=[{"role":"system","content":sys},{"role":"user","content":user_t.format(taxType=taxType, period=period, signals=signals_text)}])
-        
-        # 데이터베이스 저장 시도
-        saved = 0
-        for s in signals:
-            pi = PrepItem(period=period, type=s["code"], target_ref="", status="OPEN", fix_hint=s["desc"])
-            db.add(pi); saved += 1
-        db.commit()
+        signals = detect_signals(db, period, user_id)
+        saved, _ = upsert_prep_items(db, user_id, period, signals)
+        checklist = get_checklist(user_id, period, taxType, signals)
         
     except Exception:
         # 오류 발생 시 기본 시그널 생성
+        db.rollback()
         signals = [
             {"code": "NO_CASH_RECEIPT", "desc": "현금영수증 내역 없음"},
             {"code": "PERIOD_MISMATCH", "desc": "선택한 과세기간과 다른 월 자료 포함 가능"}
         ]
         saved = len(signals)
+        checklist = {"status": "error", "items": []}
     
-    return {"ok": True, "generated": saved, "signals": signals}
+    return {"ok": True, "generated": saved, "signals": signals, "checklist": checklist}
@@ -1,9 +1,11 @@
-from fastapi import APIRouter, Query, Depends
+from fastapi import APIRouter, Query, Depends, HTTPException
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import Optional
 from ..db.database import SessionLocal
-from ..db.models import NormalizedEntry, ClassifiedEntry
+from ..deps import get_user_id
+from ..services import analytics
+from ..utils.metrics import CACHE_REQUESTS
 import hashlib
 
 router = APIRouter()
@@ -22,44 +24,36 @@ def get_db():
         db.close()
 
 @router.get("/estimate")
-def estimate_vat_get(user_id: str = Query(None), period: str = Query(...), db: Session = Depends(get_db)):
+def estimate_vat_get(period: str = Query(...), db: Session = Depends(get_db), user_id: str = Depends(get_user_id)):
     """기존 GET 메서드 세액 추정"""
     return _calculate_vat_estimate(user_id, period, db)
 
 @router.post("/estimate")
-def estimate_vat_post(request: TaxEstimateRequest, db: Session = Depends(get_db)):
+def estimate_vat_post(request: TaxEstimateRequest, db: Session = Depends(get_db), user_id: str = Depends(get_user_id)):
     """POST 메서드 세액 추정 (Smoke Test 호환)"""
+    # 헤더/쿼리 테넌트 우선, 없으면 본문 user_id (기존 클라이언트 호환)
+    user_id = user_id or (request.user_id or "").strip()
     # Cache key generation
     from ..main import tax_cache
-    cache_key = hashlib.md5(f"{request.user_id}_{request.period}_{request.sales_amount}_{request.purchase_amount}".encode()).hexdigest()
+    cache_key = hashlib.md5(f"{user_id}_{request.period}_{request.sales_amount}_{request.purchase_amount}".encode()).hexdigest()
     
     # Check cache first
     if cache_key in tax_cache:
+        CACHE_REQUESTS.inc(cache="tax_cache", result="hit")
         return tax_cache[cache_key]
+    CACHE_REQUESTS.inc(cache="tax_cache", result="miss")
     
-    result = _calculate_vat_estimate(request.user_id, request.period, db, request.sales_amount, request.purchase_amount)
+    result = _calculate_vat_estimate(user_id, request.period, db, request.sales_amount, request.purchase_amount)
     tax_cache[cache_key] = result
     return result
 
 def _calculate_vat_estimate(user_id: Optional[str], period: str, db: Session, sales_amount: Optional[float] = None, purchase_amount: Optional[float] = None):
     """공통 세액 추정 로직"""
     try:
-        # 데이터베이스에서 조회 시도
-        q = db.query(NormalizedEntry, ClassifiedEntry).join(ClassifiedEntry, ClassifiedEntry.entry_id==NormalizedEntry.id)
-        if user_id:
-            q = q.filter(NormalizedEntry.user_id==user_id)
-        if period and len(period)>=4:
-            q = q.filter(NormalizedEntry.trx_date.like(f"{period}%"))
-
-        sales_vat = 0.0; purchase_vat = 0.0; non_deductible = 0.0
-        for e, c in q.all():
-            vat = float(e.vat or 0)
-            if (c.tax_type or "") == "불공제":
-                non_deductible += vat; continue
-            if "매출" in (e.memo or ""):
-                sales_vat += vat
-            else:
-                purchase_vat += vat
+        # 분석 엔진(컬럼 스토어)에서 집계
+        sales_vat, purchase_vat, non_deductible = analytics.vat_breakdown(
+            db, user_id, period if period and len(period) >= 4 else None
+        )
     except Exception:
         # 데이터베이스 오류 시 가상 데이터로 계산
         if sales_amount and purchase_amount:
@@ -78,3 +72,18 @@ def _calculate_vat_estimate(user_id: Optional[str], period: str, db: Session, sa
             "purchase_vat": round(purchase_vat,2),
             "non_deductible_vat": round(non_deductible,2),
             "estimated_due_vat": round(due,2)}
+
+@router.get("/breakdown")
+def tax_breakdown(
+    group_by: str = Query("period,account_code", description="그룹 차원 (쉼표 구분: period, year, account_code, tax_type, vendor, direction)"),
+    period: Optional[str] = Query(None, description="기간 필터 (YYYY 또는 YYYY-MM)"),
+    db: Session = Depends(get_db),
+    user_id: str = Depends(get_user_id)
+):
+    """다차원 합계/건수 분석 (기간·계정과목·세금유형·거래처별)"""
+    dims = [d.strip() for d in group_by.split(",") if d.strip()]
+    try:
+        rows = analytics.query(db, group_by=dims, metrics=["amount", "vat", "count"], user_id=user_id, period=period)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"ok": True, "group_by": dims, "period": period, "rows": rows}
@@ -119,6 +119,17 @@ class DirectEntryUpdate(BaseModel):
             raise ValueError('거래 유형은 income 또는 expense여야 합니다')
         return v
 
+class ClassificationUpdate(BaseModel):
+    """분류 수정 요청 (사용자 수정 이력으로 학습됨)"""
+    account_code: str = Field(..., min_length=1, max_length=100, description="계정과목")
+    tax_type: str = Field(..., description="세금유형")
+
+    @validator('tax_type')
+    def validate_tax_type(cls, v):
+        if v not in ['과세', '면세', '불공제']:
+            raise ValueError('세금유형은 과세/면세/불공제 중 하나여야 합니다')
+        return v
+
 class DirectEntryResponse(BaseModel):
     """직접 입력 응답"""
     id: int
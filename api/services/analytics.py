@@ -0,0 +1,268 @@
+"""
+인프로세스 분석 엔진 - NumPy 컬럼 스토어
+
+entries 테이블(NormalizedEntry + ClassifiedEntry)을 테넌트별 컬럼 배열로 한 번 적재해 두고
+기간/계정과목/세금유형/거래처 등으로 group by 합계·건수를 계산한다.
+세액 추정, 세무 계산, 요약 엔드포인트가 모두 이 엔진을 사용한다.
+
+스토어·데이터 버전·재적재 잠금은 모두 테넌트 단위라, 한 테넌트의 쓰기는 그 테넌트의 스토어만 다시 적재한다.
+"""
+
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+from ..db.models import NormalizedEntry, ClassifiedEntry
+from ..db.tenancy import ANONYMOUS, TenantVersions, tenant_filter
+from cachetools import LRUCache
+from typing import Dict, List, Optional, Sequence, Tuple, Any
+import numpy as np
+import os, time, threading, logging
+
+logger = logging.getLogger(__name__)
+
+# 다른 워커의 수정까지 반영하기 위한 최대 캐시 수명 (초)
+ANALYTICS_MAX_AGE = float(os.getenv("ANALYTICS_MAX_AGE", "60"))
+ANALYTICS_MAX_TENANTS = int(os.getenv("ANALYTICS_MAX_TENANTS", "256"))  # 메모리에 들고 있을 테넌트 스토어 수
+
+DIMENSIONS = ("period", "year", "trx_date", "account_code", "tax_type", "vendor", "user_id",
+              "direction", "sales_memo", "classified")
+METRICS = ("amount", "vat", "abs_amount", "abs_vat", "count")
+
+class _Dict:
+    """문자열 → 정수 코드 사전 (적재 중 인코딩용)"""
+    __slots__ = ("index", "values")
+
+    def __init__(self):
+        self.index: Dict[Any, int] = {}
+        self.values: List[Any] = []
+
+    def code(self, v) -> int:
+        c = self.index.get(v)
+        if c is None:
+            c = self.index[v] = len(self.values)
+            self.values.append(v)
+        return c
+
+class ColumnStore:
+    """엔트리 컬럼 배열 + 문자열 컬럼 사전 인코딩"""
+
+    def __init__(self, version: tuple, columns: Dict[str, np.ndarray], dicts: Dict[str, list]):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.columns = columns
+        self.dicts = dicts
+        self.size = len(columns["amount"])
+        self._index: Dict[str, Dict[Any, int]] = {}
+        self._tenant_index: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        # 날짜 사전에서 파생되는 월/연도 차원 (행 단위 문자열 연산 없이 코드 매핑)
+        self._date_strs = np.array(dicts["trx_date"], dtype=str)
+        for dim, width in (("period", 7), ("year", 4)):
+            prefixes = np.array([d[:width] for d in dicts["trx_date"]], dtype=str)
+            uniq, inv = np.unique(prefixes, return_inverse=True)
+            self.dicts[dim] = uniq.tolist()
+            self.columns[dim] = inv.reshape(-1).astype(np.int32)[columns["trx_date"]]
+        self.dicts["direction"] = ["expense", "income"]
+        self.columns["direction"] = (columns["amount"] > 0).astype(np.int8)
+        self.dicts["sales_memo"] = [False, True]
+        self.dicts["classified"] = [False, True]
+
+    def _code(self, dim: str, value) -> Optional[int]:
+        index = self._index.get(dim)
+        if index is None:
+            index = self._index[dim] = {v: i for i, v in enumerate(self.dicts[dim])}
+        return index.get(value)
+
+    def _tenant_rows(self, code: int) -> np.ndarray:
+        """테넌트 코드 → 행 인덱스 (user_id 로 한 번 정렬해 두고 구간만 잘라 쓴다)"""
+        if self._tenant_index is None:
+            users = self.columns["user_id"]
+            order = np.argsort(users, kind="stable")
+            bounds = np.searchsorted(users[order], np.arange(len(self.dicts["user_id"]) + 1))
+            self._tenant_index = (order, bounds)
+        order, bounds = self._tenant_index
+        return order[bounds[code]:bounds[code + 1]]
+
+    def _select(self, user_id: Optional[str], period: Optional[str], classified_only: bool,
+                where: Optional[Dict[str, Any]]) -> np.ndarray:
+        """조건에 맞는 행 인덱스 - 테넌트를 먼저 좁혀 나머지 조건은 그 테넌트 행에만 적용"""
+        empty = np.empty(0, dtype=np.int64)
+        if user_id is not None:
+            code = self._code("user_id", user_id)
+            if code is None:
+                return empty
+            idx = self._tenant_rows(code)
+        else:
+            idx = np.arange(self.size)
+        if period and len(idx):
+            date_ok = np.char.startswith(self._date_strs, period)
+            idx = idx[date_ok[self.columns["trx_date"][idx]]]
+        if classified_only:
+            idx = idx[self.columns["classified"][idx].astype(bool)]
+        for dim, value in (where or {}).items():
+            code = self._code(dim, value)
+            if code is None:
+                return empty
+            idx = idx[self.columns[dim][idx] == code]
+        return idx
+
+    def rows(self, user_id: Optional[str] = None, period: Optional[str] = None) -> np.ndarray:
+        """조건에 맞는 행 인덱스 (다른 분석 단계가 컬럼을 직접 쓰는 경우)"""
+        return self._select(user_id, period, False, None)
+
+    def query(self, group_by: Sequence[str] = (), metrics: Sequence[str] = METRICS,
+              user_id: Optional[str] = None, period: Optional[str] = None,
+              classified_only: bool = False, where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        for dim in group_by:
+            if dim not in DIMENSIONS:
+                raise ValueError(f"지원하지 않는 차원: {dim}")
+        for m in metrics:
+            if m not in METRICS:
+                raise ValueError(f"지원하지 않는 지표: {m}")
+
+        idx = self._select(user_id, period, classified_only, where)
+        if not group_by:
+            return [_row({}, {m: _metric(self.columns, m, idx).sum() if m != "count" else len(idx)
+                              for m in metrics})]
+        if len(idx) == 0:
+            return []
+
+        # 차원 코드를 하나의 정수 키로 합친 뒤 np.unique + bincount 로 그룹 집계
+        codes = [self.columns[d][idx].astype(np.int64) for d in group_by]
+        sizes = [max(len(self.dicts[d]), 1) for d in group_by]
+        if np.prod([float(s) for s in sizes]) < 2 ** 62:
+            keys = np.ravel_multi_index(codes, sizes)
+            uniq, inv = np.unique(keys, return_inverse=True)
+            group_codes = np.unravel_index(uniq, sizes)
+        else:
+            uniq, inv = np.unique(np.stack(codes, axis=1), axis=0, return_inverse=True)
+            group_codes = uniq.T
+        inv = inv.reshape(-1)
+        n_groups = len(uniq)
+        sums = {m: (np.bincount(inv, minlength=n_groups) if m == "count"
+                    else np.bincount(inv, weights=_metric(self.columns, m, idx), minlength=n_groups))
+                for m in metrics}
+
+        # 결과 행 구성도 컬럼 단위로 변환한 뒤 한 번에 묶는다
+        names = list(group_by) + list(metrics)
+        columns = [np.asarray(self.dicts[d], dtype=object)[np.asarray(group_codes[i])].tolist()
+                   for i, d in enumerate(group_by)]
+        columns += [sums[m].astype(np.int64).tolist() if m == "count" else np.round(sums[m], 2).tolist()
+                    for m in metrics]
+        return [dict(zip(names, values)) for values in zip(*columns)]
+
+def _metric(columns: Dict[str, np.ndarray], name: str, idx: np.ndarray) -> np.ndarray:
+    if name == "abs_amount":
+        return np.abs(columns["amount"][idx])
+    if name == "abs_vat":
+        return np.abs(columns["vat"][idx])
+    return columns[name][idx]
+
+def _row(dims: Dict[str, Any], values: Dict[str, Any]) -> Dict[str, Any]:
+    row = dict(dims)
+    for k, v in values.items():
+        row[k] = int(v) if k == "count" else round(float(v), 2)
+    return row
+
+# 테넌트 → 컬럼 스토어
+_stores: LRUCache = LRUCache(maxsize=ANALYTICS_MAX_TENANTS)
+_stores_lock = threading.Lock()
+_versions = TenantVersions()
+
+def invalidate(user_id: Optional[str] = None):
+    """쓰기 경로에서 호출 - 다음 조회 시 그 테넌트의 컬럼 스토어를 다시 적재 (None 이면 전체)"""
+    _versions.bump(user_id)
+
+def data_version(db: Session, user_id: Optional[str]) -> tuple:
+    """테넌트의 엔트리/분류 데이터 버전 (다른 인메모리 캐시의 무효화 키로도 사용)
+
+    user_id 선행 인덱스로 그 테넌트 행만 세므로 비용이 다른 테넌트 데이터 양과 무관하다.
+    updated_at 이 있어 다른 워커의 수정도 다음 조회에서 바로 반영된다.
+    """
+    tenant = tenant_filter(NormalizedEntry, user_id)
+    n_count, n_max, n_updated = db.query(
+        func.count(NormalizedEntry.id), func.max(NormalizedEntry.id), func.max(NormalizedEntry.updated_at)
+    ).filter(tenant).one()
+    c_count, c_max = db.query(func.count(ClassifiedEntry.entry_id), func.max(ClassifiedEntry.updated_at)) \
+        .join(NormalizedEntry, NormalizedEntry.id == ClassifiedEntry.entry_id).filter(tenant).one()
+    return (_versions.get(user_id), n_count, n_max, str(n_updated), c_count, str(c_max))
+
+def _load(db: Session, user_id: str, version: tuple) -> ColumnStore:
+    started = time.perf_counter()
+    dicts = {d: _Dict() for d in ("trx_date", "account_code", "tax_type", "vendor", "user_id")}
+    ids: List[int] = []; amount: List[float] = []; vat: List[float] = []
+    cols: Dict[str, List[int]] = {d: [] for d in dicts}
+    sales_memo: List[bool] = []; classified: List[bool] = []
+
+    q = db.query(
+        NormalizedEntry.id, NormalizedEntry.user_id, NormalizedEntry.trx_date, NormalizedEntry.vendor,
+        NormalizedEntry.amount, NormalizedEntry.vat, NormalizedEntry.memo,
+        ClassifiedEntry.entry_id, ClassifiedEntry.account_code, ClassifiedEntry.tax_type
+    ).join(ClassifiedEntry, ClassifiedEntry.entry_id == NormalizedEntry.id, isouter=True) \
+        .filter(tenant_filter(NormalizedEntry, user_id))
+    for r in q.execution_options(stream_results=True).yield_per(10000):
+        ids.append(r.id)
+        cols["user_id"].append(dicts["user_id"].code(r.user_id or ""))  # 익명 테넌트는 ""
+        cols["trx_date"].append(dicts["trx_date"].code(r.trx_date or ""))
+        cols["vendor"].append(dicts["vendor"].code(r.vendor or ""))
+        cols["account_code"].append(dicts["account_code"].code(r.account_code))
+        cols["tax_type"].append(dicts["tax_type"].code(r.tax_type))
+        amount.append(float(r.amount or 0)); vat.append(float(r.vat or 0))
+        sales_memo.append("매출" in (r.memo or ""))
+        classified.append(r.entry_id is not None)
+
+    columns = {d: np.asarray(v, dtype=np.int32) for d, v in cols.items()}
+    columns["id"] = np.asarray(ids, dtype=np.int64)
+    columns["amount"] = np.asarray(amount, dtype=np.float64)
+    columns["vat"] = np.asarray(vat, dtype=np.float64)
+    columns["sales_memo"] = np.asarray(sales_memo, dtype=np.int8)
+    columns["classified"] = np.asarray(classified, dtype=np.int8)
+    store = ColumnStore(version, columns, {d: v.values for d, v in dicts.items()})
+    logger.info(f"분석 컬럼 스토어 적재 ({user_id or '익명'}): {store.size}행, {time.perf_counter() - started:.2f}s")
+    return store
+
+def _fresh(store: Optional[ColumnStore], version: tuple) -> bool:
+    return store is not None and store.version == version and time.monotonic() - store.loaded_at < ANALYTICS_MAX_AGE
+
+def get_store(db: Session, user_id: Optional[str]) -> ColumnStore:
+    """테넌트의 현재 데이터 버전 컬럼 스토어 반환 (버전이 같으면 재사용)
+
+    재적재는 테넌트 잠금 안에서만 하므로 다른 테넌트 요청은 기다리지 않는다.
+    """
+    key = user_id or ANONYMOUS
+    version = data_version(db, key)
+    with _stores_lock:
+        store = _stores.get(key)
+    if _fresh(store, version):
+        return store
+    with _versions.lock(key):
+        with _stores_lock:
+            store = _stores.get(key)
+        if not _fresh(store, version):
+            store = _load(db, key, version)
+            with _stores_lock:
+                _stores[key] = store
+    return store
+
+def query(db: Session, group_by: Sequence[str] = (), metrics: Sequence[str] = METRICS,
+          user_id: Optional[str] = None, period: Optional[str] = None,
+          classified_only: bool = False, where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """테넌트 group by 집계 조회 (user_id 가 없으면 익명 테넌트)
+
+    예) query(db, group_by=["period", "account_code"], metrics=["vat", "count"], period="2025")
+    """
+    return get_store(db, user_id).query(group_by, metrics, user_id or ANONYMOUS, period, classified_only, where)
+
+def totals(db: Session, **filters) -> Dict[str, Any]:
+    return query(db, **filters)[0]
+
+def vat_breakdown(db: Session, user_id: Optional[str], period: Optional[str]) -> Tuple[float, float, float]:
+    """분류된 엔트리 기준 (매출세액, 매입세액, 불공제세액)"""
+    sales = purchase = non_deductible = 0.0
+    for r in query(db, group_by=["tax_type", "sales_memo"], metrics=["vat"],
+                   user_id=user_id, period=period, classified_only=True):
+        if (r["tax_type"] or "") == "불공제":
+            non_deductible += r["vat"]
+        elif r["sales_memo"]:
+            sales += r["vat"]
+        else:
+            purchase += r["vat"]
+    return sales, purchase, non_deductible
@@ -0,0 +1,169 @@
+"""
+장부 이상 거래 탐지 (NumPy 벡터 연산)
+
+분석 컬럼 스토어(analytics)의 배열을 그대로 써서 테넌트 엔트리 전체를 한 번에 검사한다.
+- 중복 의심: (대표 거래처, 금액) 로 정렬 후 인접 행의 날짜 차이가 N일 이내인 경우 (O(n log n))
+- 부가세 불일치: |vat| 와 |amount|/11 의 차이가 허용 오차를 넘는 경우
+- 금액 이상치: 거래처별 중앙값/MAD 기반 robust z-score
+결과는 엔트리 단위 PrepItem (target_ref = entry id) 으로 저장한다.
+"""
+
+from sqlalchemy.orm import Session
+from ..db.models import PrepItem
+from ..db.tenancy import stamp, tenant_filter
+from .vendors import normalize_vendor
+from . import analytics
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import os, time, datetime, logging
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_WINDOW_DAYS = int(os.getenv("DUPLICATE_WINDOW_DAYS", "3"))
+VAT_TOLERANCE_ABS = float(os.getenv("VAT_TOLERANCE_ABS", "10"))      # 원 단위 절사 오차
+VAT_TOLERANCE_REL = float(os.getenv("VAT_TOLERANCE_REL", "0.02"))
+OUTLIER_Z = float(os.getenv("OUTLIER_Z", "3.5"))
+OUTLIER_MIN_GROUP = int(os.getenv("OUTLIER_MIN_GROUP", "5"))
+ANOMALY_MAX_ITEMS = int(os.getenv("ANOMALY_MAX_ITEMS", "5000"))     # 유형별 PrepItem 저장 상한
+
+ANOMALY_TYPES = {
+    "duplicates": "DUPLICATE_ENTRY",
+    "vat_mismatch": "VAT_MISMATCH",
+    "outliers": "AMOUNT_OUTLIER",
+}
+
+def _day_numbers(dates: List[str]) -> np.ndarray:
+    """날짜 사전 → 일 번호 (파싱 불가한 날짜는 서로 멀리 떨어진 값으로 둔다)"""
+    out = np.empty(len(dates), dtype=np.int64)
+    for i, d in enumerate(dates):
+        try:
+            out[i] = datetime.date.fromisoformat((d or "")[:10]).toordinal()
+        except ValueError:
+            out[i] = -(i + 1) * 10 ** 6
+    return out
+
+def _vendor_codes(vendors: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """원본 거래처 사전 → (대표명 코드, 빈 거래처 여부)"""
+    canon = [normalize_vendor(v or "") for v in vendors]
+    _, codes = np.unique(np.asarray(canon, dtype=object).astype(str), return_inverse=True)
+    empty = np.asarray([not c for c in canon], dtype=bool)
+    return codes.reshape(-1).astype(np.int64), empty
+
+def _group_starts(sorted_keys: np.ndarray) -> np.ndarray:
+    if len(sorted_keys) == 0:  # 빈 선택(엔트리 없는 테넌트/기간) - 그룹도 없다
+        return np.empty(0, dtype=np.int64)
+    return np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+
+def _group_median(values: np.ndarray, starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """그룹 내 오름차순 정렬된 값의 그룹별 중앙값"""
+    return (values[starts + (counts - 1) // 2] + values[starts + counts // 2]) / 2.0
+
+def detect(store: "analytics.ColumnStore", user_id: Optional[str] = None, period: Optional[str] = None,
+           window_days: int = DUPLICATE_WINDOW_DAYS) -> Dict[str, dict]:
+    """유형별 {"idx": 컬럼 스토어 행 인덱스, ...부가 배열} 반환"""
+    sel = store.rows(user_id, period)
+    cols = store.columns
+    amount = cols["amount"][sel]
+    vat = cols["vat"][sel]
+    vendor_canon, vendor_empty = _vendor_codes(store.dicts["vendor"])
+    v = vendor_canon[cols["vendor"][sel]]
+    empty = vendor_empty[cols["vendor"][sel]]
+    day = _day_numbers(store.dicts["trx_date"])[cols["trx_date"][sel]]
+    cents = np.round(amount * 100).astype(np.int64)
+
+    # 중복 의심 - (거래처, 금액, 날짜) 정렬 후 인접 비교
+    order = np.lexsort((day, cents, v))
+    same = ((v[order][1:] == v[order][:-1]) & (cents[order][1:] == cents[order][:-1])
+            & (day[order][1:] - day[order][:-1] <= window_days)
+            & (cents[order][1:] != 0) & ~empty[order][1:])
+    pos = np.flatnonzero(same) + 1
+    duplicates = {"idx": sel[order[pos]], "ref": sel[order[pos - 1]]}
+
+    # 부가세 불일치 - 부가세가 입력된 거래만 (누락은 MISSING_VAT 신호에서 다룸)
+    expected = np.abs(amount) / 11.0
+    diff = np.abs(np.abs(vat) - expected)
+    bad = (vat != 0) & (diff > np.maximum(VAT_TOLERANCE_ABS, VAT_TOLERANCE_REL * expected))
+    vat_mismatch = {"idx": sel[bad], "expected": np.round(expected[bad])}
+
+    # 금액 이상치 - 거래처별 중앙값/MAD
+    x = np.abs(amount)
+    order = np.lexsort((x, v))
+    v_s, x_s = v[order], x[order]
+    starts = _group_starts(v_s)
+    counts = np.diff(np.r_[starts, len(v_s)])
+    med = _group_median(x_s, starts, counts)
+    med_row = np.repeat(med, counts)
+    dev = np.abs(x_s - med_row)
+    dev_sorted = dev[np.lexsort((dev, v_s))]
+    mad = _group_median(dev_sorted, starts, counts)
+    scale = np.maximum(np.maximum(1.4826 * np.repeat(mad, counts), 0.05 * med_row), 1.0)
+    score = dev / scale
+    flag = (score > OUTLIER_Z) & (np.repeat(counts, counts) >= OUTLIER_MIN_GROUP) & ~empty[order]
+    outliers = {"idx": sel[order[flag]], "median": np.round(med_row[flag]), "score": np.round(score[flag], 1)}
+
+    return {"duplicates": duplicates, "vat_mismatch": vat_mismatch, "outliers": outliers}
+
+def _describe(kind: str, store, i: int, extra: dict, j: int) -> str:
+    vendor = store.dicts["vendor"][store.columns["vendor"][i]] or "-"
+    amount = abs(float(store.columns["amount"][i]))
+    if kind == "duplicates":
+        ref = int(store.columns["id"][extra["ref"][j]])
+        return f"{vendor} {amount:,.0f}원 - 거래 #{ref} 와 중복 의심"
+    if kind == "vat_mismatch":
+        vat = abs(float(store.columns["vat"][i]))
+        return f"{vendor} 부가세 {vat:,.0f}원 (예상 {float(extra['expected'][j]):,.0f}원)"
+    return f"{vendor} {amount:,.0f}원 - 평소 금액({float(extra['median'][j]):,.0f}원) 대비 이상치"
+
+def report(db: Session, user_id: Optional[str] = None, period: Optional[str] = None,
+           window_days: int = DUPLICATE_WINDOW_DAYS, limit: int = 100, persist: bool = False) -> dict:
+    started = time.perf_counter()
+    store = analytics.get_store(db, user_id)
+    found = detect(store, user_id, period, window_days)
+    result = {"counts": {k: int(len(v["idx"])) for k, v in found.items()}}
+    for kind, data in found.items():
+        items = []
+        for j, i in enumerate(data["idx"][:limit]):
+            items.append({"entry_id": int(store.columns["id"][i]),
+                          "trx_date": store.dicts["trx_date"][store.columns["trx_date"][i]],
+                          "detail": _describe(kind, store, i, data, j)})
+        result[kind] = items
+    if persist:
+        result["prep_items"] = save_prep_items(db, store, found, user_id, period)
+    result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+def save_prep_items(db: Session, store, found: Dict[str, dict], user_id: Optional[str],
+                    period: Optional[str]) -> Dict[str, int]:
+    """이상 거래 → PrepItem upsert (엔트리 단위), 더 이상 탐지되지 않는 항목은 RESOLVED"""
+    q = db.query(PrepItem).filter(tenant_filter(PrepItem, user_id), PrepItem.type.in_(list(ANOMALY_TYPES.values())))
+    if period:
+        q = q.filter(PrepItem.period.like(f"{period}%"))
+    existing = {(p.type, p.target_ref): p for p in q}
+
+    now = datetime.datetime.utcnow()
+    seen = set()
+    new_items = []
+    stats = {"created": 0, "updated": 0, "resolved": 0}
+    for kind, data in found.items():
+        code = ANOMALY_TYPES[kind]
+        # 상한(ANOMALY_MAX_ITEMS) 밖이라도 여전히 탐지된 항목은 RESOLVED 로 바꾸지 않는다
+        seen.update((code, str(int(ref))) for ref in store.columns["id"][data["idx"]])
+        for j, i in enumerate(data["idx"][:ANOMALY_MAX_ITEMS]):
+            ref = str(int(store.columns["id"][i]))
+            hint = _describe(kind, store, i, data, j)
+            item = existing.get((code, ref))
+            if item is None:
+                new_items.append(PrepItem(user_id=stamp(user_id), period=store.dicts["period"][store.columns["period"][i]],
+                                          type=code, target_ref=ref, status="OPEN", fix_hint=hint, updated_at=now))
+            elif item.fix_hint != hint or item.status == "RESOLVED":
+                item.fix_hint, item.status, item.updated_at = hint, "OPEN", now
+                stats["updated"] += 1
+    for key, item in existing.items():
+        if key not in seen and item.status == "OPEN":
+            item.status, item.updated_at = "RESOLVED", now
+            stats["resolved"] += 1
+    if new_items:
+        db.add_all(new_items)
+    stats["created"] = len(new_items)
+    db.commit()
+    return stats
@@ -0,0 +1,163 @@
+"""
+체크리스트 생성 (백그라운드 + 결과 캐시)
+
+(테넌트, 과세기간, 신고종류, 신호 해시, 프롬프트 버전) 을 키로 LLM 체크리스트를 한 번만 만든다.
+- 캐시에 있으면 즉시 반환, 없으면 백그라운드 작업을 걸고 "pending" 상태를 바로 반환
+- 같은 키의 동시 요청은 진행 중인 작업 하나를 공유 (중복 LLM 호출 없음)
+- PrepItem 은 (테넌트, 기간, 유형) 기준 upsert - 신호가 그대로면 DB 쓰기도 건너뛴다
+- 테넌트 LLM 예산이 한도 근처면 새로 만들지 않고 신호 설명을 항목으로 반환 (캐시는 그대로 사용)
+"""
+
+from sqlalchemy.orm import Session
+from cachetools import TTLCache
+from concurrent.futures import Future, ThreadPoolExecutor
+from ..db.models import PrepItem
+from ..db.tenancy import stamp, tenant_filter
+from ..clients import budget
+from ..utils.metrics import CACHE_REQUESTS
+from .prompts import get_template
+from typing import Dict, List, Optional, Tuple
+import os, re, json, hashlib, datetime, threading, logging
+
+logger = logging.getLogger(__name__)
+
+CHECKLIST_MODEL = os.getenv("CHECKLIST_MODEL", "gpt-4o-mini")
+CHECKLIST_CACHE_SIZE = int(os.getenv("CHECKLIST_CACHE_SIZE", "1024"))
+CHECKLIST_TTL = float(os.getenv("CHECKLIST_TTL", str(24 * 3600)))
+CHECKLIST_WORKERS = int(os.getenv("CHECKLIST_WORKERS", "4"))
+
+_BULLET = re.compile(r"^\s*(?:[-*•]|\d+[.)]|\[\s?\])\s*")
+
+_cache: TTLCache = TTLCache(maxsize=CHECKLIST_CACHE_SIZE, ttl=CHECKLIST_TTL)
+_inflight: Dict[tuple, Future] = {}
+# (테넌트, 기간) → 마지막으로 PrepItem 에 반영한 신호 해시
+_synced: TTLCache = TTLCache(maxsize=CHECKLIST_CACHE_SIZE, ttl=CHECKLIST_TTL)
+_lock = threading.RLock()  # 이미 끝난 작업의 done 콜백은 submit 한 스레드에서 바로 실행된다
+_executor: Optional[ThreadPoolExecutor] = None
+
+def signals_hash(signals: List[Dict]) -> str:
+    canon = sorted((s.get("code", ""), s.get("desc", ""), str(s.get("count", ""))) for s in signals)
+    return hashlib.sha256(json.dumps(canon, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+def _signals_text(signals: List[Dict]) -> str:
+    return "\n".join([f"- {s['code']}: {s['desc']}" for s in signals]) or "- NONE"
+
+def _parse_items(content: str) -> List[str]:
+    items = []
+    for line in (content or "").splitlines():
+        text = _BULLET.sub("", line).strip()
+        if text and not text.startswith(("{", "}", "(")):
+            items.append(text)
+    return items
+
+def _generate(tax_type: str, period: str, signals: List[Dict], user_id: str = "") -> dict:
+    from ..clients.openai_client import call_openai
+
+    tpl = get_template("checklist_v1")
+    resp = call_openai(model=CHECKLIST_MODEL, tenant=user_id,
+                       messages=tpl.messages(taxType=tax_type, period=period, signals=_signals_text(signals)))
+    content = resp.get("choices", [{}])[0].get("message", {}).get("content", "")
+    # LLM 이 체크리스트 형태로 답하지 않으면 신호 설명을 그대로 항목으로 쓴다
+    items = _parse_items(content) or [s["desc"] for s in signals]
+    return {"status": "ready", "items": items, "model": resp.get("model", CHECKLIST_MODEL),
+            "prompt": tpl.hash, "generated_at": datetime.datetime.utcnow().isoformat() + "Z"}
+
+def _done(key: tuple, fut: Future):
+    with _lock:
+        _inflight.pop(key, None)
+        try:
+            _cache[key] = fut.result()
+        except Exception as e:
+            # 실패는 캐시하지 않는다 - 다음 새로고침 때 다시 시도
+            logger.warning(f"체크리스트 생성 실패 {key}: {e}")
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=CHECKLIST_WORKERS, thread_name_prefix="checklist")
+    return _executor
+
+def get_checklist(user_id: Optional[str], period: str, tax_type: str, signals: List[Dict],
+                  wait: float = 0.0) -> dict:
+    """캐시된 체크리스트 반환, 없으면 생성을 예약하고 pending 반환 (wait 초까지는 기다림)"""
+    sig_hash = signals_hash(signals)
+    try:
+        prompt = get_template("checklist_v1").hash
+    except KeyError:
+        return {"status": "disabled", "items": [s["desc"] for s in signals], "signals_hash": sig_hash}
+    key = (user_id or "", period, tax_type, sig_hash, prompt)
+
+    with _lock:
+        cached = _cache.get(key)
+    if cached is not None:
+        CACHE_REQUESTS.inc(cache="checklist", result="hit")
+        return dict(cached, signals_hash=sig_hash, cached=True)
+    if not budget.allows(user_id, deferrable=True):
+        # 다음 새로고침(예산 회복 후)으로 미룬다
+        CACHE_REQUESTS.inc(cache="checklist", result="miss")
+        return {"status": "deferred", "items": [s["desc"] for s in signals], "signals_hash": sig_hash,
+                "cached": False, "budget": budget.degraded("checklist", user_id)}
+    with _lock:
+        cached = _cache.get(key)
+        if cached is None:
+            fut = _inflight.get(key)
+            if fut is None:
+                fut = _inflight[key] = _get_executor().submit(_generate, tax_type, period, signals, key[0])
+                fut.add_done_callback(lambda f, k=key: _done(k, f))
+    if cached is not None:
+        CACHE_REQUESTS.inc(cache="checklist", result="hit")
+        return dict(cached, signals_hash=sig_hash, cached=True)
+
+    CACHE_REQUESTS.inc(cache="checklist", result="miss")
+    if wait > 0:
+        try:
+            return dict(fut.result(timeout=wait), signals_hash=sig_hash, cached=False)
+        except Exception:
+            pass
+    return {"status": "pending", "items": [], "signals_hash": sig_hash, "cached": False}
+
+def upsert_prep_items(db: Session, user_id: Optional[str], period: str, signals: List[Dict]) -> Tuple[int, bool]:
+    """신호별 PrepItem upsert + 사라진 신호 항목 해결 처리 - (항목 수, DB 변경 여부)"""
+    sync_key = (user_id or "", period)
+    sig_hash = signals_hash(signals)
+    with _lock:
+        if _synced.get(sync_key) == sig_hash:
+            return len(signals), False
+
+    q = db.query(PrepItem).filter(tenant_filter(PrepItem, user_id), PrepItem.period == period,
+                                  PrepItem.target_ref == "")
+    existing: Dict[str, PrepItem] = {}
+    for item in q.order_by(PrepItem.id):
+        if item.type in existing:
+            db.delete(item)  # 예전 방식으로 쌓인 중복 행 정리
+        else:
+            existing[item.type] = item
+
+    now = datetime.datetime.utcnow()
+    current = set()
+    for s in signals:
+        current.add(s["code"])
+        item = existing.get(s["code"])
+        if item is None:
+            db.add(PrepItem(user_id=stamp(user_id), period=period, type=s["code"], target_ref="",
+                            status="OPEN", fix_hint=s["desc"], updated_at=now))
+        elif item.fix_hint != s["desc"] or item.status == "RESOLVED":
+            item.fix_hint = s["desc"]
+            item.status = "OPEN"
+            item.updated_at = now
+    for code, item in existing.items():
+        if code not in current and item.status == "OPEN":
+            item.status = "RESOLVED"
+            item.updated_at = now
+    db.commit()
+    with _lock:
+        _synced[sync_key] = sig_hash
+    return len(signals), True
+
+def invalidate(user_id: Optional[str] = None, period: Optional[str] = None):
+    """PrepItem 을 직접 수정한 경우 호출 - 다음 새로고침에서 다시 upsert"""
+    with _lock:
+        if user_id is None and period is None:
+            _synced.clear()
+        else:
+            _synced.pop((user_id or "", period), None)
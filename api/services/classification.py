@@ -1,97 +1,271 @@
 from sqlalchemy.orm import Session
 from ..db.models import NormalizedEntry, ClassifiedEntry
-import os, json, pathlib, re
-
-# load ruleset v0.2
-RULES_PATH = pathlib.Path(__file__).resolve().parents[2] / "rules" / "vat_rules_v0_2.json"
-RULES = json.loads(open(RULES_PATH, "r", encoding="utf-8").read())
-
-def rule_summary() -> str:
-    return "룰셋 v0.2 적용"
-
-def rules_classify(entry: NormalizedEntry) -> dict:
-    memo = (entry.memo or "")
-    vendor = (entry.vendor or "")
-    # vendor hints
-    vhint = RULES.get("vendor_hints", {}).get(vendor)
-    if vhint:
-        return {"account_code": vhint.get("default_account","기타비용"),
-                "tax_type": vhint.get("default_tax_type","과세"),
-                "confidence": 0.8,
-                "reason": "업체 힌트 매칭",
-                "flags": "[]"}
-
-    # non-deductible categories
-    for cat, kws in RULES["non_deductible"]["keywords"].items():
-        if any(k in memo for k in kws):
-            reason = RULES["non_deductible"]["reason_map"].get(cat, "불공제")
-            account = RULES["account_mapping"].get(kws[0], "기타비용")
-            return {"account_code": account, "tax_type":"불공제", "confidence":0.78,
-                    "reason": reason, "flags":"[\"NON_DEDUCTIBLE\"]"}
-
-    # zero/exempt hints
-    if any(k in memo for k in RULES["classify_hints"]["zero_rated_keywords"]):
-        return {"account_code":"매출","tax_type":"과세","confidence":0.72,
-                "reason":"영세율 후보","flags":"[\"ZERO_RATED_CANDIDATE\"]"}
-    if any(k in memo for k in RULES["classify_hints"]["exempt_keywords"]):
-        return {"account_code":"매출","tax_type":"면세","confidence":0.72,
-                "reason":"면세 키워드","flags":"[\"EXEMPT\"]"}
-
-    # sales / purchase
-    if any(k in memo for k in RULES["classify_hints"]["sales_keywords"]):
-        return {"account_code":"매출","tax_type":"과세","confidence":0.7,"reason":"매출 키워드","flags":"[]"}
-    if any(k in memo for k in RULES["classify_hints"]["purchase_keywords"]):
-        mapped = RULES["account_mapping"].get("소모품","소모품비")
-        return {"account_code":mapped,"tax_type":"과세","confidence":0.68,"reason":"매입 키워드","flags":"[]"}
-
-    return {"account_code":"기타비용","tax_type":"과세","confidence":0.55,
-            "reason":"규칙 불일치 기본값","flags":"[\"LOW_CONFIDENCE\"]"}
-
-def llm_refine_strict(entry: NormalizedEntry, initial: dict) -> dict:
+from ..db.tenancy import tenant_filter
+from ..utils.metrics import CLASSIFY_ROWS, CLASSIFY_SECONDS
+from .vendors import VendorIndex, load_aliases
+from .rulesets import CompiledRuleset, current_ruleset
+from ..clients.circuit import CircuitOpenError
+from ..clients import budget
+from .corrections import MEMORY
+from .prompts import get_template
+from . import analytics, neighbors
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import os, json, time, threading
+
+# 분류 경로별 model_used 기록값 (룰/LLM 경로는 적용한 룰셋 버전을 기록)
+MODEL_USED = {"memory": "user-memory", "knn": neighbors.MODEL_NAME}
+# 룰 신뢰도가 이보다 낮으면 kNN → LLM 순으로 보정
+LLM_CONFIDENCE_THRESHOLD = float(os.getenv("LLM_CONFIDENCE_THRESHOLD", "0.6"))
+CLASSIFY_BATCH_CONCURRENCY = int(os.getenv("CLASSIFY_BATCH_CONCURRENCY", "8"))
+# 예산 때문에 LLM 보정을 미룬 행 표시 - refine_deferred 가 나중에 다시 보정
+DEFERRED_FLAG = "LLM_DEFERRED"
+
+def _defer(pred: dict) -> dict:
+    flags = json.loads(pred.get("flags") or "[]")
+    if DEFERRED_FLAG not in flags:
+        flags.append(DEFERRED_FLAG)
+    pred["flags"] = json.dumps(flags, ensure_ascii=False)
+    pred["reason"] += " | LLM 보류(예산)"
+    return pred
+
+def vendor_index() -> VendorIndex:
+    """활성 룰셋의 거래처 대표명 색인"""
+    return current_ruleset().vendor_index
+
+def rule_summary(ruleset: Optional[CompiledRuleset] = None) -> str:
+    return (ruleset or current_ruleset()).summary()
+
+def rules_classify(entry: NormalizedEntry, ruleset: Optional[CompiledRuleset] = None) -> dict:
+    return (ruleset or current_ruleset()).classify(entry.vendor, entry.memo)
+
+def llm_refine_strict(entry: NormalizedEntry, initial: dict,
+                      ruleset: Optional[CompiledRuleset] = None) -> Tuple[dict, bool]:
+    """LLM 보정 → (결과, LLM 결과인지) - 실패하면 사유를 덧붙인 initial 과 False (예산 초과는 보류 표시)"""
     try:
-        from ..clients.openai_client import call_openai
-        from ..validators.classify import validate_classification
-        import yaml
-        TPL_PATH = pathlib.Path(__file__).resolve().parents[2] / "prompts" / "templates.yaml"
-        tpl = yaml.safe_load(open(TPL_PATH, "r", encoding="utf-8"))
-        sys = tpl["classify_v1"]["system"] + " 반드시 JSON만 출력하라. 키: account_code, tax_type, confidence, reason, flags"
-        user_t = tpl["classify_v1"]["user_template"]
-        msg = user_t.format(
+        from ..clients.openai_client import call_hedged, parse_json_content
+        from ..clients.hedging import InvalidResponse
+        from ..validators.classify import CLASSIFICATION_SCHEMA, coerce_classification, validate_classification
+        tpl = get_template("classify_v1")
+        messages = tpl.messages(
+            " 반드시 JSON만 출력하라. 키: account_code, tax_type, confidence, reason, flags",
             trx_date=entry.trx_date, vendor=entry.vendor, amount=entry.amount, vat=entry.vat,
-            memo=entry.memo, industry="서비스", biz_type="간편장부", hints="", rule_summary=rule_summary()
+            memo=entry.memo, industry="서비스", biz_type="간편장부", hints="", rule_summary=rule_summary(ruleset)
         )
-        resp = call_openai(model=os.getenv("OPENAI_MODEL_GENERAL","gpt-4.1-mini"),
-                           messages=[{"role":"system","content":sys},{"role":"user","content":msg}], temperature=0)
-        content = resp.get("choices",[{}])[0].get("message",{}).get("content","{}")
-        try:
-            parsed = json.loads(content)
-        except Exception:
-            m = re.search(r"\{[\s\S]*\}", content)
-            parsed = json.loads(m.group(0)) if m else {}
-        ok, why = validate_classification(parsed) if parsed else (False, "empty")
-        if ok:
-            parsed["flags"] = json.dumps(parsed.get("flags", []), ensure_ascii=False)
+        invalid = []
+
+        def accept(resp: dict) -> Optional[dict]:
+            content = resp.get("choices",[{}])[0].get("message",{}).get("content","{}")
+            parsed = parse_json_content(content, resp.get("model", ""))
+            # 표기만 어긋난 응답(영세율, "85%" 등)은 보정해서 쓴다 - 이미 비용을 낸 응답
+            parsed = coerce_classification(parsed) or parsed
+            ok, why = validate_classification(parsed) if parsed else (False, "empty")
+            if not ok:
+                invalid.append(why)
+                return None
             return parsed
-        initial["reason"] += f" | LLM JSON invalid: {why}"
-        return initial
+
+        try:
+            _, parsed, _, _ = call_hedged("refine", os.getenv("OPENAI_MODEL_GENERAL","gpt-4.1-mini"),
+                                          messages, accept, tenant=entry.user_id or "",
+                                          schema=CLASSIFICATION_SCHEMA, temperature=0)
+        except InvalidResponse:
+            initial["reason"] += f" | LLM JSON invalid: {invalid[0] if invalid else 'empty'}"
+            return initial, False
+        parsed["reason"] = parsed.get("reason") or parsed.pop("reasoning", "")
+        parsed["flags"] = json.dumps(parsed.get("flags", []), ensure_ascii=False)
+        return parsed, True
+    except budget.BudgetExceeded:
+        return _defer(initial), False
+    except CircuitOpenError:
+        # 업스트림 장애 중 - 기다리지 않고 룰 결과 그대로
+        initial["reason"] += " | LLM 차단(장애 감지)"
+        return initial, False
     except Exception:
         initial["reason"] += " | LLM 예외"
-        return initial
+        return initial, False
 
 def classify_entries_for_file(db: Session, file_id: str) -> int:
     rows = db.query(NormalizedEntry).filter(NormalizedEntry.file_id==file_id).all()
-    count = 0
+    load_aliases(db)  # 다른 워커가 저장/수정한 거래처 매핑 반영 (VENDOR_ALIAS_TTL 주기)
+    # 파일 하나는 같은 룰셋 버전으로 끝까지 분류 (도중에 교체되어도 영향 없음)
+    ruleset = current_ruleset()
+    results = []
     for e in rows:
-        pred = rules_classify(e)
-        if pred["confidence"] < 0.6:
-            pred = llm_refine_strict(e, pred)
+        started = time.perf_counter()
+        # 사용자 수정 이력이 있으면 룰/LLM 없이 그대로 사용
+        learned = MEMORY.lookup(db, e.user_id, e.vendor, e.memo, ruleset.vendor_index)
+        if learned:
+            pred = {"account_code": learned[0], "tax_type": learned[1], "confidence": 0.95,
+                    "reason": "사용자 수정 이력", "flags": "[\"LEARNED\"]"}
+            path = "memory"
+        else:
+            pred = rules_classify(e, ruleset)
+            path = "rules"
+        results.append([e, pred, path, time.perf_counter() - started])
+
+    # 룰 신뢰도가 낮은 행: 로컬 kNN 으로 한 번에 조회하고, 이웃이 합의하지 못한 행만 LLM 호출
+    low = [r for r in results if r[1]["confidence"] < LLM_CONFIDENCE_THRESHOLD]
+    if low:
+        started = time.perf_counter()
+        hits = neighbors.predict_many(db, [r[0] for r in low])
+        per_row = (time.perf_counter() - started) / len(low)
+        for r, hit in zip(low, hits):
+            r[3] += per_row
+            if hit:
+                r[1], r[2] = hit, "knn"
+                continue
+            if not budget.allows(r[0].user_id, deferrable=True):
+                # 예산 한도 근처 - 배치 LLM 보정은 미루고 룰 결과로 저장
+                budget.degraded("classify_file", r[0].user_id)
+                r[1], r[2] = _defer(r[1]), "deferred"
+                continue
+            started = time.perf_counter()
+            r[1], refined = llm_refine_strict(r[0], r[1], ruleset)
+            r[2] = "deferred" if DEFERRED_FLAG in r[1]["flags"] else "llm" if refined else "rules"
+            r[3] += time.perf_counter() - started
+
+    count = 0
+    for e, pred, path, elapsed in results:
+        CLASSIFY_ROWS.inc(path=path)
+        CLASSIFY_SECONDS.inc(elapsed, path=path)
         ce = ClassifiedEntry(entry_id=e.id,
                              account_code=pred["account_code"],
                              tax_type=pred["tax_type"],
                              confidence=str(pred["confidence"]),
-                             model_used="rules-v0.2+llm",
+                             model_used=MODEL_USED.get(path) or (ruleset.tag + "+llm" if path == "llm" else ruleset.tag),
                              reason=pred["reason"],
                              flags=pred["flags"])
         db.merge(ce); count += 1
+    MEMORY.flush_hits(db)
     db.commit()
     return count
+
+_batch_executor: Optional[ThreadPoolExecutor] = None
+_batch_lock = threading.Lock()
+
+def _get_batch_executor() -> ThreadPoolExecutor:
+    global _batch_executor
+    with _batch_lock:
+        if _batch_executor is None:
+            _batch_executor = ThreadPoolExecutor(max_workers=CLASSIFY_BATCH_CONCURRENCY, thread_name_prefix="classify-batch")
+    return _batch_executor
+
+def _llm_classify(vendor: str, amount: float, memo: str, user_id: str) -> Tuple[Optional[dict], str]:
+    """LLM 분류 1건 → (결과, 실패 사유) - 실패해도 예외 없이 호출부가 룰 결과를 유지"""
+    from ..clients.openai_client import classify_transaction
+    try:
+        return classify_transaction(vendor, amount, memo, endpoint="classify-batch", user_id=user_id), ""
+    except CircuitOpenError:
+        return None, "LLM 차단(장애 감지)"
+    except budget.BudgetExceeded as e:
+        budget.degraded("classify_batch", user_id)
+        return None, f"LLM 생략(예산 {e.mode})"
+    except Exception as e:
+        return None, f"LLM 오류: {e}"
+
+def classify_batch(db: Session, user_id: str, items: List[Tuple[str, float, str]],
+                   use_llm: bool = True) -> List[dict]:
+    """
+    거래 여러 건 한 번에 분류 → 입력 순서대로 결과
+    같은 (거래처, 메모) 는 한 번만 분류하고, 사용자 수정 이력 → 룰 → kNN 을 전부 먼저 적용한 뒤
+    남은 저신뢰 건만 LLM 에 동시에 보낸다 (결과 캐시/예산/회로 차단은 classify_transaction 이 처리).
+    """
+    ruleset = current_ruleset()
+    load_aliases(db)
+    first: Dict[Tuple[str, str], int] = {}
+    for i, (vendor, _, memo) in enumerate(items):
+        first.setdefault(((vendor or "").strip(), (memo or "").strip()), i)
+
+    started = time.perf_counter()
+    unique: Dict[int, list] = {}  # 대표 인덱스 → [결과, 경로, 모델, 토큰]
+    for i in first.values():
+        vendor, _, memo = items[i]
+        learned = MEMORY.lookup(db, user_id, vendor, memo, ruleset.vendor_index)
+        if learned:
+            pred = {"account_code": learned[0], "tax_type": learned[1], "confidence": 0.95,
+                    "reason": "사용자 수정 이력", "flags": "[\"LEARNED\"]"}
+            unique[i] = [pred, "memory", MODEL_USED["memory"], None]
+        else:
+            unique[i] = [ruleset.classify(vendor, memo), "rules", ruleset.tag, None]
+
+    low = [i for i, r in unique.items() if r[1] == "rules" and r[0]["confidence"] < LLM_CONFIDENCE_THRESHOLD]
+    if low:
+        probes = [NormalizedEntry(vendor=items[i][0], memo=items[i][2], user_id=user_id) for i in low]
+        residue = []
+        for i, hit in zip(low, neighbors.predict_many(db, probes)):
+            if hit:
+                unique[i][:3] = [hit, "knn", MODEL_USED["knn"]]
+            else:
+                residue.append(i)
+        if use_llm and residue:
+            futures = {i: _get_batch_executor().submit(_llm_classify, *items[i], user_id) for i in residue}
+            for i, fut in futures.items():
+                result, why = fut.result()
+                r = unique[i]
+                if result is None:
+                    r[0]["reason"] += f" | {why}"
+                    continue
+                cached = result.get("cache") == "hit"
+                r[0] = {"account_code": result["account_code"], "tax_type": result["tax_type"],
+                        "confidence": result.get("confidence", 0.5), "reason": result.get("reasoning", ""),
+                        "flags": json.dumps(["AI_분류"], ensure_ascii=False)}
+                r[1], r[2] = ("cache" if cached else "llm"), result.get("model_used", "llm")
+                r[3] = None if cached else result.get("usage")
+
+    per_row = (time.perf_counter() - started) / max(len(unique), 1)
+    for pred, path, _, _ in unique.values():
+        CLASSIFY_ROWS.inc(path=path)
+        CLASSIFY_SECONDS.inc(per_row, path=path)
+    CLASSIFY_ROWS.inc(len(items) - len(unique), path="dedup")
+    if MEMORY.flush_hits(db):
+        db.commit()
+
+    out = []
+    for i, (vendor, _, memo) in enumerate(items):
+        rep = first[((vendor or "").strip(), (memo or "").strip())]
+        pred, path, model_used, usage = unique[rep]
+        if rep != i:
+            path, usage = "dedup", None  # 토큰은 대표 건에만 계산
+        out.append({"index": i, "account_code": pred["account_code"], "tax_type": pred["tax_type"],
+                    "confidence": pred["confidence"], "reason": pred["reason"],
+                    "flags": json.loads(pred.get("flags") or "[]"),
+                    "path": path, "duplicate_of": None if rep == i else rep, "model_used": model_used,
+                    "tokens": {"input": (usage or {}).get("prompt_tokens", 0),
+                               "output": (usage or {}).get("completion_tokens", 0),
+                               "cache": "miss" if usage else "hit" if path in ("cache", "dedup") else "none"}})
+    return out
+
+def refine_deferred(db: Session, user_id: Optional[str], limit: int = 100) -> Dict[str, int]:
+    """예산 때문에 미룬 행을 다시 LLM 보정 - 예산이 다시 full 단계일 때만 진행
+    LLM 보정에 실패한 행(회로 차단, 잘못된 응답 등)은 보류 표시를 그대로 두어 다음 호출에서 다시 시도한다."""
+    q = db.query(NormalizedEntry, ClassifiedEntry) \
+        .join(ClassifiedEntry, ClassifiedEntry.entry_id == NormalizedEntry.id) \
+        .filter(tenant_filter(NormalizedEntry, user_id), ClassifiedEntry.flags.like(f"%{DEFERRED_FLAG}%"))
+    pending = q.count()
+    rows = q.order_by(NormalizedEntry.id).limit(limit).all()
+    ruleset = current_ruleset()
+    refined = failed = 0
+    for e, ce in rows:
+        if not budget.allows(user_id, deferrable=True):
+            break
+        flags = [f for f in json.loads(ce.flags or "[]") if f != DEFERRED_FLAG]
+        initial = {"account_code": ce.account_code, "tax_type": ce.tax_type, "confidence": float(ce.confidence or 0),
+                   "reason": (ce.reason or "").replace(" | LLM 보류(예산)", ""),
+                   "flags": json.dumps(flags, ensure_ascii=False)}
+        pred, ok = llm_refine_strict(e, initial, ruleset)
+        if DEFERRED_FLAG in pred["flags"]:
+            break  # 도중에 다시 한도 도달
+        if not ok:
+            failed += 1
+            continue
+        ce.account_code, ce.tax_type, ce.confidence = pred["account_code"], pred["tax_type"], str(pred["confidence"])
+        ce.reason, ce.flags, ce.model_used = pred["reason"], pred["flags"], ruleset.tag + "+llm"
+        CLASSIFY_ROWS.inc(path="llm")
+        refined += 1
+    db.commit()
+    if refined:
+        # 분류 수정(PUT)과 같이 세금 집계/이웃 색인 다시 적재
+        analytics.invalidate(user_id or "")
+        neighbors.invalidate(user_id or "")
+    return {"refined": refined, "failed": failed, "remaining": pending - refined, "mode": budget.mode(user_id)}
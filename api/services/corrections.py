@@ -0,0 +1,129 @@
+"""
+사용자 수정 이력 기반 분류 학습
+
+사용자가 계정과목/세금유형을 고치면 (테넌트, 대표 거래처명, 메모 시그니처) → (계정과목, 세금유형)
+으로 기억해 두고, 다음 업로드부터는 룰/LLM 보다 먼저 이 값을 사용한다.
+활성 테넌트의 기억은 LRU 캐시에 통째로 올려 두어 조회 1회로 끝난다.
+다른 워커가 저장한 수정도 보이도록 CORRECTION_RECHECK_SECONDS 마다 테넌트 버전(행 수, 최신 updated_at)을
+확인해 바뀌었으면 다시 읽는다. 캐시는 수정이 commit 된 뒤에만 버린다 (롤백된 학습은 보이지 않는다).
+적중 횟수(hits)는 조회 때 메모리에 모았다가 flush_hits 로 한 번에 더한다.
+"""
+
+from sqlalchemy import event, func, update
+from sqlalchemy.orm import Session
+from cachetools import LRUCache
+from ..db.models import ClassificationMemory
+from .vendors import VendorIndex
+from collections import Counter
+from typing import Dict, Optional, Tuple
+import os, re, time, threading, unicodedata, datetime
+
+CORRECTION_CACHE_TENANTS = int(os.getenv("CORRECTION_CACHE_TENANTS", "256"))
+CORRECTION_RECHECK_SECONDS = float(os.getenv("CORRECTION_RECHECK_SECONDS", "2"))
+MEMO_SIGNATURE_LEN = 40
+
+_NOISE = re.compile(r"[\d\W_]+")
+
+Key = Tuple[str, str]
+Label = Tuple[str, str]
+
+def memo_signature(memo: Optional[str]) -> str:
+    """숫자/날짜/기호를 뺀 메모 요약 - "3월 커피 구매(2잔)" 과 "4월 커피 구매" 가 같은 값"""
+    s = unicodedata.normalize("NFKC", memo or "").casefold()
+    s = _NOISE.sub(" ", s)
+    return " ".join(s.split())[:MEMO_SIGNATURE_LEN]
+
+class CorrectionMemory:
+    """테넌트별 학습 결과 LRU 캐시 + DB 동기화"""
+
+    def __init__(self, max_tenants: int = CORRECTION_CACHE_TENANTS):
+        self._cache: LRUCache = LRUCache(maxsize=max_tenants)  # user_id → [버전, 확인 시각, 표]
+        self._lock = threading.Lock()
+        self._hits: Counter = Counter()  # (user_id, key) → 아직 DB 에 더하지 않은 적중 수
+
+    @staticmethod
+    def _version(db: Session, user_id: str) -> tuple:
+        """테넌트 기억의 (행 수, 최신 updated_at) - (user_id, updated_at) 인덱스만 읽는다"""
+        return tuple(db.query(func.count(ClassificationMemory.id), func.max(ClassificationMemory.updated_at))
+                     .filter(ClassificationMemory.user_id == user_id).one())
+
+    def _tenant(self, db: Session, user_id: str) -> Dict[Key, Label]:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(user_id)
+        if cached is not None and now - cached[1] < CORRECTION_RECHECK_SECONDS:
+            return cached[2]
+        version = self._version(db, user_id)
+        if cached is not None and cached[0] == version:
+            cached[1] = now
+            return cached[2]
+        rows = db.query(ClassificationMemory.vendor_canonical, ClassificationMemory.memo_signature,
+                        ClassificationMemory.account_code, ClassificationMemory.tax_type) \
+            .filter(ClassificationMemory.user_id == user_id).all()
+        table = {(r.vendor_canonical, r.memo_signature): (r.account_code, r.tax_type) for r in rows}
+        with self._lock:
+            self._cache[user_id] = [version, now, table]
+        return table
+
+    def lookup(self, db: Session, user_id: Optional[str], vendor: Optional[str], memo: Optional[str],
+               index: VendorIndex) -> Optional[Label]:
+        user_id = user_id or ""
+        table = self._tenant(db, user_id)
+        if not table:
+            return None
+        key = (index.canonical(vendor or ""), memo_signature(memo))
+        label = table.get(key)
+        if label is not None:
+            with self._lock:
+                self._hits[(user_id, key)] += 1
+        return label
+
+    def flush_hits(self, db: Session) -> int:
+        """모아 둔 적중 수를 DB 에 더한다 - commit 은 호출자가 한다 (updated_at 은 건드리지 않아 버전이 바뀌지 않는다)"""
+        with self._lock:
+            pending, self._hits = self._hits, Counter()
+        for (user_id, (vendor, signature)), n in pending.items():
+            db.execute(update(ClassificationMemory)
+                       .where(ClassificationMemory.user_id == user_id,
+                              ClassificationMemory.vendor_canonical == vendor,
+                              ClassificationMemory.memo_signature == signature)
+                       .values(hits=ClassificationMemory.hits + n, updated_at=ClassificationMemory.updated_at))
+        return len(pending)
+
+    def learn(self, db: Session, user_id: Optional[str], vendor: Optional[str], memo: Optional[str],
+              account_code: str, tax_type: str, index: VendorIndex):
+        """수정 내용을 기억 (DB upsert) - commit 은 호출자가 하고, 캐시는 commit 이 성공한 뒤에 버린다"""
+        user_id = user_id or ""
+        key = (index.canonical(vendor or ""), memo_signature(memo))
+        row = db.query(ClassificationMemory).filter(
+            ClassificationMemory.user_id == user_id,
+            ClassificationMemory.vendor_canonical == key[0],
+            ClassificationMemory.memo_signature == key[1]
+        ).first()
+        if row is None:
+            row = ClassificationMemory(user_id=user_id, vendor_canonical=key[0], memo_signature=key[1], hits=0)
+            db.add(row)
+        row.account_code = account_code
+        row.tax_type = tax_type
+        row.updated_at = datetime.datetime.utcnow()
+        db.info.setdefault(_PENDING, set()).add(user_id)
+
+    def invalidate(self, user_id: Optional[str] = None):
+        with self._lock:
+            if user_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(user_id or "", None)
+
+MEMORY = CorrectionMemory()
+
+_PENDING = "corrections_pending"  # Session.info 키 - commit 을 기다리는 학습의 테넌트
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session: Session):
+    for user_id in session.info.pop(_PENDING, ()):
+        MEMORY.invalidate(user_id)
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_rolled_back(session: Session, previous_transaction):
+    session.info.pop(_PENDING, None)
@@ -0,0 +1,257 @@
+"""
+로컬 최근접 이웃 분류기 (LLM 사전 필터)
+
+이미 분류된 거래의 거래처+메모를 문자 n-gram 해싱 벡터로 만들어 NumPy 행렬로 들고 있다가,
+룰 신뢰도가 낮은 거래를 코사인 유사도 top-k 로 찾아 이웃들의 라벨이 충분히 일치하면
+OpenAI 호출 없이 그 라벨을 쓴다. CPU 만 사용하며 외부 호출이 없다.
+
+- 색인은 테넌트별로 따로 만든다 (다른 테넌트의 수정/학습 라벨이 섞이지 않게)
+- 같은 (텍스트, 라벨) 조합은 한 행으로 합치고 건수를 가중치로 둔다
+- 색인은 KNN_MAX_AGE 마다, 또는 그 테넌트의 분류 수정 시(invalidate) 다시 만든다 (잠금도 테넌트별)
+- 행이 KNN_IVF_MIN 이상이면 구면 k-means 로 IVF 색인을 만들어 nprobe 개 클러스터만 탐색
+"""
+
+from sqlalchemy.orm import Session
+from ..db.models import NormalizedEntry, ClassifiedEntry
+from ..db.tenancy import ANONYMOUS, TenantVersions, tenant_filter
+from cachetools import TTLCache
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import os, time, zlib, threading, functools, unicodedata, logging
+
+logger = logging.getLogger(__name__)
+
+KNN_ENABLED = os.getenv("ENABLE_KNN", "true").lower() not in ("0", "false", "no")
+KNN_DIM = int(os.getenv("KNN_DIM", "512"))
+KNN_K = int(os.getenv("KNN_K", "7"))
+KNN_MIN_SIM = float(os.getenv("KNN_MIN_SIM", "0.55"))        # 이보다 먼 이웃은 투표에서 제외
+KNN_AGREEMENT = float(os.getenv("KNN_AGREEMENT", "0.8"))     # 최다 라벨의 가중 득표율
+KNN_MIN_VOTES = int(os.getenv("KNN_MIN_VOTES", "3"))         # 유효 이웃(건수 합) 최소치
+KNN_MIN_CONFIDENCE = float(os.getenv("KNN_MIN_CONFIDENCE", "0.7"))  # 학습에 쓸 분류 신뢰도
+KNN_MAX_ROWS = int(os.getenv("KNN_MAX_ROWS", "200000"))
+KNN_IVF_MIN = int(os.getenv("KNN_IVF_MIN", "20000"))
+KNN_NPROBE = int(os.getenv("KNN_NPROBE", "8"))
+KNN_MAX_AGE = float(os.getenv("KNN_MAX_AGE", "300"))
+KNN_MAX_TENANTS = int(os.getenv("KNN_MAX_TENANTS", "64"))    # 메모리에 들고 있을 테넌트 색인 수
+KNN_SEARCH_CHUNK = int(os.getenv("KNN_SEARCH_CHUNK", "1024"))  # 전수 비교 시 한 번에 곱할 질의 수
+
+MODEL_NAME = "knn-v1"
+# 신뢰할 수 있는 출처 (사용자 수정/학습 결과는 신뢰도와 무관하게 포함)
+TRUSTED_MODELS = ("user", "user-memory")
+
+Label = Tuple[str, str]
+
+@functools.lru_cache(maxsize=100000)
+def _features(text: str, dim: int) -> Tuple[Tuple[int, ...], Tuple[float, ...]]:
+    """문자 2/3-gram 해시 → (인덱스, 부호) - 해시 부호로 충돌 편향을 줄인다"""
+    s = " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+    if not s:
+        return (), ()
+    padded = f" {s} "
+    idx: List[int] = []
+    sign: List[float] = []
+    for n in (2, 3):
+        for i in range(len(padded) - n + 1):
+            h = zlib.crc32(padded[i:i + n].encode("utf-8"))
+            idx.append(h % dim)
+            sign.append(1.0 if h & 0x80000000 else -1.0)
+    return tuple(idx), tuple(sign)
+
+def embed(texts: Sequence[str], dim: int = KNN_DIM) -> np.ndarray:
+    """텍스트 목록 → L2 정규화된 (n, dim) float32 행렬"""
+    mat = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, t in enumerate(texts):
+        idx, sign = _features(t or "", dim)
+        if idx:
+            np.add.at(mat[row], np.asarray(idx), np.asarray(sign, dtype=np.float32))
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    np.divide(mat, norms, out=mat, where=norms > 0)
+    return mat
+
+def entry_text(vendor: Optional[str], memo: Optional[str]) -> str:
+    return f"{vendor or ''} | {memo or ''}"
+
+class _IVF:
+    """구면 k-means 역파일 색인 - 질의마다 가까운 nprobe 개 클러스터의 행만 비교"""
+
+    def __init__(self, mat: np.ndarray, nlist: int, iters: int = 8, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        sample = mat[rng.choice(len(mat), size=min(len(mat), nlist * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iters):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[assign == c]
+                if len(members):
+                    v = members.sum(axis=0)
+                    centroids[c] = v / (np.linalg.norm(v) or 1.0)
+        self.centroids = centroids
+        assign = np.concatenate([np.argmax(mat[i:i + 8192] @ centroids.T, axis=1)
+                                 for i in range(0, len(mat), 8192)])
+        self.order = np.argsort(assign, kind="stable")
+        self.offsets = np.searchsorted(assign[self.order], np.arange(nlist + 1))
+
+    def candidates(self, q: np.ndarray, nprobe: int) -> np.ndarray:
+        probes = np.argsort(-(self.centroids @ q))[:nprobe]
+        return np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in probes])
+
+class NeighborIndex:
+    """분류 완료 거래 벡터 행렬 + 라벨"""
+
+    def __init__(self, version: tuple, texts: List[str], labels: List[Label], weights: List[int],
+                 members: Dict[int, int]):
+        self.version = version
+        uniq = {l: i for i, l in enumerate(dict.fromkeys(labels))}
+        self.label_values: List[Label] = list(uniq)
+        self.label_codes = np.asarray([uniq[l] for l in labels], dtype=np.int32)
+        self.weights = np.asarray(weights, dtype=np.float32)
+        # entry_id → 그 거래가 합쳐진 행 (재분류 시 그 행에서 자기 몫의 가중치를 빼는 데 사용)
+        self.members = members
+        self.matrix = embed(texts)
+        self.size = len(texts)
+        self.ivf: Optional[_IVF] = None
+        if self.size >= KNN_IVF_MIN:
+            self.ivf = _IVF(self.matrix, nlist=int(np.sqrt(self.size)))
+
+    def row_of(self, entry_id: Optional[int]) -> int:
+        """entry_id 가 합쳐진 색인 행 (색인에 없는 거래는 -1)"""
+        row = self.members.get(entry_id) if entry_id is not None else None
+        return -1 if row is None else row
+
+    def exclusion(self, own: int) -> np.ndarray:
+        """탐색에서 뺄 행 - 자기 자신만 든 행(가중치 1)만 뺀다. 같은 텍스트의 다른 거래가 있으면 남겨 두고
+        vote 에서 자기 몫만 뺀다"""
+        return np.asarray([own] if own >= 0 and self.weights[own] <= 1 else [], dtype=np.int64)
+
+    def search(self, queries: np.ndarray, k: int = KNN_K, exclude: Optional[Sequence[np.ndarray]] = None):
+        """질의별 (행 인덱스, 유사도) top-k 목록 - exclude[i] 는 i번째 질의에서 제외할 색인 행"""
+        results = []
+        if self.ivf is None:
+            # 질의 × 색인 유사도 행렬은 KNN_SEARCH_CHUNK 행씩만 만든다
+            rows = np.arange(self.size)
+            for i in range(0, len(queries), KNN_SEARCH_CHUNK):
+                sims_chunk = queries[i:i + KNN_SEARCH_CHUNK] @ self.matrix.T
+                if exclude is not None:
+                    for j, own in enumerate(exclude[i:i + KNN_SEARCH_CHUNK]):
+                        sims_chunk[j, own] = -1.0
+                results.extend(_topk(rows, sims, k) for sims in sims_chunk)
+            return results
+        for i, q in enumerate(queries):
+            cand = self.ivf.candidates(q, KNN_NPROBE)
+            if exclude is not None and len(exclude[i]):
+                cand = cand[~np.isin(cand, exclude[i])]
+            results.append(_topk(cand, self.matrix[cand] @ q, k))
+        return results
+
+    def vote(self, rows: np.ndarray, sims: np.ndarray, own: int = -1) -> Optional[dict]:
+        """이웃 가중 투표 - own 은 질의 거래가 합쳐진 행 (그 행의 가중치에서 자기 몫 1건을 뺀다)"""
+        weights = self.weights[rows]
+        if own >= 0:
+            weights = np.where(rows == own, weights - 1, weights)
+        keep = (sims >= KNN_MIN_SIM) & (weights > 0)
+        rows, sims, weights = rows[keep], sims[keep], weights[keep]
+        if not len(rows) or weights.sum() < KNN_MIN_VOTES:
+            return None
+        scores = np.bincount(self.label_codes[rows], weights=sims * weights,
+                             minlength=len(self.label_values))
+        best = int(np.argmax(scores))
+        agreement = float(scores[best] / scores.sum())
+        if agreement < KNN_AGREEMENT:
+            return None
+        account_code, tax_type = self.label_values[best]
+        return {"account_code": account_code, "tax_type": tax_type,
+                "confidence": round(min(0.9, 0.6 + 0.3 * agreement * float(sims.max())), 2),
+                "reason": f"유사 거래 {len(rows)}건 일치 ({agreement:.0%})",
+                "flags": "[\"KNN\"]"}
+
+def _topk(rows: np.ndarray, sims: np.ndarray, k: int):
+    if len(rows) > k:
+        part = np.argpartition(-sims, k)[:k]
+        rows, sims = rows[part], sims[part]
+    order = np.argsort(-sims)
+    return rows[order], sims[order]
+
+# 테넌트 → 색인 (KNN_MAX_AGE 가 지나면 다시 만든다)
+_indexes: TTLCache = TTLCache(maxsize=KNN_MAX_TENANTS, ttl=KNN_MAX_AGE)
+_indexes_lock = threading.Lock()
+_versions = TenantVersions()
+
+def invalidate(user_id: Optional[str] = None):
+    """분류 수정 시 호출 - 다음 조회 때 그 테넌트의 색인을 다시 만든다 (None 이면 전체)"""
+    _versions.bump(user_id)
+
+def _load(db: Session, user_id: Optional[str], version: tuple) -> NeighborIndex:
+    started = time.perf_counter()
+    grouped: Dict[Tuple[str, Label], List] = {}  # (텍스트, 라벨) → [entry_id 목록, 건수]
+    q = db.query(NormalizedEntry.id, NormalizedEntry.vendor, NormalizedEntry.memo,
+                 ClassifiedEntry.account_code, ClassifiedEntry.tax_type, ClassifiedEntry.confidence,
+                 ClassifiedEntry.model_used) \
+        .join(ClassifiedEntry, ClassifiedEntry.entry_id == NormalizedEntry.id) \
+        .filter(tenant_filter(NormalizedEntry, user_id), ClassifiedEntry.account_code.isnot(None)) \
+        .order_by(NormalizedEntry.id.desc())
+    for r in q.execution_options(stream_results=True).yield_per(10000):
+        if r.model_used == MODEL_NAME:
+            continue  # kNN 자신의 결과로 다시 학습하지 않는다
+        if r.model_used not in TRUSTED_MODELS:
+            try:
+                if float(r.confidence or 0) < KNN_MIN_CONFIDENCE:
+                    continue
+            except ValueError:
+                continue
+        key = (entry_text(r.vendor, r.memo), (r.account_code, r.tax_type))
+        acc = grouped.get(key)
+        if acc is None:
+            if len(grouped) >= KNN_MAX_ROWS:
+                continue  # 최신 거래 우선
+            grouped[key] = [[r.id], 1]
+        else:
+            acc[0].append(r.id)
+            acc[1] += 1
+    texts = [k[0] for k in grouped]
+    labels = [k[1] for k in grouped]
+    members = {entry_id: row for row, acc in enumerate(grouped.values()) for entry_id in acc[0]}
+    index = NeighborIndex(version, texts, labels, [v[1] for v in grouped.values()], members)
+    logger.info(f"kNN 색인 적재 ({user_id or '익명'}): {index.size}행{' (IVF)' if index.ivf else ''}, "
+                f"{time.perf_counter() - started:.2f}s")
+    return index
+
+def get_index(db: Session, user_id: Optional[str]) -> NeighborIndex:
+    """테넌트 kNN 색인 반환 - 새 분류 결과는 KNN_MAX_AGE 주기로 반영 (사전 필터라 약간의 지연은 허용)
+
+    재적재(DB 조회·임베딩·IVF)는 테넌트 잠금 안에서만 하므로 다른 테넌트 요청은 기다리지 않는다.
+    """
+    key = user_id or ANONYMOUS
+    version = _versions.get(key)
+    with _indexes_lock:
+        index = _indexes.get(key)
+    if index is not None and index.version == version:
+        return index
+    with _versions.lock(key):
+        with _indexes_lock:
+            index = _indexes.get(key)
+        if index is None or index.version != version:
+            index = _load(db, key, version)
+            with _indexes_lock:
+                _indexes[key] = index
+    return index
+
+def predict_many(db: Session, entries: Sequence[NormalizedEntry]) -> List[Optional[dict]]:
+    """엔트리별 이웃 합의 라벨 (합의가 안 되면 None → LLM 으로 넘긴다)"""
+    results: List[Optional[dict]] = [None] * len(entries)
+    if not KNN_ENABLED or not entries:
+        return results
+    by_tenant: Dict[str, List[int]] = {}
+    for i, e in enumerate(entries):
+        by_tenant.setdefault(e.user_id or ANONYMOUS, []).append(i)
+    for user_id, positions in by_tenant.items():
+        index = get_index(db, user_id)
+        if index.size == 0:
+            continue
+        group = [entries[i] for i in positions]
+        queries = embed([entry_text(e.vendor, e.memo) for e in group])
+        # 자기 자신은 이웃으로 세지 않는다 - 같은 텍스트의 다른 거래(형제 행)의 표는 그대로 둔다
+        own = [index.row_of(e.id) for e in group]
+        exclude = [index.exclusion(r) for r in own]
+        for i, r, (rows, sims) in zip(positions, own, index.search(queries, exclude=exclude)):
+            results[i] = index.vote(rows, sims, own=r)
+    return results
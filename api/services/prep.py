@@ -1,14 +1,199 @@
+"""
+신고 준비 신호(signal) 엔진
+
+각 신호는 필요한 컬럼(needs)을 선언하고 행 단위로 누적(feed)한 뒤 결과를 낸다(finish).
+엔진은 테넌트/과세기간 범위의 엔트리를 한 번의 스트리밍 쿼리로 읽어 모든 신호에 흘려보내므로
+신호를 추가해도 테이블 스캔이 늘지 않는다. 결과는 데이터 버전 기준으로 메모이즈한다.
+
+범위: 거래일이 과세기간에 속하는 엔트리 + 해당 기간으로 업로드된 파일의 엔트리
+"""
+
 from sqlalchemy.orm import Session
-from ..db.models import NormalizedEntry
-from typing import List, Dict
-
-def detect_signals(db: Session, period: str) -> List[Dict]:
-    signals = []
-    has_cash = db.query(NormalizedEntry).filter(NormalizedEntry.memo.like("%현금영수증%")).first()
-    if not has_cash:
-        signals.append({"code":"NO_CASH_RECEIPT","desc":"현금영수증 내역 없음"})
-    if len(period) == 7:
-        mismatch = db.query(NormalizedEntry).filter(~NormalizedEntry.trx_date.like(f"{period}-%")).first()
-        if mismatch:
-            signals.append({"code":"PERIOD_MISMATCH","desc":"선택한 과세기간과 다른 월 자료 포함 가능"})
-    return signals
+from sqlalchemy import or_
+from cachetools import TTLCache
+from ..db.models import ClassifiedEntry, NormalizedEntry, RawFile
+from ..db.tenancy import tenant_filter
+from .vendors import normalize_vendor
+from . import analytics
+from typing import Dict, List, Optional, Set, Type
+import os, datetime, functools, threading
+
+SIGNALS_MAX_AGE = float(os.getenv("SIGNALS_MAX_AGE", "60"))
+SIGNAL_SAMPLE_REFS = 5
+ROUND_AMOUNT_UNIT = int(os.getenv("ROUND_AMOUNT_UNIT", "100000"))
+
+# 신호가 요청할 수 있는 컬럼
+COLUMNS = {
+    "id": NormalizedEntry.id,
+    "trx_date": NormalizedEntry.trx_date,
+    "vendor": NormalizedEntry.vendor,
+    "amount": NormalizedEntry.amount,
+    "vat": NormalizedEntry.vat,
+    "memo": NormalizedEntry.memo,
+    "file_period": RawFile.period,
+    "tax_type": ClassifiedEntry.tax_type,  # 미분류 거래는 None
+}
+
+@functools.lru_cache(maxsize=4096)
+def _weekday(trx_date: str) -> int:
+    try:
+        return datetime.date.fromisoformat(trx_date[:10]).weekday()
+    except (TypeError, ValueError):
+        return -1
+
+class Signal:
+    """신호 플러그인 기본형 - 인스턴스는 평가 1회용"""
+    code = ""
+    needs: Set[str] = set()
+    in_period_only = True  # False 면 기간 밖 엔트리(기간 파일에 섞인 다른 월 자료)도 받는다
+
+    def __init__(self, period: str):
+        self.period = period
+        self.count = 0
+        self.refs: List[int] = []
+
+    def hit(self, entry_id: Optional[int], n: int = 1):
+        self.count += n
+        if entry_id is not None and len(self.refs) < SIGNAL_SAMPLE_REFS:
+            self.refs.append(entry_id)
+
+    def feed(self, row, in_period: bool):
+        raise NotImplementedError
+
+    def describe(self) -> str:
+        raise NotImplementedError
+
+    def finish(self) -> Optional[Dict]:
+        if not self.count:
+            return None
+        return {"code": self.code, "desc": self.describe(), "count": self.count, "refs": self.refs}
+
+SIGNALS: Dict[str, Type[Signal]] = {}
+
+def register(cls: Type[Signal]) -> Type[Signal]:
+    SIGNALS[cls.code] = cls
+    return cls
+
+@register
+class NoCashReceipt(Signal):
+    code = "NO_CASH_RECEIPT"
+    needs = {"memo"}
+
+    def feed(self, row, in_period):
+        if "현금영수증" in (row.memo or ""):
+            self.count += 1
+
+    def finish(self):
+        # 현금영수증 거래가 하나도 없을 때 신호
+        if self.count:
+            return None
+        return {"code": self.code, "desc": "현금영수증 내역 없음", "count": 0, "refs": []}
+
+@register
+class PeriodMismatch(Signal):
+    code = "PERIOD_MISMATCH"
+    needs = {"id", "trx_date"}
+    in_period_only = False
+
+    def feed(self, row, in_period):
+        # 날짜가 비어 있는 행은 다른 월 자료인지 알 수 없으므로 세지 않는다
+        if not in_period and (row.trx_date or "").strip():
+            self.hit(row.id)
+
+    def describe(self):
+        return f"선택한 과세기간과 다른 월 자료 포함 가능 ({self.count}건)"
+
+@register
+class MissingVat(Signal):
+    code = "MISSING_VAT"
+    needs = {"id", "amount", "vat", "tax_type"}
+
+    def feed(self, row, in_period):
+        # 과세 지출만 - 면세/불공제 지출과 수입은 부가세가 0 이어도 정상
+        if row.amount is not None and row.amount < 0 and row.tax_type == "과세" and not row.vat:
+            self.hit(row.id)
+
+    def describe(self):
+        return f"부가세 금액이 비어 있는 과세 지출 {self.count}건"
+
+@register
+class RoundAmount(Signal):
+    code = "ROUND_AMOUNT"
+    needs = {"id", "amount"}
+
+    def feed(self, row, in_period):
+        amount = abs(int(row.amount or 0))
+        if amount >= ROUND_AMOUNT_UNIT and amount % ROUND_AMOUNT_UNIT == 0:
+            self.hit(row.id)
+
+    def describe(self):
+        return f"{ROUND_AMOUNT_UNIT:,}원 단위 정액 거래 {self.count}건 (증빙 확인 필요)"
+
+@register
+class DuplicatePayment(Signal):
+    code = "DUPLICATE_PAYMENT"
+    needs = {"id", "trx_date", "vendor", "amount"}
+
+    def __init__(self, period):
+        super().__init__(period)
+        self.first: Dict[tuple, int] = {}
+
+    def feed(self, row, in_period):
+        if not row.amount or row.amount > 0:
+            return
+        key = (row.trx_date, normalize_vendor(row.vendor or ""), row.amount)
+        if key in self.first:
+            self.hit(row.id)
+        else:
+            self.first[key] = row.id
+
+    def describe(self):
+        return f"같은 날 같은 거래처·금액의 중복 지출 의심 {self.count}건"
+
+@register
+class WeekendSpend(Signal):
+    code = "WEEKEND_SPEND"
+    needs = {"id", "trx_date", "amount"}
+
+    def feed(self, row, in_period):
+        if row.amount is not None and row.amount < 0 and _weekday(row.trx_date or "") >= 5:
+            self.hit(row.id)
+
+    def describe(self):
+        return f"주말 지출 {self.count}건 (업무 관련성 확인)"
+
+_memo: TTLCache = TTLCache(maxsize=512, ttl=SIGNALS_MAX_AGE)
+_memo_lock = threading.Lock()
+
+def evaluate(db: Session, period: str, user_id: str = "",
+             codes: Optional[List[str]] = None) -> List[Dict]:
+    """선택한 신호를 한 번의 스트리밍 패스로 평가"""
+    signals = [SIGNALS[c](period) for c in (codes or SIGNALS)]
+    needs = set().union(*(s.needs for s in signals)) | {"trx_date", "file_period"}
+    cols = [COLUMNS[n].label(n) for n in sorted(needs)]
+
+    q = (db.query(*cols).select_from(NormalizedEntry).outerjoin(RawFile, RawFile.id == NormalizedEntry.file_id)
+         .filter(tenant_filter(NormalizedEntry, user_id)))
+    if "tax_type" in needs:
+        q = q.outerjoin(ClassifiedEntry, ClassifiedEntry.entry_id == NormalizedEntry.id)
+    if period:
+        q = q.filter(or_(NormalizedEntry.trx_date.like(f"{period}%"), RawFile.period == period))
+
+    for row in q.execution_options(stream_results=True).yield_per(5000):
+        in_period = not period or (row.trx_date or "").startswith(period)
+        for s in signals:
+            if in_period or not s.in_period_only:
+                s.feed(row, in_period)
+    return [r for r in (s.finish() for s in signals) if r]
+
+def detect_signals(db: Session, period: str, user_id: str = "") -> List[Dict]:
+    """테넌트/기간 신호 목록 (데이터 버전이 같으면 이전 결과 재사용)"""
+    key = (user_id or "", period, analytics.data_version(db, user_id))
+    with _memo_lock:
+        cached = _memo.get(key)
+    if cached is not None:
+        return [dict(s) for s in cached]
+    result = evaluate(db, period, user_id)
+    with _memo_lock:
+        _memo[key] = result
+    return [dict(s) for s in result]
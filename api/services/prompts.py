@@ -0,0 +1,104 @@
+"""
+프롬프트 템플릿 레지스트리
+
+prompts/templates.yaml 을 한 번만 파싱해 템플릿별 렌더 함수(바인딩된 str.format)와 필드 목록을 들고 있는다.
+파일이 바뀌면(mtime 폴링) 다시 읽어 통째로 교체하고,
+템플릿마다 내용 해시를 버전으로 붙여 LLM 응답 캐시 키에 쓸 수 있게 한다.
+"""
+
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
+from types import MappingProxyType
+import os, time, string, hashlib, pathlib, threading, logging
+import yaml
+
+logger = logging.getLogger(__name__)
+
+PROMPTS_PATH = pathlib.Path(os.getenv("PROMPTS_PATH", str(pathlib.Path(__file__).resolve().parents[2] / "prompts" / "templates.yaml")))
+PROMPTS_CHECK_INTERVAL = float(os.getenv("PROMPTS_CHECK_INTERVAL", "2"))
+
+def _compile(template: str) -> Tuple[Callable[..., str], Tuple[str, ...]]:
+    """템플릿 → (렌더 함수, 필드 목록) - 필드 검증용 파싱은 로드 시 한 번만 한다"""
+    fields = tuple(dict.fromkeys(f for _, f, _, _ in string.Formatter().parse(template) if f))
+    return template.format, fields
+
+class PromptTemplate:
+    """system 문구 + 컴파일된 user 템플릿"""
+
+    __slots__ = ("name", "system", "user_template", "fields", "hash", "_render")
+
+    def __init__(self, name: str, system: str, user_template: str):
+        self.name = name
+        self.system = system or ""
+        self.user_template = user_template or ""
+        self._render, self.fields = _compile(self.user_template)
+        digest = hashlib.sha256(f"{self.system}\0{self.user_template}".encode("utf-8")).hexdigest()
+        self.hash = f"{name}@{digest[:12]}"
+
+    def render(self, **values) -> str:
+        return self._render(**values)
+
+    def messages(self, system_suffix: str = "", **values) -> List[dict]:
+        return [{"role": "system", "content": self.system + system_suffix},
+                {"role": "user", "content": self.render(**values)}]
+
+    def cache_key(self, *parts) -> str:
+        """템플릿 버전 + 입력값 기준 캐시 키 (템플릿이 바뀌면 키도 바뀐다)"""
+        h = hashlib.sha256(self.hash.encode("utf-8"))
+        for p in parts:
+            h.update(b"\0" + str(p).encode("utf-8"))
+        return f"{self.hash}:{h.hexdigest()[:24]}"
+
+class PromptRegistry:
+    """템플릿 파일 감시 + 파싱 결과 보관"""
+
+    def __init__(self, path: pathlib.Path = PROMPTS_PATH, check_interval: float = PROMPTS_CHECK_INTERVAL):
+        self.path = pathlib.Path(path)
+        self.check_interval = check_interval
+        self._mtime: Optional[float] = None
+        self._templates: Mapping[str, PromptTemplate] = MappingProxyType({})
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def reload(self, force: bool = False) -> bool:
+        with self._lock:
+            self._next_check = time.monotonic() + self.check_interval
+            try:
+                mtime = self.path.stat().st_mtime
+            except OSError:
+                if self._mtime is not None:
+                    logger.warning(f"프롬프트 파일 없음, 이전 템플릿 유지: {self.path}")
+                return False
+            if not force and mtime == self._mtime:
+                return False
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    raw = yaml.safe_load(f) or {}
+                templates = {name: PromptTemplate(name, t.get("system", ""), t.get("user_template", ""))
+                             for name, t in raw.items() if isinstance(t, dict)}
+            except Exception as e:
+                logger.warning(f"프롬프트 로드 실패, 이전 템플릿 유지: {e}")
+                return False
+            self._templates = MappingProxyType(templates)
+            self._mtime = mtime
+        logger.info(f"프롬프트 템플릿 로드: {', '.join(t.hash for t in templates.values())}")
+        return True
+
+    def _maybe_reload(self):
+        if time.monotonic() >= self._next_check:
+            self.reload()
+
+    def get(self, name: str) -> PromptTemplate:
+        self._maybe_reload()
+        tpl = self._templates.get(name)
+        if tpl is None:
+            raise KeyError(f"프롬프트 템플릿 없음: {name}")
+        return tpl
+
+    def versions(self) -> Dict[str, str]:
+        self._maybe_reload()
+        return {name: t.hash for name, t in self._templates.items()}
+
+REGISTRY = PromptRegistry()
+
+def get_template(name: str) -> PromptTemplate:
+    return REGISTRY.get(name)
@@ -0,0 +1,194 @@
+"""
+버전별 룰셋 레지스트리 (핫 리로드)
+
+rules/vat_rules_v*.json 을 모두 읽어 버전별로 불변 매처(CompiledRuleset)로 컴파일해 둔다.
+요청 경로는 현재 매처 참조를 한 번 읽어 쓰기만 하므로 락이 없고,
+파일이 바뀌면(mtime 폴링) 새 매처를 만든 뒤 참조를 통째로 교체한다.
+교체 전에 시작한 분류는 이전 매처로 끝까지 처리되므로 버려지는 요청이 없다.
+"""
+
+from .vendors import VendorIndex
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional, Tuple
+import os, re, json, time, pathlib, threading, logging
+
+logger = logging.getLogger(__name__)
+
+RULES_DIR = pathlib.Path(os.getenv("RULES_DIR", str(pathlib.Path(__file__).resolve().parents[2] / "rules")))
+RULES_PATTERN = "vat_rules_v*.json"
+# 고정할 룰셋 버전 (비우면 가장 높은 버전)
+RULESET_VERSION = os.getenv("RULESET_VERSION", "")
+# 파일 변경 확인 주기 (초) - 요청 경로에서는 이 주기마다 stat 만 한다
+RULES_CHECK_INTERVAL = float(os.getenv("RULES_CHECK_INTERVAL", "2"))
+
+def _keywords(words) -> Optional["re.Pattern"]:
+    """키워드 목록 → 부분 문자열 일치 정규식 (키워드마다 `in` 을 도는 대신 한 번에 검사)"""
+    words = [w for w in (words or []) if w]
+    if not words:
+        return None
+    return re.compile("|".join(re.escape(w) for w in sorted(words, key=len, reverse=True)))
+
+class CompiledRuleset:
+    """룰셋 JSON 하나를 컴파일한 불변 매처"""
+
+    __slots__ = ("version", "tag", "source", "raw", "vendor_index", "_vendor_hints", "_non_deductible",
+                 "_zero_rated", "_exempt", "_sales", "_purchase", "_purchase_account")
+
+    def __init__(self, raw: dict, source: str = ""):
+        self.version = str(raw.get("version", "0"))
+        self.tag = f"rules-v{self.version}"
+        self.source = source
+        self.raw: Mapping = MappingProxyType(raw)
+        self.vendor_index = VendorIndex.from_rules(raw)
+
+        mapping = raw.get("account_mapping", {})
+        self._vendor_hints: Mapping[str, Tuple[str, str]] = MappingProxyType({
+            name: (h.get("default_account", "기타비용"), h.get("default_tax_type", "과세"))
+            for name, h in raw.get("vendor_hints", {}).items()
+        })
+        nd = raw.get("non_deductible", {})
+        self._non_deductible = tuple(
+            (_keywords(kws), nd.get("reason_map", {}).get(cat, "불공제"), mapping.get(kws[0], "기타비용"))
+            for cat, kws in nd.get("keywords", {}).items() if kws
+        )
+        hints = raw.get("classify_hints", {})
+        self._zero_rated = _keywords(hints.get("zero_rated_keywords"))
+        self._exempt = _keywords(hints.get("exempt_keywords"))
+        self._sales = _keywords(hints.get("sales_keywords"))
+        self._purchase = _keywords(hints.get("purchase_keywords"))
+        self._purchase_account = mapping.get("소모품", "소모품비")
+
+    def summary(self) -> str:
+        return f"룰셋 v{self.version} 적용"
+
+    def classify(self, vendor: Optional[str], memo: Optional[str]) -> dict:
+        memo = memo or ""
+        # vendor hints (지점명/영문 표기 등을 대표 거래처명으로 정규화한 뒤 조회)
+        vhint = self._vendor_hints.get(self.vendor_index.canonical(vendor or ""))
+        if vhint:
+            return {"account_code": vhint[0], "tax_type": vhint[1], "confidence": 0.8,
+                    "reason": "업체 힌트 매칭", "flags": "[]"}
+
+        # non-deductible categories
+        for pattern, reason, account in self._non_deductible:
+            if pattern.search(memo):
+                return {"account_code": account, "tax_type": "불공제", "confidence": 0.78,
+                        "reason": reason, "flags": "[\"NON_DEDUCTIBLE\"]"}
+
+        # zero/exempt hints
+        if self._zero_rated and self._zero_rated.search(memo):
+            return {"account_code": "매출", "tax_type": "과세", "confidence": 0.72,
+                    "reason": "영세율 후보", "flags": "[\"ZERO_RATED_CANDIDATE\"]"}
+        if self._exempt and self._exempt.search(memo):
+            return {"account_code": "매출", "tax_type": "면세", "confidence": 0.72,
+                    "reason": "면세 키워드", "flags": "[\"EXEMPT\"]"}
+
+        # sales / purchase
+        if self._sales and self._sales.search(memo):
+            return {"account_code": "매출", "tax_type": "과세", "confidence": 0.7, "reason": "매출 키워드", "flags": "[]"}
+        if self._purchase and self._purchase.search(memo):
+            return {"account_code": self._purchase_account, "tax_type": "과세", "confidence": 0.68,
+                    "reason": "매입 키워드", "flags": "[]"}
+
+        return {"account_code": "기타비용", "tax_type": "과세", "confidence": 0.55,
+                "reason": "규칙 불일치 기본값", "flags": "[\"LOW_CONFIDENCE\"]"}
+
+def _version_key(version: str) -> tuple:
+    return tuple(int(p) if p.isdigit() else 0 for p in re.split(r"[._-]", version))
+
+class RulesetRegistry:
+    """룰셋 디렉터리 감시 + 버전별 컴파일 결과 보관"""
+
+    def __init__(self, directory: pathlib.Path = RULES_DIR, pinned: str = RULESET_VERSION,
+                 check_interval: float = RULES_CHECK_INTERVAL):
+        self.directory = pathlib.Path(directory)
+        self.pinned = pinned
+        self.check_interval = check_interval
+        self._mtimes: Dict[str, float] = {}
+        self._by_file: Dict[str, CompiledRuleset] = {}
+        self._versions: Mapping[str, CompiledRuleset] = MappingProxyType({})
+        self._current: Optional[CompiledRuleset] = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.reload(force=True)
+
+    def _scan(self) -> Dict[str, float]:
+        mtimes = {}
+        for path in self.directory.glob(RULES_PATTERN):
+            try:
+                mtimes[str(path)] = path.stat().st_mtime
+            except OSError:
+                pass  # 교체 중 잠깐 사라진 파일
+        return mtimes
+
+    def reload(self, force: bool = False) -> bool:
+        """변경된 파일만 다시 컴파일해 교체 - 바뀐 것이 있으면 True"""
+        with self._lock:
+            mtimes = self._scan()
+            if not force and mtimes == self._mtimes:
+                return False
+            by_file = {}
+            for path, mtime in mtimes.items():
+                old = self._by_file.get(path)
+                if old is not None and self._mtimes.get(path) == mtime:
+                    by_file[path] = old
+                    continue
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        by_file[path] = CompiledRuleset(json.load(f), source=path)
+                    logger.info(f"룰셋 컴파일: {path}")
+                except Exception as e:
+                    # 편집 중인 파일 등 - 이전 컴파일 결과를 유지하고 다음 주기에 재시도
+                    logger.warning(f"룰셋 로드 실패, 이전 버전 유지 ({path}): {e}")
+                    if old is not None:
+                        by_file[path] = old
+                    mtime = self._mtimes.get(path, 0.0)
+                    mtimes[path] = mtime
+            versions = {rs.version: rs for rs in by_file.values()}
+            if not versions:
+                if self._current is None:
+                    raise RuntimeError(f"룰셋 파일이 없습니다: {self.directory / RULES_PATTERN}")
+                logger.warning("룰셋 파일을 찾을 수 없어 현재 버전 유지")
+                return False
+            if self.pinned and self.pinned in versions:
+                current = versions[self.pinned]
+            else:
+                if self.pinned:
+                    logger.warning(f"고정 룰셋 버전 {self.pinned} 없음 - 최신 버전 사용")
+                current = versions[max(versions, key=_version_key)]
+
+            self._by_file = by_file
+            self._mtimes = mtimes
+            self._versions = MappingProxyType(versions)
+            changed = self._current is None or current is not self._current
+            self._current = current  # 참조 교체 (원자적)
+            self._next_check = time.monotonic() + self.check_interval
+        if changed:
+            logger.info(f"활성 룰셋: v{current.version}")
+        return True
+
+    def current(self) -> CompiledRuleset:
+        """활성 룰셋 - check_interval 마다 파일 변경을 확인"""
+        if time.monotonic() >= self._next_check:
+            try:
+                self.reload()
+            except Exception as e:
+                logger.warning(f"룰셋 변경 확인 실패: {e}")
+            self._next_check = time.monotonic() + self.check_interval
+        return self._current
+
+    def get(self, version: Optional[str] = None) -> CompiledRuleset:
+        if not version:
+            return self.current()
+        rs = self._versions.get(version)
+        if rs is None:
+            raise KeyError(f"룰셋 버전 {version} 없음")
+        return rs
+
+    def versions(self) -> Dict[str, str]:
+        return {v: rs.source for v, rs in self._versions.items()}
+
+REGISTRY = RulesetRegistry()
+
+def current_ruleset() -> CompiledRuleset:
+    return REGISTRY.current()
@@ -0,0 +1,285 @@
+"""
+거래처/메모 전문 검색
+
+모든 색인은 테넌트 키(user_id)가 앞에 오므로, 한 테넌트의 검색 비용이 전체 테넌트 데이터 양과 무관하다.
+- bigram (SQLite 기본): bigram 역색인 테이블 entry_bigrams (user_id, gram, entry_id) + DB 트리거 동기화
+  2글자 검색어(예: "커피", "식대")는 bigram 하나로 바로 찾고, 3글자 이상은 bigram 교집합으로 후보를 좁힌 뒤 LIKE 로 확인
+- pg_trgm (PostgreSQL 기본): 3글자 이상은 pg_trgm GIN 인덱스(ILIKE), 2글자는 entry_bigrams
+- python: 위 색인을 만들 수 없는 DB - 테넌트별 프로세스 내 bigram 역색인 (순수 Python) 으로 후보를 좁힌다
+- like: 색인 없이 테넌트 범위 안에서 LIKE 스캔
+1글자 검색어는 어느 백엔드든 테넌트 범위 안에서 LIKE 로 처리한다.
+
+예전 FTS5 trigram 가상 테이블(entries_fts)은 전체 테넌트의 행을 한 번에 매칭한 뒤에야 테넌트를 거를 수 있어
+더 이상 쓰지 않는다 - 남아 있으면 시작 시 트리거와 함께 지운다 (SEARCH_BACKEND=fts5 는 bigram 으로 취급).
+DB 트리거가 entry_bigrams 를 유지하므로 Core 대량 삽입(ledger_generator, microbench)이나 일괄 삭제도 반영된다.
+"""
+
+from sqlalchemy import text, column, func, or_, and_, inspect, Integer
+from sqlalchemy.orm import Session
+from cachetools import LRUCache
+from ..db.models import NormalizedEntry
+from ..db.tenancy import ANONYMOUS, TenantVersions, tenant_filter
+from typing import Dict, List, Optional, Set
+import os, threading, unicodedata, logging
+
+logger = logging.getLogger(__name__)
+
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto")  # auto / bigram / pg_trgm / python / like
+SEARCH_BIGRAMS = os.getenv("SEARCH_BIGRAMS", "1") == "1"  # bigram 테이블 (끄면 python 백엔드)
+BIGRAM_MAX_CHARS = int(os.getenv("BIGRAM_MAX_CHARS", "1000"))  # SQLite: vendor/memo 앞쪽 몇 글자까지 색인할지
+SEARCH_MAX_GRAMS = int(os.getenv("SEARCH_MAX_GRAMS", "6"))  # 긴 토큰의 교집합에 쓸 bigram 수
+SEARCH_INDEX_TENANTS = int(os.getenv("SEARCH_INDEX_TENANTS", "64"))  # python 백엔드: 색인을 들고 있을 테넌트 수
+# python 백엔드: bigram 후보가 이보다 많으면 IN 목록 대신 LIKE 스캔으로 검증
+SEARCH_IN_LIMIT = int(os.getenv("SEARCH_IN_LIMIT", "5000"))
+
+_backend: Optional[str] = None
+_bigrams = False
+
+# 예전 FTS5 trigram 색인 - 쓰지 않으므로 쓰기마다 드는 트리거 비용을 없앤다
+_SQLITE_LEGACY_DROP = [
+    "DROP TRIGGER IF EXISTS entries_fts_ai",
+    "DROP TRIGGER IF EXISTS entries_fts_ad",
+    "DROP TRIGGER IF EXISTS entries_fts_au",
+    "DROP TABLE IF EXISTS entries_fts",
+]
+
+_PG_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_normalized_entries_vendor_trgm ON normalized_entries USING gin (vendor gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_normalized_entries_memo_trgm ON normalized_entries USING gin (memo gin_trgm_ops)",
+]
+
+# SQLite 트리거 안에서는 WITH 재귀를 쓸 수 없으므로 글자 위치 표(entry_bigram_pos)와 조인해 bigram 을 만든다.
+# lower() 는 LIKE 와 같이 ASCII 만 대소문자를 무시한다
+_SQLITE_BIGRAM_SELECT = """
+    SELECT coalesce({row}.user_id, ''), lower(substr(s.v, p.k, 2)), {row}.id
+    FROM ({texts}) s JOIN entry_bigram_pos p ON p.k < length(s.v)
+    WHERE instr(substr(s.v, p.k, 2), ' ') = 0"""
+
+_SQLITE_BIGRAM_DDL = [
+    """CREATE TABLE IF NOT EXISTS entry_bigrams (
+        user_id TEXT NOT NULL, gram TEXT NOT NULL, entry_id INTEGER NOT NULL,
+        PRIMARY KEY (user_id, gram, entry_id)) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS ix_entry_bigrams_entry ON entry_bigrams (entry_id)",
+    "CREATE TABLE IF NOT EXISTS entry_bigram_pos (k INTEGER PRIMARY KEY)",
+    """CREATE TRIGGER IF NOT EXISTS entry_bigrams_ai AFTER INSERT ON normalized_entries BEGIN
+        INSERT OR IGNORE INTO entry_bigrams (user_id, gram, entry_id) """ + _SQLITE_BIGRAM_SELECT.format(
+            row="new", texts="SELECT new.vendor AS v UNION ALL SELECT new.memo") + """;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS entry_bigrams_ad AFTER DELETE ON normalized_entries BEGIN
+        DELETE FROM entry_bigrams WHERE entry_id = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS entry_bigrams_au AFTER UPDATE OF user_id, vendor, memo ON normalized_entries BEGIN
+        DELETE FROM entry_bigrams WHERE entry_id = old.id;
+        INSERT OR IGNORE INTO entry_bigrams (user_id, gram, entry_id) """ + _SQLITE_BIGRAM_SELECT.format(
+            row="new", texts="SELECT new.vendor AS v UNION ALL SELECT new.memo") + """;
+    END""",
+]
+
+_SQLITE_BIGRAM_REBUILD = "INSERT OR IGNORE INTO entry_bigrams (user_id, gram, entry_id) " + _SQLITE_BIGRAM_SELECT.format(
+    row="s", texts="SELECT id, user_id, vendor AS v FROM normalized_entries "
+                   "UNION ALL SELECT id, user_id, memo FROM normalized_entries")
+
+_PG_BIGRAM_DDL = [
+    """CREATE TABLE IF NOT EXISTS entry_bigrams (
+        user_id TEXT NOT NULL, gram TEXT NOT NULL, entry_id INTEGER NOT NULL,
+        PRIMARY KEY (user_id, gram, entry_id))""",
+    "CREATE INDEX IF NOT EXISTS ix_entry_bigrams_entry ON entry_bigrams (entry_id)",
+    """CREATE OR REPLACE FUNCTION entry_bigrams_of(uid TEXT, eid INTEGER, vendor TEXT, memo TEXT)
+    RETURNS TABLE (user_id TEXT, gram TEXT, entry_id INTEGER) LANGUAGE sql IMMUTABLE AS $$
+        SELECT DISTINCT coalesce(uid, ''), lower(substr(s, k, 2)), eid
+        FROM unnest(ARRAY[vendor, memo]) AS s, generate_series(1, char_length(s) - 1) AS k
+        WHERE position(' ' IN substr(s, k, 2)) = 0
+    $$""",
+    """CREATE OR REPLACE FUNCTION entry_bigrams_sync() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP <> 'INSERT' THEN
+            DELETE FROM entry_bigrams WHERE entry_id = OLD.id;
+        END IF;
+        IF TG_OP <> 'DELETE' THEN
+            INSERT INTO entry_bigrams SELECT * FROM entry_bigrams_of(NEW.user_id, NEW.id, NEW.vendor, NEW.memo)
+            ON CONFLICT DO NOTHING;
+        END IF;
+        RETURN NULL;
+    END $$""",
+    "DROP TRIGGER IF EXISTS entry_bigrams_sync ON normalized_entries",
+    """CREATE TRIGGER entry_bigrams_sync AFTER INSERT OR DELETE OR UPDATE OF user_id, vendor, memo
+        ON normalized_entries FOR EACH ROW EXECUTE FUNCTION entry_bigrams_sync()""",
+]
+
+_PG_BIGRAM_REBUILD = """INSERT INTO entry_bigrams
+    SELECT b.* FROM normalized_entries e, entry_bigrams_of(e.user_id, e.id, e.vendor, e.memo) b
+    ON CONFLICT DO NOTHING"""
+
+def _ensure_bigrams(engine) -> bool:
+    """bigram 테이블 + 동기화 트리거 생성, 새로 만들었으면 기존 데이터 색인"""
+    dialect = engine.dialect.name
+    if not SEARCH_BIGRAMS or dialect not in ("sqlite", "postgresql"):
+        return False
+    try:
+        with engine.begin() as conn:
+            exists = inspect(conn).has_table("entry_bigrams")
+            if dialect == "sqlite":
+                for ddl in _SQLITE_LEGACY_DROP + _SQLITE_BIGRAM_DDL:
+                    conn.execute(text(ddl))
+                have = conn.execute(text("SELECT count(*) FROM entry_bigram_pos")).scalar()
+                if have < BIGRAM_MAX_CHARS:
+                    conn.execute(text("INSERT OR IGNORE INTO entry_bigram_pos (k) VALUES (:k)"),
+                                 [{"k": k} for k in range(1, BIGRAM_MAX_CHARS + 1)])
+                rebuild = _SQLITE_BIGRAM_REBUILD
+            else:
+                for ddl in _PG_BIGRAM_DDL:
+                    conn.execute(text(ddl))
+                rebuild = _PG_BIGRAM_REBUILD
+            if not exists:
+                conn.execute(text(rebuild))
+        return True
+    except Exception as e:
+        logger.warning(f"bigram 색인 생성 실패: {e}")
+        return False
+
+def ensure_search_index(engine) -> str:
+    """검색 인덱스 생성 (앱 시작 시 1회) - 사용 가능한 백엔드 이름 반환"""
+    global _backend, _bigrams
+    dialect = engine.dialect.name
+    wanted = {"fts5": "bigram"}.get(SEARCH_BACKEND, SEARCH_BACKEND)
+    if wanted == "auto":
+        wanted = {"sqlite": "bigram", "postgresql": "pg_trgm"}.get(dialect, "python")
+    _bigrams = wanted != "like" and _ensure_bigrams(engine)
+    if wanted == "pg_trgm" and dialect == "postgresql":
+        try:
+            with engine.begin() as conn:
+                for ddl in _PG_DDL:
+                    conn.execute(text(ddl))
+        except Exception as e:
+            logger.warning(f"pg_trgm 인덱스 생성 실패: {e}")
+            wanted = "bigram"
+    if wanted in ("bigram", "pg_trgm") and not _bigrams:
+        wanted = "python"  # 2글자(bigram 백엔드는 모든) 검색어를 받칠 DB 색인이 없다
+    if wanted not in ("bigram", "pg_trgm", "like"):
+        wanted = "python"
+    _backend = wanted
+    logger.info(f"검색 백엔드: {_backend}")
+    return _backend
+
+def normalize(s: str) -> str:
+    return unicodedata.normalize("NFKC", s or "").casefold()
+
+class BigramIndex:
+    """한 테넌트의 엔트리 id → vendor/memo bigram 역색인 (python 백엔드)
+
+    id 워터마크 이후 행은 증분 색인하고, 그래도 DB 의 (행 수, 최신 updated_at) 과 맞지 않으면
+    (수정/삭제 - 다른 워커 포함) 그 테넌트 색인만 다시 만든다.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Set[int]] = {}
+        self.unigrams: Dict[str, Set[int]] = {}
+        self.max_id = 0
+        self.count = 0
+        self.max_updated = None
+
+    def add(self, entry_id: int, *texts: str):
+        for t in texts:
+            for tok in normalize(t).split():
+                for ch in tok:
+                    self.unigrams.setdefault(ch, set()).add(entry_id)
+                for i in range(len(tok) - 1):
+                    self.postings.setdefault(tok[i:i + 2], set()).add(entry_id)
+
+    def refresh(self, db: Session, user_id: Optional[str], version: tuple) -> bool:
+        """새 행 증분 색인 → DB 버전과 일치하면 True (False 면 다시 만들어야 함)"""
+        q = db.query(NormalizedEntry.id, NormalizedEntry.vendor, NormalizedEntry.memo, NormalizedEntry.updated_at) \
+            .filter(tenant_filter(NormalizedEntry, user_id), NormalizedEntry.id > self.max_id) \
+            .order_by(NormalizedEntry.id)
+        for r in q.execution_options(stream_results=True).yield_per(5000):
+            self.add(r.id, r.vendor or "", r.memo or "")
+            self.max_id = r.id
+            self.count += 1
+            if r.updated_at is not None and (self.max_updated is None or r.updated_at > self.max_updated):
+                self.max_updated = r.updated_at
+        return (self.count, self.max_updated) == version
+
+    def candidates(self, token: str) -> Set[int]:
+        tok = normalize(token)
+        if len(tok) == 1:
+            return set(self.unigrams.get(tok, ()))
+        result: Optional[Set[int]] = None
+        for i in range(len(tok) - 1):
+            ids = self.postings.get(tok[i:i + 2])
+            if not ids:
+                return set()
+            result = set(ids) if result is None else (result & ids)
+            if not result:
+                return set()
+        return result or set()
+
+_indexes: LRUCache = LRUCache(maxsize=SEARCH_INDEX_TENANTS)
+_indexes_lock = threading.Lock()
+_locks = TenantVersions()  # 테넌트별 색인 갱신 잠금
+
+def _python_index(db: Session, user_id: Optional[str]) -> BigramIndex:
+    """테넌트 색인 - (user_id, updated_at) 인덱스로 그 테넌트의 버전만 확인한다"""
+    key = user_id or ANONYMOUS
+    version = tuple(db.query(func.count(NormalizedEntry.id), func.max(NormalizedEntry.updated_at))
+                    .filter(tenant_filter(NormalizedEntry, user_id)).one())
+    with _locks.lock(key):
+        with _indexes_lock:
+            index = _indexes.get(key)
+        if index is None or not index.refresh(db, user_id, version):
+            index = BigramIndex()
+            index.refresh(db, user_id, version)
+        with _indexes_lock:
+            _indexes[key] = index
+    return index
+
+def _tokens(q: str) -> List[str]:
+    return [t for t in (q or "").split() if t]
+
+def _like(token: str):
+    pattern = f"%{token}%"
+    if _backend == "pg_trgm":
+        return or_(NormalizedEntry.vendor.ilike(pattern), NormalizedEntry.memo.ilike(pattern))
+    return or_(NormalizedEntry.vendor.like(pattern), NormalizedEntry.memo.like(pattern))
+
+def _grams(token: str) -> List[str]:
+    """토큰의 bigram - 긴 토큰은 SEARCH_MAX_GRAMS 개만 고르게 골라 교집합을 구한다 (LIKE 로 확인하므로 충분)"""
+    grams = list(dict.fromkeys(token[i:i + 2] for i in range(len(token) - 1)))
+    if len(grams) > SEARCH_MAX_GRAMS:
+        step = (len(grams) - 1) / (SEARCH_MAX_GRAMS - 1)
+        grams = [grams[round(i * step)] for i in range(SEARCH_MAX_GRAMS)]
+    return grams
+
+def _bigram_match(token: str, user_id: Optional[str], n: int):
+    """토큰의 bigram 을 모두 가진 테넌트 엔트리 id - (user_id, gram) 기본키 범위만 읽는다"""
+    params = {f"bg{n}_user": user_id or ""}
+    parts = []
+    for i, gram in enumerate(_grams(token)):
+        params[f"bg{n}_{i}"] = gram
+        parts.append(f"SELECT entry_id FROM entry_bigrams WHERE user_id = :bg{n}_user AND gram = lower(:bg{n}_{i})")
+    return text(" INTERSECT ".join(parts)).bindparams(**params).columns(column("entry_id", Integer))
+
+def search_filter(db: Session, q: str, user_id: Optional[str] = None):
+    """검색어의 모든 토큰이 vendor 또는 memo 에 포함된 테넌트 엔트리 조건 (AND)"""
+    tokens = _tokens(q)
+    if not tokens:
+        return None
+    if _backend is None:
+        ensure_search_index(db.get_bind())
+
+    conds = [tenant_filter(NormalizedEntry, user_id)]
+    for n, t in enumerate(tokens):
+        if len(t) >= 2 and (_backend == "bigram" or (_backend == "pg_trgm" and len(t) == 2)):
+            conds.append(NormalizedEntry.id.in_(_bigram_match(t, user_id, n)))
+            if len(t) == 2:
+                continue  # bigram 하나가 곧 포함 여부
+        elif _backend == "python":
+            # 후보를 좁힌 뒤 LIKE 로 확인 - 후보가 너무 많으면 IN 목록 대신 테넌트 범위 LIKE 스캔
+            ids = _python_index(db, user_id).candidates(t)
+            if not ids:
+                conds.append(NormalizedEntry.id.in_([]))
+                continue
+            if len(ids) <= SEARCH_IN_LIMIT:
+                conds.append(NormalizedEntry.id.in_(sorted(ids)))
+        conds.append(_like(t))
+    return and_(*conds)
@@ -0,0 +1,310 @@
+"""
+분석용 컬럼형(Parquet) 스냅샷 작업
+
+NormalizedEntry + ClassifiedEntry 를 사용자/월 단위로 파티션된 Parquet 파일로 내보낸다.
+분석 쿼리(월별 계정과목 부가세 등)는 OLTP DB 대신 이 파일들 위에서 실행한다.
+
+사용법:
+    python -m api.services.snapshot                 # 증분 (지난 스냅샷 이후 생성/수정분만 반영)
+    python -m api.services.snapshot --full          # 전체 재작성
+    python -m api.services.snapshot --report monthly-vat --year 2025
+"""
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from ..db.models import NormalizedEntry, ClassifiedEntry
+from typing import Dict, List, Optional, Any
+import os, re, json, shutil, datetime, logging, tempfile
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "./snapshots")
+SNAPSHOT_BATCH_ROWS = int(os.getenv("SNAPSHOT_BATCH_ROWS", "50000"))
+# 증분 모드는 updated_at 워터마크보다 이만큼 앞부터 다시 읽는다 - 워터마크보다 늦게 commit 된 트랜잭션의 행 보정
+SNAPSHOT_LOOKBACK_SECONDS = int(os.getenv("SNAPSHOT_LOOKBACK_SECONDS", "600"))
+STATE_FILE = "_state.json"
+# pyarrow 하이브 파티셔닝의 NULL 규약과 동일하게 사용
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+_MONTH_RE = re.compile(r"^\d{4}-\d{2}$")
+# 사전 인코딩(dictionary) 대상 컬럼 - 반복도가 높은 문자열
+DICT_COLUMNS = ["vendor", "account_code", "tax_type", "model_used"]
+
+def _pyarrow_available():
+    try:
+        import pyarrow, pyarrow.parquet  # noqa
+        return True
+    except Exception:
+        return False
+
+def _require_pyarrow():
+    if not _pyarrow_available():
+        raise RuntimeError("pyarrow가 설치되지 않았습니다 - pip install pyarrow")
+
+def load_state(out_dir: str = SNAPSHOT_DIR) -> Dict[str, Any]:
+    path = os.path.join(out_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {"last_entry_id": 0, "last_updated_at": None, "snapshots": 0}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _save_state(out_dir: str, state: Dict[str, Any]):
+    path = os.path.join(out_dir, STATE_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+def _schema():
+    import pyarrow as pa
+    dict_str = pa.dictionary(pa.int32(), pa.string())
+    # user_id / month 는 디렉터리 경로(파티션 키)에 들어가므로 파일 컬럼에서 제외
+    return pa.schema([
+        ("entry_id", pa.int64()),
+        ("trx_date", pa.string()),
+        ("vendor", dict_str),
+        ("amount", pa.float64()),
+        ("vat", pa.float64()),
+        ("memo", pa.string()),
+        ("account_code", dict_str),
+        ("tax_type", dict_str),
+        ("confidence", pa.float64()),
+        ("model_used", dict_str),
+        ("created_at", pa.timestamp("us")),
+    ])
+
+def _partition_value(value: Optional[str]) -> str:
+    """파티션 디렉터리 이름 - URL 인코딩 ('/', '..' 로 out_dir 밖에 쓰지 않게, 읽을 때 pyarrow 가 디코딩)"""
+    return quote(value, safe="") if value else NULL_PARTITION
+
+def _month(trx_date: Optional[str]) -> str:
+    month = (trx_date or "")[:7]
+    return month if _MONTH_RE.match(month) else NULL_PARTITION
+
+def _to_float(v) -> Optional[float]:
+    try:
+        return float(v) if v is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def _merge_existing(part_dir: str, table, schema):
+    """파티션의 기존 파일과 합친 표 + 대체할 기존 파일 목록 - 새 표에 있는 entry_id 의 옛 행은 버린다"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    old_files = sorted(os.path.join(part_dir, f) for f in os.listdir(part_dir)
+                       if f.startswith("part-") and f.endswith(".parquet"))
+    if not old_files:
+        return table, []
+    tables = []
+    for path in old_files:
+        old = pq.read_table(path).cast(schema)
+        keep = pc.invert(pc.is_in(old["entry_id"], value_set=table["entry_id"]))
+        tables.append(old.filter(keep))
+    tables.append(table)
+    merged = pa.concat_tables(tables).unify_dictionaries().combine_chunks()
+    return merged.take(pc.sort_indices(merged["entry_id"])), old_files
+
+def _write_partitions(out_dir: str, buckets: Dict[tuple, Dict[str, list]], merge: bool = False) -> int:
+    """(user_id, month) 파티션별 Parquet 쓰기 - merge 면 기존 파일과 합쳐 파티션당 파일 하나로 다시 쓴다"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = _schema()
+    files = 0
+    for (user_id, month), cols in buckets.items():
+        arrays = []
+        for field in schema:
+            values = cols[field.name]
+            if pa.types.is_dictionary(field.type):
+                arrays.append(pa.array(values, type=pa.string()).dictionary_encode())
+            else:
+                arrays.append(pa.array(values, type=field.type))
+        table = pa.Table.from_arrays(arrays, schema=schema)
+        part_dir = os.path.join(out_dir, f"user_id={user_id}", f"month={month}")
+        os.makedirs(part_dir, exist_ok=True)
+        old_files = []
+        if merge:
+            table, old_files = _merge_existing(part_dir, table, schema)
+        ids = table["entry_id"]
+        path = os.path.join(part_dir, f"part-{ids[0].as_py():012d}-{ids[-1].as_py():012d}.parquet")
+        # 점으로 시작하는 임시 파일은 데이터셋 탐색에서 빠진다 - 다 쓴 뒤 교체하고 옛 파일을 지운다
+        tmp = os.path.join(part_dir, "." + os.path.basename(path) + ".tmp")
+        pq.write_table(table, tmp, use_dictionary=DICT_COLUMNS, compression="zstd")
+        os.replace(tmp, path)
+        for old in old_files:
+            if old != path:
+                os.remove(old)
+        files += 1
+    return files
+
+def _check_snapshot_dir(out_dir: str):
+    """스냅샷이 아닌 기존 디렉터리(_state.json 없이 내용이 있는)에는 쓰거나 지우지 않는다 - --out 오타 방지"""
+    if os.path.exists(out_dir) and not os.path.isdir(out_dir):
+        raise ValueError(f"스냅샷 경로가 디렉터리가 아닙니다: {out_dir}")
+    if os.path.isdir(out_dir) and os.listdir(out_dir) and not os.path.exists(os.path.join(out_dir, STATE_FILE)):
+        raise ValueError(f"스냅샷 디렉터리가 아닙니다 ({STATE_FILE} 없음): {out_dir}")
+
+def _swap_dir(new_dir: str, out_dir: str):
+    """완성된 새 스냅샷으로 교체 - 기존 디렉터리는 옆으로 옮긴 뒤 지운다 (os.replace 는 비어 있지 않은 디렉터리를 덮지 못함)"""
+    old_dir = None
+    if os.path.isdir(out_dir):
+        old_dir = tempfile.mkdtemp(prefix=f".{os.path.basename(out_dir)}.old-", dir=os.path.dirname(new_dir))
+        os.replace(out_dir, old_dir)
+    try:
+        os.replace(new_dir, out_dir)
+    except OSError:
+        if old_dir:
+            os.replace(old_dir, out_dir)
+        raise
+    if old_dir:
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+def write_snapshot(db: Session, out_dir: str = SNAPSHOT_DIR, incremental: bool = True) -> Dict[str, Any]:
+    """스냅샷 생성 - 증분 모드는 마지막 스냅샷 이후 생성/수정된 엔트리만 다시 내보낸다
+
+    증분 대상: id 워터마크 이후 행 + updated_at(엔트리 또는 분류)이 워터마크 - SNAPSHOT_LOOKBACK_SECONDS 이후인 행.
+    대상 행이 속한 파티션은 기존 파일과 합쳐 entry_id 당 최신 행 하나만 남긴다 (같은 행을 다시 읽어도 중복 없음).
+    삭제된 엔트리는 반영하지 않으므로 주기적으로 --full 실행이 필요하다.
+    전체 모드는 옆 임시 디렉터리에 새로 쓴 뒤 교체하므로, 도중에 실패해도 기존 스냅샷이 그대로 남는다.
+    """
+    _require_pyarrow()
+    out_dir = os.path.abspath(out_dir)
+    _check_snapshot_dir(out_dir)
+    state = load_state(out_dir)
+    if incremental:
+        os.makedirs(out_dir, exist_ok=True)
+        return _export(db, out_dir, state, incremental=True)
+
+    parent = os.path.dirname(out_dir)
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=f".{os.path.basename(out_dir)}.tmp-", dir=parent)
+    try:
+        state = _export(db, tmp_dir, state, incremental=False)
+        _swap_dir(tmp_dir, out_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return state
+
+def _export(db: Session, out_dir: str, state: Dict[str, Any], incremental: bool) -> Dict[str, Any]:
+    since_id = state["last_entry_id"] if incremental else 0
+    since_ts = state.get("last_updated_at") if incremental else None
+
+    q = db.query(
+        NormalizedEntry.id, NormalizedEntry.user_id, NormalizedEntry.trx_date, NormalizedEntry.vendor,
+        NormalizedEntry.amount, NormalizedEntry.vat, NormalizedEntry.memo, NormalizedEntry.created_at,
+        NormalizedEntry.updated_at, ClassifiedEntry.account_code, ClassifiedEntry.tax_type,
+        ClassifiedEntry.confidence, ClassifiedEntry.model_used, ClassifiedEntry.updated_at.label("classified_at")
+    ).join(
+        ClassifiedEntry, ClassifiedEntry.entry_id == NormalizedEntry.id, isouter=True
+    )
+    if incremental:
+        changed = [NormalizedEntry.id > since_id]
+        if since_ts:
+            # updated_at 이 없는 예전 행은 id 워터마크로만 잡힌다
+            cutoff = datetime.datetime.fromisoformat(since_ts) - datetime.timedelta(seconds=SNAPSHOT_LOOKBACK_SECONDS)
+            changed += [NormalizedEntry.updated_at > cutoff, ClassifiedEntry.updated_at > cutoff]
+        q = q.filter(or_(*changed))
+    q = q.order_by(NormalizedEntry.id)
+    q = q.execution_options(stream_results=True).yield_per(5000)
+
+    field_names = [f.name for f in _schema()]
+    buckets: Dict[tuple, Dict[str, list]] = {}
+    rows = files = pending = 0
+    last_id = since_id
+    last_ts = datetime.datetime.fromisoformat(since_ts) if since_ts else None
+    for r in q:
+        key = (_partition_value(r.user_id), _month(r.trx_date))
+        cols = buckets.get(key)
+        if cols is None:
+            cols = buckets[key] = {name: [] for name in field_names}
+        cols["entry_id"].append(r.id)
+        cols["trx_date"].append(r.trx_date)
+        cols["vendor"].append(r.vendor)
+        cols["amount"].append(_to_float(r.amount))
+        cols["vat"].append(_to_float(r.vat))
+        cols["memo"].append(r.memo)
+        cols["account_code"].append(r.account_code)
+        cols["tax_type"].append(r.tax_type)
+        cols["confidence"].append(_to_float(r.confidence))
+        cols["model_used"].append(r.model_used)
+        cols["created_at"].append(r.created_at)
+        last_id = max(last_id, r.id)
+        for ts in (r.updated_at, r.classified_at):
+            if ts is not None and (last_ts is None or ts > last_ts):
+                last_ts = ts
+        rows += 1; pending += 1
+        if pending >= SNAPSHOT_BATCH_ROWS:
+            files += _write_partitions(out_dir, buckets, merge=incremental)
+            buckets = {}; pending = 0
+    if buckets:
+        files += _write_partitions(out_dir, buckets, merge=incremental)
+
+    state = {
+        "last_entry_id": last_id,
+        "last_updated_at": last_ts.isoformat() if last_ts else None,
+        "snapshots": state.get("snapshots", 0) + 1,
+        "mode": "incremental" if incremental else "full",
+        "rows_written": rows,
+        "files_written": files,
+        "created_at": datetime.datetime.utcnow().isoformat() + "Z",
+    }
+    _save_state(out_dir, state)
+    logger.info(f"스냅샷 완료: {rows}행, {files}개 파일 (last_entry_id={last_id})")
+    return state
+
+def open_dataset(out_dir: str = SNAPSHOT_DIR):
+    """스냅샷 디렉터리를 pyarrow Dataset 으로 열기 (user_id/month 파티션 컬럼 포함)"""
+    _require_pyarrow()
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    partitioning = ds.partitioning(pa.schema([("user_id", pa.string()), ("month", pa.string())]), flavor="hive")
+    return ds.dataset(out_dir, format="parquet", partitioning=partitioning, exclude_invalid_files=True)
+
+def monthly_vat_by_account(out_dir: str = SNAPSHOT_DIR, user_id: Optional[str] = None,
+                           year: Optional[str] = None) -> List[Dict[str, Any]]:
+    """월별 계정과목 부가세 합계 - DB를 조회하지 않고 스냅샷 파일만 사용"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    dataset = open_dataset(out_dir)
+    flt = None
+    if user_id:
+        flt = pc.field("user_id") == user_id
+    if year:
+        cond = pc.starts_with(pc.field("month"), year)
+        flt = cond if flt is None else (flt & cond)
+    table = dataset.to_table(columns=["month", "account_code", "vat"], filter=flt)
+    if table.num_rows == 0:
+        return []
+    table = table.set_column(1, "account_code", pc.cast(table["account_code"], pa.string()))
+    grouped = table.group_by(["month", "account_code"]).aggregate([("vat", "sum"), ("vat", "count")])
+    rows = grouped.to_pylist()
+    out = [{"month": r["month"], "account_code": r["account_code"],
+            "vat": round(r["vat_sum"] or 0.0, 2), "entries": r["vat_count"]} for r in rows]
+    return sorted(out, key=lambda r: (r["month"] or "", r["account_code"] or ""))
+
+def main():
+    import argparse
+    from ..db.database import SessionLocal
+    parser = argparse.ArgumentParser(description="분석용 Parquet 스냅샷")
+    parser.add_argument("--out", default=SNAPSHOT_DIR, help="스냅샷 디렉터리")
+    parser.add_argument("--full", action="store_true", help="전체 재작성 (기본: 증분)")
+    parser.add_argument("--report", choices=["monthly-vat"], help="스냅샷 대신 분석 리포트 출력")
+    parser.add_argument("--user-id", help="리포트 사용자 필터")
+    parser.add_argument("--year", help="리포트 연도 필터 (YYYY)")
+    args = parser.parse_args()
+
+    if args.report == "monthly-vat":
+        result = monthly_vat_by_account(args.out, args.user_id, args.year)
+    else:
+        db = SessionLocal()
+        try:
+            result = write_snapshot(db, args.out, incremental=not args.full)
+        except ValueError as e:
+            parser.error(str(e))
+        finally:
+            db.close()
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
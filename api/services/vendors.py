@@ -0,0 +1,161 @@
+"""
+거래처 정규화(canonicalization)
+
+"스타벅스 강남점", "스타벅스 코리아", "STARBUCKS" 처럼 표기가 다른 원본 거래처명을
+하나의 대표 거래처명으로 모은다.
+- 정규화: 전각/반각(NFKC), 대소문자, 공백, 법인 표기((주), 주식회사 등), 지점 접미사 제거
+- 룰셋의 vendor_hints / vendor_aliases 로 만든 접두사 트라이 (공백 없이 붙여 쓴 지점명 대응)
+- 원본 → 대표명 결과 메모이제이션, vendors / vendor_aliases 테이블에 매핑 저장
+- 저장된 매핑(운영자가 고친 것 포함)은 메모리에 올려 두고 룰셋 정확 일치 다음, 접두사 추정보다 먼저 쓴다
+"""
+
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from ..db.models import Vendor, VendorAlias
+from typing import Dict, Iterable, Optional
+import os, re, time, functools, threading, unicodedata, logging
+
+logger = logging.getLogger(__name__)
+
+VENDOR_CACHE_SIZE = int(os.getenv("VENDOR_CACHE_SIZE", "100000"))
+VENDOR_ALIAS_TTL = float(os.getenv("VENDOR_ALIAS_TTL", "300"))  # 다른 워커가 저장한 매핑을 다시 읽는 주기 (초)
+
+_CORP_MARKERS = re.compile(r"\(주\)|㈜|주식회사|\(유\)|유한회사|\b(co\.?,?\s*ltd|inc|corp)\b\.?")
+_BRACKETS = re.compile(r"[\(\[][^\)\]]*[\)\]]")
+_PUNCT = re.compile(r"[^\w\s&+\-]")
+# 지점 표기로 확실한 토큰만 (…서점, …음식점 같은 업종명은 남긴다)
+_BRANCH_TOKEN = re.compile(r"^\S+(지점|본점|직영점|가맹점|매장|센터)$|^[가-힣]+역점$")
+_BRANCH_WORDS = {"코리아", "korea", "본사", "본점", "직영", "가맹"}
+
+@functools.lru_cache(maxsize=VENDOR_CACHE_SIZE)
+def normalize_vendor(raw: str) -> str:
+    """표기 정규화 + 법인 표기/지점 접미사 제거 (예: "(주)이마트 성수역점" → "이마트")"""
+    s = unicodedata.normalize("NFKC", raw or "").casefold()
+    s = _CORP_MARKERS.sub(" ", s)
+    s = _BRACKETS.sub(" ", s)
+    s = _PUNCT.sub(" ", s)
+    tokens = s.split()
+    # 뒤쪽의 지점/국가 표기 토큰을 떼어내되 첫 토큰은 남긴다
+    while len(tokens) > 1 and (tokens[-1] in _BRANCH_WORDS or _BRANCH_TOKEN.match(tokens[-1])):
+        tokens.pop()
+    return " ".join(tokens)
+
+class VendorTrie:
+    """공백을 제거한 거래처명 접두사 트라이 - 가장 긴 접두사 일치 검색"""
+
+    _END = "\0"
+
+    def __init__(self):
+        self.root: dict = {}
+
+    def insert(self, key: str, canonical: str):
+        node = self.root
+        for ch in key:
+            node = node.setdefault(ch, {})
+        node[self._END] = canonical
+
+    def longest_prefix(self, s: str) -> Optional[str]:
+        node = self.root
+        found = None
+        for ch in s:
+            node = node.get(ch)
+            if node is None:
+                break
+            if self._END in node:
+                found = node[self._END]
+        return found
+
+class VendorIndex:
+    """룰셋 기준 거래처 대표명 색인"""
+
+    def __init__(self, names: Iterable[str] = (), aliases: Optional[Dict[str, str]] = None, min_prefix: int = 2):
+        self.exact: Dict[str, str] = {}
+        self.trie = VendorTrie()
+        self.min_prefix = min_prefix
+        for name in names:
+            self._add(name, name)
+        for alias, name in (aliases or {}).items():
+            self._add(alias, name)
+        self._prefix = functools.lru_cache(maxsize=VENDOR_CACHE_SIZE)(self._prefix_match)
+
+    @classmethod
+    def from_rules(cls, rules: dict) -> "VendorIndex":
+        return cls(rules.get("vendor_hints", {}).keys(), rules.get("vendor_aliases", {}))
+
+    def _add(self, key: str, canonical: str):
+        norm = normalize_vendor(key)
+        if not norm:
+            return
+        self.exact[norm] = canonical
+        compact = norm.replace(" ", "")
+        if len(compact) >= self.min_prefix:
+            self.trie.insert(compact, canonical)
+
+    def canonical(self, raw: str) -> str:
+        """원본 → 대표명: 룰셋 정확 일치 → 저장된 매핑(vendor_aliases) → 알려진 거래처 접두사 → 정규화 결과"""
+        norm = normalize_vendor(raw)
+        if not norm:
+            return ""
+        return self.exact.get(norm) or _stored.get(norm) or self._prefix(norm)
+
+    def _prefix_match(self, norm: str) -> str:
+        # "스타벅스강남" 처럼 붙여 쓴 경우 알려진 거래처명 접두사로 판단
+        return self.trie.longest_prefix(norm.replace(" ", "")) or norm
+
+# vendor_aliases 테이블의 정규화된 원본 → 대표명 (정규화 결과와 같은 자기 자신 매핑은 제외)
+_stored: Dict[str, str] = {}
+_stored_loaded_at = 0.0
+_stored_lock = threading.Lock()
+
+def load_aliases(db: Session, force: bool = False) -> int:
+    """저장된 거래처 매핑을 메모리로 적재 (VENDOR_ALIAS_TTL 이내에 읽었으면 건너뜀) → 매핑 수"""
+    global _stored, _stored_loaded_at
+    if not force and _stored_loaded_at and time.monotonic() - _stored_loaded_at < VENDOR_ALIAS_TTL:
+        return len(_stored)
+    stored: Dict[str, str] = {}
+    q = db.query(VendorAlias.raw_name, Vendor.name).join(Vendor, Vendor.id == VendorAlias.vendor_id)
+    for raw, name in q.yield_per(10000):
+        norm = normalize_vendor(raw)
+        if norm and name and norm != name:
+            stored[norm] = name
+    with _stored_lock:
+        _stored, _stored_loaded_at = stored, time.monotonic()
+    return len(stored)
+
+def register_vendors(db: Session, raws: Iterable[str], index: VendorIndex) -> Dict[str, int]:
+    """원본 거래처명 → 대표 거래처 id 매핑을 저장하고 반환 (없는 것만 일괄 추가)"""
+    raws = sorted({r for r in raws if r})
+    mapping: Dict[str, int] = {}
+    if not raws:
+        return mapping
+    try:
+        for i in range(0, len(raws), 500):
+            chunk = raws[i:i + 500]
+            for a in db.query(VendorAlias).filter(VendorAlias.raw_name.in_(chunk)):
+                mapping[a.raw_name] = a.vendor_id
+        missing = [r for r in raws if r not in mapping]
+        if not missing:
+            return mapping
+
+        canon = {r: index.canonical(r) or r for r in missing}
+        names = sorted(set(canon.values()))
+        vendor_ids: Dict[str, int] = {}
+        for i in range(0, len(names), 500):
+            for v in db.query(Vendor).filter(Vendor.name.in_(names[i:i + 500])):
+                vendor_ids[v.name] = v.id
+        new_vendors = [Vendor(name=n) for n in names if n not in vendor_ids]
+        if new_vendors:
+            db.add_all(new_vendors)
+            db.flush()
+            vendor_ids.update({v.name: v.id for v in new_vendors})
+        db.add_all([VendorAlias(raw_name=r, vendor_id=vendor_ids[canon[r]]) for r in missing])
+        db.commit()
+        mapping.update({r: vendor_ids[canon[r]] for r in missing})
+        with _stored_lock:
+            _stored.update({n: canon[r] for r in missing
+                            for n in (normalize_vendor(r),) if n and n != canon[r]})
+    except IntegrityError:
+        # 다른 워커가 동시에 같은 거래처를 등록한 경우 - 다음 업로드 때 다시 맞춰진다
+        db.rollback()
+        logger.info("거래처 매핑 동시 등록 충돌 - 건너뜀")
+    return mapping
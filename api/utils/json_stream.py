@@ -0,0 +1,196 @@
+"""
+스트리밍 JSON 객체 점진 파서
+
+LLM 이 JSON 객체를 몇 글자씩 보내는 동안, 최상위 키의 값이 완성되는 즉시 꺼낸다.
+  p = ObjectStream(partial_keys={"reasoning"})
+  for delta in chunks:
+      for kind, key, value in p.feed(delta):
+          ...  # ("field", "account_code", "복리후생비") / ("partial", "reasoning", "추가된 글자")
+
+- 객체 앞의 잡음(```json 펜스, 설명 문장)은 첫 '{' 까지 건너뛴다
+- 값은 완성된 뒤 json.loads 로 해석하므로 중첩 객체/배열/숫자도 그대로 받는다
+- partial_keys 의 문자열 값은 완성 전에도 새로 디코딩된 부분만 조금씩 내보낸다
+  (이스케이프가 중간에 끊긴 경우는 다음 조각까지 기다린다)
+
+repair_json(text) 은 같은 파서로 구형 모델의 깨진 JSON 을 한 번에 복구한다
+(앞뒤 설명 문장, 코드 펜스, max_tokens 로 잘린 끝, 마지막 쉼표, True/None 같은 파이썬 표기).
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import ast, json
+
+Event = Tuple[str, str, Any]
+
+_BEFORE, _KEY, _COLON, _VALUE, _AFTER, _DONE = range(6)
+
+# 따옴표 없는 값 중 JSON 이 아닌 흔한 표기
+_LITERALS = {"True": True, "False": False, "None": None, "NaN": None}
+
+class ObjectStream:
+    def __init__(self, partial_keys: Iterable[str] = ()):
+        self.partial_keys = set(partial_keys)
+        self.fields: Dict[str, Any] = {}
+        self._state = _BEFORE
+        self._buf: List[str] = []   # 현재 키/값 원문
+        self._key = ""
+        self._depth = 0
+        self._in_str = False
+        self._escape = False
+        self._emitted = ""          # partial 로 이미 내보낸 디코딩 문자열
+
+    @property
+    def done(self) -> bool:
+        return self._state == _DONE
+
+    def _partial(self) -> Optional[str]:
+        """진행 중인 문자열 값에서 새로 확정된 부분"""
+        raw = "".join(self._buf)[1:]  # 여는 따옴표 제외
+        # 끝의 미완성 이스케이프(\\, \\uXX..)는 다음 조각에서 처리
+        cut = raw.rfind("\\")
+        if cut != -1 and (len(raw) - cut) < (6 if raw[cut + 1:cut + 2] == "u" else 2):
+            raw = raw[:cut]
+        try:
+            text = json.loads('"' + raw + '"')
+        except ValueError:
+            return None
+        if text and "\ud800" <= text[-1] <= "\udbff":
+            text = text[:-1]  # 서로게이트 쌍의 앞 절반만 온 경우
+        delta = text[len(self._emitted):]
+        self._emitted = text
+        return delta or None
+
+    def _finish_value(self, events: List[Event]):
+        raw = "".join(self._buf).strip()
+        self._buf = []
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            value = _LITERALS.get(raw, raw)  # 따옴표 없는 값 등 - 원문 그대로
+        if self._key in self.partial_keys and isinstance(value, str) and len(value) > len(self._emitted):
+            events.append(("partial", self._key, value[len(self._emitted):]))
+        self.fields[self._key] = value
+        events.append(("field", self._key, value))
+        self._emitted = ""
+
+    def close(self) -> List[Event]:
+        """
+        입력 끝 - 잘린 마지막 문자열 값은 받은 데까지 확정한다 (미완성 이스케이프는 버린다)
+        잘린 숫자/객체/배열은 값이 틀릴 수 있으므로 버린다 ("0.87" → "0")
+        """
+        events: List[Event] = []
+        if self._state == _VALUE and self._in_str and self._depth == 0:
+            before = self._emitted
+            self._partial()  # _emitted ← 지금까지 디코딩된 전체
+            text, self._emitted = self._emitted, before
+            self._buf = list(json.dumps(text, ensure_ascii=False))
+            self._in_str = False
+            self._finish_value(events)
+        self._state = _DONE
+        return events
+
+    def feed(self, text: str) -> List[Event]:
+        events: List[Event] = []
+        for ch in text:
+            state = self._state
+            if state == _DONE:
+                break
+            if state == _BEFORE:
+                if ch == "{":
+                    self._state = _KEY
+                continue
+            if state == _KEY:
+                if not self._in_str:
+                    if ch == '"':
+                        self._in_str, self._buf = True, []
+                    elif ch == "}":
+                        self._state = _DONE
+                    continue
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_str = False
+                    self._key = json.loads('"' + "".join(self._buf) + '"')
+                    self._buf = []
+                    self._state = _COLON
+                    continue
+                self._buf.append(ch)
+                continue
+            if state == _COLON:
+                if ch == ":":
+                    self._state = _VALUE
+                    self._depth = 0
+                continue
+            if state == _VALUE:
+                if not self._buf and ch.isspace():
+                    continue
+                if self._in_str:
+                    self._buf.append(ch)
+                    if self._escape:
+                        self._escape = False
+                    elif ch == "\\":
+                        self._escape = True
+                    elif ch == '"':
+                        self._in_str = False
+                        if self._depth == 0:
+                            self._finish_value(events)
+                            self._state = _AFTER
+                    continue
+                if ch == '"':
+                    self._in_str = True
+                    self._buf.append(ch)
+                elif ch in "{[":
+                    self._depth += 1
+                    self._buf.append(ch)
+                elif ch in "}]" and self._depth > 0:
+                    self._depth -= 1
+                    self._buf.append(ch)
+                    if self._depth == 0:
+                        self._finish_value(events)
+                        self._state = _AFTER
+                elif self._depth == 0 and ch in ",}":
+                    self._finish_value(events)
+                    self._state = _KEY if ch == "," else _DONE
+                else:
+                    self._buf.append(ch)
+                continue
+            if state == _AFTER:
+                if ch == ",":
+                    self._state = _KEY
+                elif ch == "}":
+                    self._state = _DONE
+        # 조각 끝에서 진행 중인 partial 문자열 값 내보내기
+        if self._state == _VALUE and self._in_str and self._depth == 0 and self._key in self.partial_keys:
+            delta = self._partial()
+            if delta:
+                events.append(("partial", self._key, delta))
+        return events
+
+def repair_json(text: str) -> Tuple[Optional[dict], bool]:
+    """
+    LLM 응답 → (객체, 복구 여부)
+    json.loads 로 바로 읽히면 (객체, False), 점진 파서/literal_eval 로 살리면 (객체, True), 실패하면 (None, True)
+    """
+    text = text or ""
+    try:
+        obj = json.loads(text)
+        if isinstance(obj, dict):
+            return obj, False
+    except ValueError:
+        pass
+    p = ObjectStream()
+    p.feed(text)
+    p.close()
+    if p.fields:
+        return dict(p.fields), True
+    # 작은따옴표 dict 등 파이썬 표기
+    start, end = text.find("{"), text.rfind("}")
+    if start != -1 and end > start:
+        try:
+            obj = ast.literal_eval(text[start:end + 1])
+            if isinstance(obj, dict):
+                return {str(k): v for k, v in obj.items()}, True
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            pass
+    return None, True
@@ -1,10 +1,270 @@
-import os, json, datetime
+"""
+비동기 JSONL 로거
+
+요청 스레드는 직렬화한 한 줄을 메모리 큐에 넣기만 하고,
+백그라운드 작성 스레드가 배치 단위로 기록·플러시·로테이션(gzip 압축)을 담당한다.
+작성 스레드가 하나뿐이므로 동시 호출에서도 줄이 섞이지 않는다.
+"""
+
+import os, json, datetime, gzip, shutil, glob, queue, threading, time, atexit, logging, contextlib
+
+try:
+    import fcntl  # 워커 간 로테이션 잠금 (POSIX)
+except ImportError:
+    fcntl = None
+
 LOG_DIR = os.getenv("LOG_DIR","./logs")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "500"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "1.0"))
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "daily")  # daily / hourly / none
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "30"))
 os.makedirs(LOG_DIR, exist_ok=True)
+
+logger = logging.getLogger(__name__)
+
+def _period_key(now: datetime.datetime) -> str:
+    if LOG_ROTATE_WHEN == "hourly":
+        return now.strftime("%Y-%m-%d_%H")
+    if LOG_ROTATE_WHEN == "daily":
+        return now.strftime("%Y-%m-%d")
+    return ""
+
+class _Sink:
+    """로그 파일 하나에 대한 열린 핸들 + 로테이션 상태 (작성 스레드 전용)
+
+    여러 워커 프로세스(gunicorn -w N)가 같은 파일에 이어 쓰므로
+    기록은 {name}.jsonl.lock 공유 잠금, 로테이션은 배타 잠금 안에서 한다.
+    다른 워커가 로테이션해 파일(inode)이 바뀌었으면 기록 전에 새 파일을 다시 연다.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.path = os.path.join(LOG_DIR, f"{name}.jsonl")
+        self.fh = None
+        self.size = 0
+        self.period = None
+        self._lock_fh = None
+
+    def write(self, lines: list):
+        data = "".join(lines).encode("utf-8")
+        now = datetime.datetime.utcnow()
+        with self._locked(fcntl.LOCK_SH if fcntl else None):
+            self._reopen_if_moved(now)
+            rotate = _period_key(now) != self.period or \
+                (LOG_MAX_BYTES and self.size > 0 and self.size + len(data) > LOG_MAX_BYTES)
+            if not rotate:
+                self._append(data)
+                return
+        self.rotate(now, len(data))
+        with self._locked(fcntl.LOCK_SH if fcntl else None):
+            self._reopen_if_moved(now)
+            self._append(data)
+
+    def _append(self, data: bytes):
+        # O_APPEND 파일에 배치를 한 번의 write 로 - 다른 워커의 줄과 섞이지 않는다
+        os.write(self.fh.fileno(), data)
+        self.size += len(data)
+
+    @contextlib.contextmanager
+    def _locked(self, mode):
+        if mode is None:
+            yield
+            return
+        if self._lock_fh is None:
+            self._lock_fh = open(self.path + ".lock", "a")
+        fcntl.flock(self._lock_fh.fileno(), mode)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_fh.fileno(), fcntl.LOCK_UN)
+
+    def _reopen_if_moved(self, now: datetime.datetime):
+        if self.fh is None:
+            self._open(now)
+            return
+        try:
+            moved = os.stat(self.path).st_ino != os.fstat(self.fh.fileno()).st_ino
+        except FileNotFoundError:
+            moved = True
+        if moved:
+            # 다른 워커가 이번 기간 파일로 로테이션함
+            self.close()
+            self.period = _period_key(now)
+            self._open(now)
+
+    def _open(self, now: datetime.datetime):
+        self.fh = open(self.path, "ab", buffering=0)
+        self.size = self.fh.tell()
+        if self.period is None:
+            # 기존 파일을 이어 쓰는 경우 파일 수정 시각 기준으로 기간을 잡는다
+            mtime = datetime.datetime.utcfromtimestamp(os.path.getmtime(self.path)) if self.size else now
+            self.period = _period_key(mtime)
+
+    def rotate(self, now: datetime.datetime, incoming: int = 0):
+        moved = None
+        with self._locked(fcntl.LOCK_EX if fcntl else None):
+            # 잠금을 기다리는 동안 다른 워커가 이미 로테이션했으면 새 파일로 옮겨 타고 다시 판단
+            self._reopen_if_moved(now)
+            rotate = _period_key(now) != self.period or \
+                (LOG_MAX_BYTES and self.size > 0 and self.size + incoming > LOG_MAX_BYTES)
+            if rotate or not fcntl:
+                self.close()
+                if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+                    stem = os.path.join(LOG_DIR, f"{self.name}.{self.period or now.strftime('%Y-%m-%d')}")
+                    n = 0
+                    while os.path.exists(f"{stem}.{n}.jsonl.gz") or os.path.exists(f"{stem}.{n}.jsonl"):
+                        n += 1
+                    # 잠금 안에서는 이름만 바꾸고 압축은 잠금 밖에서 (다른 워커의 기록을 오래 막지 않게)
+                    moved = f"{stem}.{n}.jsonl"
+                    os.replace(self.path, moved)
+                self.period = _period_key(now)
+                self._open(now)
+        if moved:
+            with open(moved, "rb") as src, gzip.open(moved + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(moved)
+            self._prune()
+
+    def _prune(self):
+        if LOG_BACKUP_COUNT <= 0:
+            return
+        backups = sorted(glob.glob(os.path.join(LOG_DIR, f"{self.name}.*.jsonl.gz")), key=os.path.getmtime)
+        for old in backups[:-LOG_BACKUP_COUNT]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+    def flush(self):
+        pass  # 버퍼 없이 바로 기록
+
+    def close(self):
+        if self.fh:
+            self.fh.close()
+            self.fh = None
+
+class AsyncJsonlWriter:
+    """제한된 큐 + 백그라운드 배치 작성기"""
+
+    _STOP = object()
+
+    def __init__(self, maxsize: int = LOG_QUEUE_SIZE):
+        self.queue: "queue.Queue" = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self.written = 0
+        self._dropped_lock = threading.Lock()
+        self._sinks = {}
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        # uvicorn 워커 fork 이후에도 프로세스마다 작성 스레드를 새로 띄운다
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._sinks = {}
+            self._thread = threading.Thread(target=self._run, name="jsonl-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, name: str, line: str) -> bool:
+        self._ensure_started()
+        try:
+            self.queue.put_nowait((name, line))
+            return True
+        except queue.Full:
+            # 요청 지연을 늘리지 않도록 큐가 가득 차면 버리고 개수만 기록
+            with self._dropped_lock:
+                self.dropped += 1
+            return False
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """지금까지 넣은 줄이 모두 파일에 기록될 때까지 대기"""
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        done = threading.Event()
+        try:
+            self.queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def shutdown(self, timeout: float = 5.0):
+        if self._thread is None or not self._thread.is_alive():
+            return
+        try:
+            self.queue.put(self._STOP, timeout=timeout)
+        except queue.Full:
+            # 작성 스레드가 막혀 있음 - 데몬 스레드이므로 기다리지 않고 종료
+            logger.warning(f"JSONL 로거 종료 대기 시간 초과 (대기 중 {self.queue.qsize()}줄)")
+            return
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {"queued": self.queue.qsize(), "written": self.written, "dropped": self.dropped}
+
+    def _run(self):
+        pending = {}
+        count = 0
+        deadline = time.monotonic() + LOG_FLUSH_INTERVAL
+        while True:
+            timeout = max(deadline - time.monotonic(), 0.0)
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, tuple):
+                pending.setdefault(item[0], []).append(item[1])
+                count += 1
+                if count < LOG_BATCH_SIZE:
+                    continue
+
+            # 배치가 찼거나, 주기가 지났거나, flush/stop 요청
+            self._write_batch(pending)
+            self.written += count
+            pending = {}
+            count = 0
+            deadline = time.monotonic() + LOG_FLUSH_INTERVAL
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is self._STOP:
+                for sink in self._sinks.values():
+                    sink.close()
+                return
+
+    def _write_batch(self, pending: dict):
+        for name, lines in pending.items():
+            sink = self._sinks.get(name)
+            if sink is None:
+                sink = self._sinks[name] = _Sink(name)
+            try:
+                sink.write(lines)
+                sink.flush()
+            except Exception as e:
+                logger.error(f"JSONL 로그 기록 실패 ({name}): {e}")
+                sink.close()
+
+_writer = AsyncJsonlWriter()
+atexit.register(_writer.shutdown)
+
 def log_jsonl(record: dict, name: str = "ai_calls"):
     path = os.path.join(LOG_DIR, f"{name}.jsonl")
     record = dict(record)
     record.setdefault("ts", datetime.datetime.utcnow().isoformat()+"Z")
-    with open(path, "a", encoding="utf-8") as f:
-        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    _writer.submit(name, json.dumps(record, ensure_ascii=False) + "\n")
     return path
+
+def flush_logs(timeout: float = 5.0) -> bool:
+    return _writer.flush(timeout)
+
+def shutdown_logs(timeout: float = 5.0):
+    _writer.shutdown(timeout)
+
+def log_stats() -> dict:
+    return _writer.stats()
@@ -0,0 +1,268 @@
+"""
+인프로세스 메트릭 레지스트리 (Prometheus 텍스트 포맷)
+
+카운터/히스토그램 값은 스레드별 샤드(dict)에 기록한다. 각 샤드는 소유 스레드만 쓰므로
+기록 경로에 락이 없고, /metrics 수집 시에만 모든 샤드를 합산한다.
+스레드가 끝나면 그 샤드는 기본 합계(base)에 합쳐 목록에서 뺀다 - 짧게 사는 풀 스레드가 샤드를 남기지 않는다.
+"""
+
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import os, bisect, threading, weakref
+
+METRICS_ENABLED = os.getenv("ENABLE_METRICS", "true").lower() not in ("0", "false", "no")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 30.0, 60.0)
+
+class _ShardOwner:
+    """스레드 로컬에 함께 두는 표식 - 스레드가 끝나 로컬 저장소가 지워지면 finalize 로 샤드를 합친다"""
+    __slots__ = ("__weakref__",)
+
+class _Shards:
+    """스레드 로컬 dict 목록 - 쓰기는 자기 샤드만, 읽기는 전체 합산
+
+    merge(base, shard) 는 끝난 스레드의 샤드를 base 에 더한다 (base 의 값은 제자리 수정하지 않고 교체).
+    """
+
+    def __init__(self, merge: Callable[[dict, dict], None]):
+        self._local = threading.local()
+        self._all: Dict[int, dict] = {}
+        self._base: dict = {}
+        self._merge = merge
+        self._lock = threading.Lock()  # 샤드 등록/퇴역/수집만 - 기록 경로는 잠그지 않는다
+
+    def mine(self) -> dict:
+        d = getattr(self._local, "d", None)
+        if d is None:
+            d = self._local.d = {}
+            owner = self._local.owner = _ShardOwner()
+            weakref.finalize(owner, self._retire, d)
+            with self._lock:
+                self._all[id(d)] = d
+        return d
+
+    def _retire(self, d: dict):
+        with self._lock:
+            self._all.pop(id(d), None)
+            self._merge(self._base, d)
+
+    def live(self) -> int:
+        with self._lock:
+            return len(self._all)
+
+    def copies(self) -> List[dict]:
+        with self._lock:
+            return [self._base.copy()] + [d.copy() for d in self._all.values()]
+
+def _merge_counts(base: dict, shard: dict):
+    for k, v in shard.items():
+        base[k] = base.get(k, 0.0) + v
+
+def _merge_rows(base: dict, shard: dict):
+    for k, row in shard.items():
+        acc = base.get(k)
+        base[k] = list(row) if acc is None else [a + b for a, b in zip(acc, row)]
+
+class _Metric:
+    kind = ""
+    _merge: Callable[[dict, dict], None] = staticmethod(_merge_counts)
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._shards = _Shards(self._merge)
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _fmt_labels(self, key: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.labelnames, key))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+        return "{" + body + "}"
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        if not METRICS_ENABLED:
+            return
+        d = self._shards.mine()
+        key = self._key(labels)
+        d[key] = d.get(key, 0.0) + amount
+
+    def values(self) -> Dict[Tuple[str, ...], float]:
+        total: Dict[Tuple[str, ...], float] = {}
+        for shard in self._shards.copies():
+            for k, v in shard.items():
+                total[k] = total.get(k, 0.0) + v
+        return total
+
+    def collect(self) -> List[str]:
+        lines = self.header()
+        for key, v in sorted(self.values().items()):
+            lines.append(f"{self.name}{self._fmt_labels(key)} {_num(v)}")
+        return lines
+
+class Gauge(Counter):
+    """inc/dec 누적 게이지 또는 수집 시점 콜백 게이지"""
+    kind = "gauge"
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = (),
+                 fn: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        super().__init__(name, doc, labelnames)
+        self._fn = fn
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def values(self) -> Dict[Tuple[str, ...], float]:
+        if self._fn is not None:
+            try:
+                return self._fn()
+            except Exception:
+                return {}
+        return super().values()
+
+class Histogram(_Metric):
+    kind = "histogram"
+    _merge = staticmethod(_merge_rows)
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, doc, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        d = self._shards.mine()
+        key = self._key(labels)
+        row = d.get(key)
+        if row is None:
+            # [버킷별 개수..., +Inf 개수, 합계]
+            row = d[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        row[bisect.bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+    def collect(self) -> List[str]:
+        merged: Dict[Tuple[str, ...], list] = {}
+        for shard in self._shards.copies():
+            for k, row in shard.items():
+                acc = merged.get(k)
+                if acc is None:
+                    merged[k] = list(row)
+                else:
+                    for i, v in enumerate(row):
+                        acc[i] += v
+        lines = self.header()
+        for key, row in sorted(merged.items()):
+            cumulative = 0
+            for i, le in enumerate(self.buckets):
+                cumulative += row[i]
+                lines.append(f"{self.name}_bucket{self._fmt_labels(key, ('le', _num(le)))} {cumulative}")
+            cumulative += row[len(self.buckets)]
+            lines.append(f"{self.name}_bucket{self._fmt_labels(key, ('le', '+Inf'))} {cumulative}")
+            lines.append(f"{self.name}_sum{self._fmt_labels(key)} {_num(row[-1])}")
+            lines.append(f"{self.name}_count{self._fmt_labels(key)} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, doc: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, doc, labelnames))
+
+    def gauge(self, name: str, doc: str, labelnames: Sequence[str] = (), fn=None) -> Gauge:
+        return self.register(Gauge(name, doc, labelnames, fn))
+
+    def histogram(self, name: str, doc: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, doc, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _num(v: float) -> str:
+    if float(v).is_integer():
+        return str(int(v))
+    return repr(float(v))
+
+REGISTRY = Registry()
+
+# HTTP
+HTTP_REQUESTS = REGISTRY.counter("http_requests_total", "HTTP 요청 수", ("route", "method", "status"))
+HTTP_LATENCY = REGISTRY.histogram("http_request_duration_seconds", "라우트 템플릿별 응답 시간", ("route", "method"))
+HTTP_IN_FLIGHT = REGISTRY.gauge("http_requests_in_flight", "처리 중인 HTTP 요청 수")
+
+# 수집/분류
+INGEST_ROWS = REGISTRY.counter("ingest_rows_total", "업로드로 적재된 행 수")
+INGEST_SECONDS = REGISTRY.counter("ingest_seconds_total", "업로드 파싱/적재 누적 시간")
+CLASSIFY_ROWS = REGISTRY.counter("classification_rows_total", "분류된 행 수 (경로별)", ("path",))
+CLASSIFY_SECONDS = REGISTRY.counter("classification_seconds_total", "분류 누적 시간 (경로별)", ("path",))
+
+# LLM
+LLM_LATENCY = REGISTRY.histogram("llm_request_duration_seconds", "OpenAI 호출 시간", ("model", "ok"), LLM_BUCKETS)
+LLM_TOKENS = REGISTRY.counter("llm_tokens_total", "OpenAI 토큰 사용량", ("model", "kind"))
+LLM_COST = REGISTRY.counter("llm_cost_usd_total", "OpenAI 추정 비용 (USD)", ("model",))
+LLM_JSON_PARSE = REGISTRY.counter("llm_json_parse_total", "LLM JSON 응답 해석 결과 (strict=그대로, repaired=복구, failed=실패)",
+                                  ("outcome",))
+
+# 캐시
+CACHE_REQUESTS = REGISTRY.counter("cache_requests_total", "캐시 조회 결과", ("cache", "result"))
+
+def _cache_hit_ratio() -> Dict[Tuple[str, ...], float]:
+    totals: Dict[str, List[float]] = {}
+    for (cache, result), v in CACHE_REQUESTS.values().items():
+        acc = totals.setdefault(cache, [0.0, 0.0])
+        acc[0 if result == "hit" else 1] += v
+    return {(c,): (h / (h + m) if h + m else 0.0) for c, (h, m) in totals.items()}
+
+REGISTRY.gauge("cache_hit_ratio", "캐시 적중률", ("cache",), fn=_cache_hit_ratio)
+
+def observe_llm_call(model: str, seconds: float, ok: bool, usage: Optional[dict] = None, cost: float = 0.0):
+    LLM_LATENCY.observe(seconds, model=model, ok=str(ok).lower())
+    if usage:
+        LLM_TOKENS.inc(usage.get("prompt_tokens", 0) or 0, model=model, kind="prompt")
+        LLM_TOKENS.inc(usage.get("completion_tokens", 0) or 0, model=model, kind="completion")
+    if cost:
+        LLM_COST.inc(cost, model=model)
+
+def register_db_pool(engine):
+    """엔진 커넥션 풀 상태를 수집 시점에 읽는 게이지 등록"""
+    pool = engine.pool
+
+    def _read(attr: str):
+        def fn():
+            f = getattr(pool, attr, None)
+            # QueuePool.overflow() 는 풀이 다 차기 전까지 음수(-pool_size)부터 시작
+            return {(): float(max(f(), 0))} if callable(f) else {}
+        return fn
+
+    REGISTRY.gauge("db_pool_checked_out", "사용 중인 DB 커넥션 수", fn=_read("checkedout"))
+    REGISTRY.gauge("db_pool_overflow", "풀 크기를 넘어 생성된 오버플로 커넥션 수", fn=_read("overflow"))
+    REGISTRY.gauge("db_pool_size", "DB 커넥션 풀 크기", fn=_read("size"))
+
+def register_log_writer(stats_fn: Callable[[], dict]):
+    REGISTRY.gauge("jsonl_log_queued", "기록 대기 중인 JSONL 로그 줄 수",
+                   fn=lambda: {(): float(stats_fn()["queued"])})
+    REGISTRY.gauge("jsonl_log_dropped", "큐 포화로 버려진 JSONL 로그 줄 수 (누적)",
+                   fn=lambda: {(): float(stats_fn()["dropped"])})
+
+def render() -> str:
+    return REGISTRY.render()
@@ -1,11 +1,30 @@
-from typing import Tuple
+from typing import Optional, Tuple
+
+TAX_TYPES = ("과세","면세","불공제")
+# 모델이 자주 쓰는 다른 표기 → 허용값
+TAX_TYPE_ALIASES = {"영세": "과세", "영세율": "과세", "과세(영세율)": "과세", "비과세": "면세", "매입세액불공제": "불공제"}
+
+# validate_classification 과 같은 조건의 JSON Schema (OpenAI structured output strict 모드 규칙: 모든 키 required)
+CLASSIFICATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "account_code": {"type": "string"},
+        "tax_type": {"type": "string", "enum": list(TAX_TYPES)},
+        "confidence": {"type": "number", "minimum": 0, "maximum": 1},
+        "reason": {"type": "string"},
+        "flags": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["account_code", "tax_type", "confidence", "reason", "flags"],
+    "additionalProperties": False,
+}
+
 def validate_classification(obj: dict) -> Tuple[bool, str]:
     if not isinstance(obj, dict):
         return False, "not a JSON object"
     for k in ("account_code","tax_type","confidence"):
         if k not in obj:
             return False, f"missing key: {k}"
-    if obj["tax_type"] not in ("과세","면세","불공제"):
+    if obj["tax_type"] not in TAX_TYPES:
         return False, "invalid tax_type"
     try:
         c = float(obj["confidence"])
@@ -14,3 +33,23 @@ def validate_classification(obj: dict) -> Tuple[bool, str]:
     except Exception:
         return False, "confidence not a number"
     return True, ""
+
+def coerce_classification(obj: dict) -> Optional[dict]:
+    """구형 모델 응답 보정 (공백/표기/백분율 신뢰도) - 계정과목·세금유형이 없으면 None"""
+    if not isinstance(obj, dict):
+        return None
+    account = str(obj.get("account_code") or "").strip()
+    tax = str(obj.get("tax_type") or "").strip()
+    tax = TAX_TYPE_ALIASES.get(tax, tax)
+    if not account or tax not in TAX_TYPES:
+        return None
+    try:
+        c = float(str(obj.get("confidence", 0.5)).strip().rstrip("%"))
+    except ValueError:
+        c = 0.5
+    if c > 1.0:
+        c = c / 100.0  # 85 / "85%" 형태
+    out = dict(obj, account_code=account, tax_type=tax, confidence=min(max(c, 0.0), 1.0))
+    if not isinstance(out.get("flags", []), list):
+        out["flags"] = [str(out["flags"])]
+    return out
@@ -8,19 +8,216 @@ API 응답 시간, 처리량, 메모리 사용량 등을 측정하는 전문 벤
     python benchmark.py
     python benchmark.py --duration 300 --concurrent 10
     python benchmark.py --endpoint /tax/estimate --method GET
+    python benchmark.py --scenario full --rate 20 --duration 120 --concurrent 50 --format json --output run.json
+    python benchmark.py --scenario read --rate 50 --baseline run.json
 """
 
 import requests
 import time
 import json
+import random
+import asyncio
 import argparse
-import threading
 import statistics
 from datetime import datetime
-from typing import Dict, List, Any
+from typing import Callable, Dict, List, Any, Optional
 import psutil
 import os
 
+PERCENTILES = (50, 75, 90, 95, 99, 99.9, 100)
+
+class LatencyHistogram:
+    """HDR 방식 지연시간 히스토그램 (마이크로초, 2의 거듭제곱 구간마다 2^sub_bucket_bits 개 선형 버킷)
+
+    기본 7비트면 상대 오차 1% 미만으로 1µs ~ 수 시간을 고정 메모리에 담고, 버킷 그대로 저장/병합할 수 있다.
+    """
+
+    def __init__(self, sub_bucket_bits: int = 7):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.counts: Dict[int, int] = {}
+        self.total = 0
+        self.sum_us = 0
+        self.min_us = None
+        self.max_us = 0
+
+    def _bucket(self, us: int) -> int:
+        """버킷의 하한값 (같은 버킷 값은 같은 키)"""
+        shift = max(us.bit_length() - self.sub_bucket_bits, 0)
+        return (us >> shift) << shift
+
+    def record(self, ms: float, count: int = 1):
+        us = max(int(ms * 1000), 0)
+        key = self._bucket(us)
+        self.counts[key] = self.counts.get(key, 0) + count
+        self.total += count
+        self.sum_us += us * count
+        self.min_us = us if self.min_us is None else min(self.min_us, us)
+        self.max_us = max(self.max_us, us)
+
+    def record_corrected(self, ms: float, expected_interval_ms: float):
+        """폐쇄 모델 측정값 보정 - 지연이 예상 간격보다 길면 그동안 못 보낸 요청의 지연도 채워 넣는다"""
+        self.record(ms)
+        if expected_interval_ms <= 0:
+            return
+        missing = ms - expected_interval_ms
+        while missing >= expected_interval_ms:
+            self.record(missing)
+            missing -= expected_interval_ms
+
+    def merge(self, other: "LatencyHistogram"):
+        for key, n in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + n
+        self.total += other.total
+        self.sum_us += other.sum_us
+        if other.min_us is not None:
+            self.min_us = other.min_us if self.min_us is None else min(self.min_us, other.min_us)
+        self.max_us = max(self.max_us, other.max_us)
+
+    def percentile(self, p: float) -> float:
+        """백분위수 (ms) - 버킷 상한 대신 하한을 쓰고 최대값은 실측치"""
+        if not self.total:
+            return 0.0
+        if p >= 100:
+            return self.max_us / 1000
+        rank = max(int(self.total * p / 100 + 0.999999), 1)
+        seen = 0
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if seen >= rank:
+                return min(key, self.max_us) / 1000
+        return self.max_us / 1000
+
+    def summary(self) -> Dict[str, Any]:
+        if not self.total:
+            return {"count": 0}
+        result = {"count": self.total,
+                  "min_ms": round(self.min_us / 1000, 3),
+                  "mean_ms": round(self.sum_us / self.total / 1000, 3)}
+        for p in PERCENTILES:
+            result[f"p{p:g}_ms"] = round(self.percentile(p), 3)
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"sub_bucket_bits": self.sub_bucket_bits, "unit": "us",
+                "buckets": [[k, self.counts[k]] for k in sorted(self.counts)],
+                "sum_us": self.sum_us, "min_us": self.min_us, "max_us": self.max_us}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LatencyHistogram":
+        h = cls(data.get("sub_bucket_bits", 7))
+        for key, n in data.get("buckets", []):
+            h.counts[int(key)] = int(n)
+            h.total += int(n)
+        h.sum_us, h.min_us, h.max_us = data.get("sum_us", 0), data.get("min_us"), data.get("max_us", 0)
+        return h
+
+class LoadRecorder:
+    """부하 테스트 측정값 - 반복(시나리오 전체, 예정 시각 기준)과 단계별(실제 전송 기준) 히스토그램"""
+
+    def __init__(self):
+        self.response = LatencyHistogram()   # 예정 시각 → 마지막 응답 (coordinated omission 보정값)
+        self.service = LatencyHistogram()    # 단계별 실제 전송 → 응답 합산
+        self.steps: Dict[str, LatencyHistogram] = {}
+        self.status_codes: Dict[str, int] = {}
+        self.iterations = 0
+        self.failed_iterations = 0
+        self.requests = 0
+
+    def record_step(self, name: str, ms: float, status, ok: bool):
+        self.requests += 1
+        self.status_codes[str(status)] = self.status_codes.get(str(status), 0) + 1
+        self.steps.setdefault(name, LatencyHistogram()).record(ms)
+        self.service.record(ms)
+
+    def record_iteration(self, ms: float, ok: bool):
+        self.iterations += 1
+        if not ok:
+            self.failed_iterations += 1
+        self.response.record(ms)
+
+    def analyze(self, duration_seconds: float) -> Dict[str, Any]:
+        resp = self.response.summary()
+        ok = self.iterations - self.failed_iterations
+        return {
+            "summary": {
+                "total_requests": self.requests,
+                "iterations": self.iterations,
+                "successful_requests": ok,
+                "failed_requests": self.failed_iterations,
+                "success_rate_percent": round(ok / self.iterations * 100, 2) if self.iterations else 0,
+                "test_duration_seconds": duration_seconds,
+                "throughput_rps": round(ok / duration_seconds, 2) if duration_seconds else 0,
+            },
+            # 기존 리포트 키 호환 - 지연은 보정된 응답 시간 기준
+            "response_times": {k: v for k, v in resp.items() if k != "count"} | {
+                "median_ms": resp.get("p50_ms", 0), "max_ms": resp.get("p100_ms", 0)},
+            "service_times": self.service.summary(),
+            "steps": {name: h.summary() for name, h in self.steps.items()},
+            "http_status_codes": self.status_codes,
+            "histograms": {"response": self.response.to_dict(),
+                           "steps": {name: h.to_dict() for name, h in self.steps.items()}},
+        }
+
+class Step:
+    """시나리오 한 단계 - build(ctx) 가 httpx 요청 인자를 만든다"""
+
+    def __init__(self, name: str, method: str, path: str, build: Optional[Callable[[Dict], Dict]] = None):
+        self.name = name
+        self.method = method.upper()
+        self.path = path
+        self._build = build
+
+    def build(self, ctx: Dict[str, Any]) -> Dict[str, Any]:
+        kwargs = self._build(ctx) if self._build else {"params": {"period": ctx["period"]}}
+        kwargs.setdefault("headers", {})["X-User-Id"] = ctx["tenant"]
+        return kwargs
+
+_VENDORS = ["스타벅스", "쿠팡", "GS25", "카카오T", "배달의민족", "이마트", "KT", "대한항공"]
+
+def _upload_request(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    """반복마다 내용이 다른 작은 CSV (중복 업로드 단축 경로를 피한다)"""
+    rng = random.Random(ctx["i"])
+    lines = ["date,vendor,amount,vat,memo"]
+    for n in range(20):
+        amount = rng.choice([-1, 1]) * rng.randrange(1000, 500000, 100)
+        lines.append(f"{ctx['period']}-{rng.randint(1, 28):02d},{rng.choice(_VENDORS)},{amount},"
+                     f"{round(abs(amount) / 11)},부하테스트 {ctx['i']}-{n}")
+    body = "\n".join(lines).encode("utf-8")
+    return {"data": {"period": ctx["period"], "source": "loadtest"},
+            "files": {"file": (f"load_{ctx['i']}.csv", body, "text/csv")}}
+
+def _classify_request(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    vendor = _VENDORS[ctx["i"] % len(_VENDORS)]
+    return {"json": {"text_context": f"거래처: {vendor} 12,000원 업무 관련 지출", "user_id": ctx["tenant"]}}
+
+SCENARIOS: Dict[str, List[Step]] = {
+    # 업로드 → 분류 → 세액 추정 → 체크리스트 (사용자 한 명의 신고 준비 흐름)
+    "full": [
+        Step("upload", "POST", "/ingest/upload", _upload_request),
+        Step("classify", "POST", "/ai/classify-entry", _classify_request),
+        Step("estimate", "GET", "/tax/estimate"),
+        Step("checklist", "POST", "/prep/refresh", lambda ctx: {"json": {"period": ctx["period"], "taxType": "VAT"}}),
+    ],
+    # 조회 위주 (대시보드 새로고침)
+    "read": [
+        Step("entries", "GET", "/entries/list", lambda ctx: {"params": {"per_page": 50}}),
+        Step("summary", "GET", "/entries/summary"),
+        Step("estimate", "GET", "/tax/estimate"),
+    ],
+}
+
+def compare_results(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """두 실행 결과(JSON 리포트)의 지연 백분위수 비교"""
+    cur = current.get("response_times", {})
+    base = baseline.get("benchmark_results", baseline).get("response_times", {})
+    lines = []
+    for p in PERCENTILES:
+        key = f"p{p:g}_ms"
+        if key in cur and base.get(key):
+            delta = (cur[key] - base[key]) / base[key] * 100
+            lines.append(f"{key:>9}: {base[key]:>10.2f} → {cur[key]:>10.2f} ms ({delta:+.1f}%)")
+    return lines
+
 class YouArePlanBenchmark:
     """YouArePlan EasyTax 성능 벤치마크"""
     
@@ -67,99 +264,95 @@ class YouArePlanBenchmark:
                 "timestamp": datetime.now().isoformat()
             }
     
-    def run_load_test(self, endpoint: str, duration_seconds: int = 60, 
-                     concurrent_users: int = 5, method: str = "GET") -> Dict[str, Any]:
-        """부하 테스트 실행"""
-        print(f"🚀 부하 테스트 시작")
-        print(f"📍 엔드포인트: {endpoint}")
-        print(f"⏱️  지속시간: {duration_seconds}초")
-        print(f"👥 동시 사용자: {concurrent_users}명")
+    def run_load_test(self, endpoint: str, duration_seconds: int = 60,
+                     concurrent_users: int = 5, method: str = "GET", rate: float = 10.0,
+                     scenario: str = None, arrival: str = "constant", warmup_seconds: float = 0.0,
+                     tenants: int = 1, seed: int = 42) -> Dict[str, Any]:
+        """부하 테스트 실행 (오픈 모델: 응답과 무관하게 정해진 도착률로 요청)
+
+        concurrent_users 는 동시 진행 상한(= keep-alive 연결 수)이다. 상한에 걸려 기다린 시간도
+        지연시간에 포함되도록 각 반복의 지연은 '예정 시각'부터 잰다 (coordinated omission 보정).
+        """
+        steps = SCENARIOS[scenario] if scenario else [Step(endpoint, method, endpoint)]
+        config = {
+            "scenario": scenario or f"{method} {endpoint}",
+            "steps": [s.name for s in steps],
+            "rate_per_sec": rate,
+            "arrival": arrival,
+            "duration_seconds": duration_seconds,
+            "warmup_seconds": warmup_seconds,
+            "max_inflight": concurrent_users,
+            "tenants": tenants,
+            "seed": seed,
+        }
+        print(f"🚀 부하 테스트 시작 (오픈 모델)")
+        print(f"📍 시나리오: {config['scenario']} ({' → '.join(config['steps'])})")
+        print(f"⏱️  지속시간: {duration_seconds}초 (워밍업 {warmup_seconds}초)")
+        print(f"📈 도착률: {rate}/초 ({arrival}), 동시 진행 상한 {concurrent_users}")
         print("=" * 50)
-        
+
+        recorder = LoadRecorder()
         self.start_time = time.time()
-        results = []
-        
-        def worker():
-            """워커 스레드 함수"""
-            while time.time() - self.start_time < duration_seconds:
-                result = self.measure_response_time(endpoint, method, 
-                                                  params={"period": "2025-09"})
-                results.append(result)
-                time.sleep(0.1)  # 요청 간격
-        
-        # 스레드 시작
-        threads = []
-        for _ in range(concurrent_users):
-            thread = threading.Thread(target=worker)
-            thread.daemon = True
-            thread.start()
-            threads.append(thread)
-        
-        # 진행률 표시
-        start = time.time()
-        while time.time() - start < duration_seconds:
-            elapsed = time.time() - start
-            progress = (elapsed / duration_seconds) * 100
-            print(f"\r진행률: {progress:.1f}% ({len(results)}개 요청 완료)", end="")
-            time.sleep(1)
-        
-        # 모든 스레드 완료 대기
-        for thread in threads:
-            thread.join(timeout=5)
-        
+        asyncio.run(self._open_model(steps, recorder, config))
         self.end_time = time.time()
-        print(f"\n\n✅ 테스트 완료: {len(results)}개 요청 처리")
-        
-        return self.analyze_results(results)
-    
-    def analyze_results(self, results: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """결과 분석"""
-        if not results:
-            return {"error": "분석할 결과가 없습니다"}
-        
-        # 성공한 요청들만 필터링
-        successful = [r for r in results if r.get("success", False)]
-        failed = [r for r in results if not r.get("success", True)]
-        
-        if not successful:
-            return {"error": "성공한 요청이 없습니다"}
-        
-        # 응답 시간 통계
-        response_times = [r["response_time_ms"] for r in successful]
-        
-        total_duration = self.end_time - self.start_time if self.start_time and self.end_time else 0
-        throughput = len(successful) / total_duration if total_duration > 0 else 0
-        
-        # HTTP 상태 코드 분석
-        status_codes = {}
-        for result in results:
-            code = result.get("status_code", "error")
-            status_codes[code] = status_codes.get(code, 0) + 1
-        
-        analysis = {
-            "summary": {
-                "total_requests": len(results),
-                "successful_requests": len(successful),
-                "failed_requests": len(failed),
-                "success_rate_percent": round((len(successful) / len(results)) * 100, 2),
-                "test_duration_seconds": round(total_duration, 2),
-                "throughput_rps": round(throughput, 2)
-            },
-            "response_times": {
-                "min_ms": round(min(response_times), 2),
-                "max_ms": round(max(response_times), 2),
-                "mean_ms": round(statistics.mean(response_times), 2),
-                "median_ms": round(statistics.median(response_times), 2),
-                "p95_ms": round(self.percentile(response_times, 95), 2),
-                "p99_ms": round(self.percentile(response_times, 99), 2),
-                "std_dev_ms": round(statistics.stdev(response_times) if len(response_times) > 1 else 0, 2)
-            },
-            "http_status_codes": status_codes,
-            "errors": [r.get("error") for r in failed] if failed else []
-        }
-        
+        print(f"\n\n✅ 테스트 완료: {recorder.iterations}회 반복, {recorder.requests}개 요청")
+
+        analysis = recorder.analyze(duration_seconds)
+        analysis["config"] = config
         return analysis
-    
+
+    async def _open_model(self, steps: List["Step"], recorder: "LoadRecorder", config: Dict[str, Any]):
+        import httpx
+
+        rng = random.Random(config["seed"])
+        limit = max(1, int(config["max_inflight"]))
+        limits = httpx.Limits(max_connections=limit, max_keepalive_connections=limit)
+        sem = asyncio.Semaphore(limit)
+        loop = asyncio.get_running_loop()
+        total = config["warmup_seconds"] + config["duration_seconds"]
+        interval = 1.0 / config["rate_per_sec"]
+
+        async with httpx.AsyncClient(base_url=self.base_url, limits=limits, timeout=30) as client:
+            tasks = set()
+            start = loop.time() + 0.05
+            offset, i = 0.0, 0
+            while offset < total:
+                intended = start + offset
+                delay = intended - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                ctx = {"i": i, "period": "2025-09", "tenant": f"load-{i % max(1, config['tenants'])}"}
+                measured = offset >= config["warmup_seconds"]
+                task = asyncio.create_task(self._iteration(client, sem, steps, ctx, intended, measured, recorder))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                i += 1
+                offset += rng.expovariate(config["rate_per_sec"]) if config["arrival"] == "poisson" else interval
+                if i % 50 == 0:
+                    print(f"\r진행률: {min(offset / total, 1) * 100:.1f}% (진행 중 {len(tasks)}, 완료 {recorder.iterations})", end="")
+            if tasks:
+                await asyncio.wait(tasks, timeout=60)
+
+    async def _iteration(self, client, sem: asyncio.Semaphore, steps: List["Step"], ctx: Dict[str, Any],
+                         intended: float, measured: bool, recorder: "LoadRecorder"):
+        loop = asyncio.get_running_loop()
+        async with sem:
+            ok = True
+            for step in steps:
+                sent = loop.time()
+                try:
+                    response = await client.request(step.method, step.path, **step.build(ctx))
+                    status, step_ok = response.status_code, response.status_code < 400
+                except Exception as e:
+                    status, step_ok = type(e).__name__, False
+                if measured:
+                    recorder.record_step(step.name, (loop.time() - sent) * 1000, status, step_ok)
+                if not step_ok:
+                    ok = False
+                    break
+        if measured:
+            recorder.record_iteration((loop.time() - intended) * 1000, ok)
+
     def percentile(self, data: List[float], percentile: float) -> float:
         """백분위수 계산"""
         sorted_data = sorted(data)
@@ -286,13 +479,21 @@ class YouArePlanBenchmark:
 - **중간값**: {analysis.get('response_times', {}).get('median_ms', 'N/A')}ms
 - **95백분위**: {analysis.get('response_times', {}).get('p95_ms', 'N/A')}ms
 - **99백분위**: {analysis.get('response_times', {}).get('p99_ms', 'N/A')}ms
-- **표준편차**: {analysis.get('response_times', {}).get('std_dev_ms', 'N/A')}ms
+- **99.9백분위**: {analysis.get('response_times', {}).get('p99.9_ms', 'N/A')}ms
+
+> 응답 시간은 요청 예정 시각 기준(coordinated omission 보정)이며, 단계별 값은 실제 전송 기준입니다.
 
 ### HTTP 상태 코드
 """
         
         for code, count in analysis.get('http_status_codes', {}).items():
             report += f"- **{code}**: {count}회\n"
+
+        if analysis.get('steps'):
+            report += "\n### 단계별 지연 (ms)\n\n| 단계 | 건수 | p50 | p95 | p99 | 최대 |\n|---|---|---|---|---|---|\n"
+            for name, st in analysis['steps'].items():
+                report += (f"| {name} | {st.get('count', 0)} | {st.get('p50_ms', '-')} | {st.get('p95_ms', '-')} "
+                           f"| {st.get('p99_ms', '-')} | {st.get('p100_ms', '-')} |\n")
         
         # 성능 평가
         mean_time = analysis.get('response_times', {}).get('mean_ms', 0)
@@ -334,7 +535,14 @@ def main():
     parser.add_argument('--endpoint', default='/health', help='테스트할 엔드포인트')
     parser.add_argument('--method', default='GET', choices=['GET', 'POST'], help='HTTP 메소드')
     parser.add_argument('--duration', type=int, default=60, help='테스트 지속 시간(초)')
-    parser.add_argument('--concurrent', type=int, default=5, help='동시 사용자 수')
+    parser.add_argument('--concurrent', type=int, default=50, help='동시 진행 상한 (keep-alive 연결 수)')
+    parser.add_argument('--rate', type=float, default=10.0, help='초당 도착률 (시나리오 반복 수)')
+    parser.add_argument('--arrival', choices=['constant', 'poisson'], default='constant', help='도착 간격 분포')
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), help='시나리오 (지정하면 --endpoint 무시)')
+    parser.add_argument('--warmup', type=float, default=5.0, help='집계에서 제외할 워밍업 시간(초)')
+    parser.add_argument('--tenants', type=int, default=1, help='요청을 나눠 보낼 테넌트 수')
+    parser.add_argument('--seed', type=int, default=42, help='도착 간격/합성 데이터 시드')
+    parser.add_argument('--baseline', help='비교할 이전 실행 JSON 리포트')
     parser.add_argument('--all-endpoints', action='store_true', help='모든 엔드포인트 테스트')
     parser.add_argument('--format', choices=['markdown', 'json'], default='markdown', help='리포트 형식')
     parser.add_argument('--output', help='리포트 파일 경로')
@@ -356,9 +564,15 @@ def main():
         else:
             # 특정 엔드포인트 부하 테스트
             analysis = benchmark.run_load_test(
-                args.endpoint, args.duration, args.concurrent, args.method
+                args.endpoint, args.duration, args.concurrent, args.method, rate=args.rate,
+                scenario=args.scenario, arrival=args.arrival, warmup_seconds=args.warmup,
+                tenants=args.tenants, seed=args.seed
             )
             report = benchmark.generate_report(analysis, args.format)
+            if args.baseline:
+                with open(args.baseline, 'r', encoding='utf-8') as f:
+                    print(f"\n📐 기준 실행 대비 ({args.baseline})")
+                    print("\n".join(compare_results(analysis, json.load(f))))
         
         # 리포트 출력 또는 저장
         if args.output:
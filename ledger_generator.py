@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+YouArePlan EasyTax v8 - 합성 장부 데이터 생성기
+
+시드를 고정하면 항상 같은 결과가 나오는 한국형 거래 장부를 만든다 (성능 테스트/벤치마크 입력용).
+- 거래처: 자주 쓰는 대형 거래처 + 롱테일(소규모 상호) Zipf 분포, 프랜차이즈는 지점명 포함
+- 세금: 과세(부가세 10%, 합계금액 기준 1/11) / 영세(0%) / 면세 혼합
+- 물량: 월별 계절성(연말·명절·여름 비수기) + 주말 감소
+- 출력: CSV(UTF-8/CP949), XLSX(openpyxl write-only), 또는 DB 직접 적재 - 모두 스트리밍이라 1M+행도 메모리 일정
+
+사용법:
+    python ledger_generator.py --rows 1000000 --output ledger.csv
+    python ledger_generator.py --rows 50000 --encoding cp949 --output ledger_cp949.csv
+    python ledger_generator.py --rows 100000 --format xlsx --output ledger.xlsx
+    python ledger_generator.py --rows 1000000 --format db --tenant demo-user   # DB_URL 대상
+"""
+
+import os
+import sys
+import csv
+import time
+import bisect
+import random
+import argparse
+import calendar
+from datetime import date
+from typing import Dict, Iterator, List, Optional, Tuple
+
+HEADER = ["date", "vendor", "amount", "vat", "memo"]
+LABEL_HEADER = ["account_code", "tax_type"]
+
+# 월별 물량 배수 (1월 설, 9월 추석, 12월 연말 정산/회식, 7~8월 휴가철 비수기)
+SEASONALITY = {1: 1.15, 2: 0.95, 3: 1.05, 4: 1.0, 5: 1.0, 6: 1.05,
+               7: 0.85, 8: 0.8, 9: 1.1, 10: 1.0, 11: 1.05, 12: 1.35}
+WEEKEND_FACTOR = 0.45
+
+_DISTRICTS = ["강남", "역삼", "선릉", "삼성", "성수", "홍대", "신촌", "여의도", "판교", "분당", "종로", "을지로",
+              "잠실", "건대입구", "서초", "목동", "광화문", "수원", "일산", "해운대", "서면", "동성로", "둔산", "상무"]
+
+# 자주 쓰는 순서대로 (거래처, 계정과목, 세금유형, 지점 여부, 금액 로그정규 (mu, sigma), 수입 여부, 메모 후보)
+_CATALOG: List[Tuple[str, str, str, bool, Tuple[float, float], bool, Tuple[str, ...]]] = [
+    ("스타벅스", "복리후생비", "과세", True, (9.3, 0.6), False, ("팀 회의용 커피", "고객 미팅 음료", "카드")),
+    ("쿠팡", "소모품비", "과세", False, (10.3, 0.9), False, ("사무용품 구매", "사무실 간식", "프린터 토너")),
+    ("GS25", "소모품비", "과세", True, (8.6, 0.6), False, ("사무용 문구류", "생수", "현금영수증")),
+    ("CU", "소모품비", "과세", True, (8.5, 0.6), False, ("음료", "사무용품", "현금영수증")),
+    ("이마트", "복리후생비", "과세", True, (10.6, 0.7), False, ("사무실 생수", "탕비실 간식", "청소용품")),
+    ("카카오T", "여비교통비", "과세", False, (9.6, 0.5), False, ("고객 미팅 이동", "야근 택시", "출장 이동")),
+    ("대한항공", "여비교통비", "영세", False, (12.8, 0.5), False, ("해외 출장 항공권", "출장 항공료")),
+    ("KT", "통신비", "과세", False, (11.1, 0.3), False, ("사무실 인터넷", "대표번호 요금")),
+    ("SK텔레콤", "통신비", "과세", False, (11.0, 0.3), False, ("법인 휴대폰 요금",)),
+    ("네이버 클라우드", "지급수수료", "과세", False, (11.5, 0.8), False, ("서버 호스팅", "클라우드 사용료")),
+    ("AWS", "지급수수료", "영세", False, (12.0, 0.9), False, ("AWS 월 사용료", "클라우드 인프라")),
+    ("배달의민족", "복리후생비", "과세", False, (10.2, 0.5), False, ("야근 식대", "팀 점심")),
+    ("교보문고", "도서인쇄비", "면세", True, (10.0, 0.5), False, ("업무 관련 도서", "기술 서적")),
+    ("한국전력공사", "수도광열비", "과세", False, (11.8, 0.4), False, ("사무실 전기요금",)),
+    ("건강보험공단", "복리후생비", "면세", False, (12.5, 0.4), False, ("4대보험 사업자 부담분",)),
+    ("서울대학교병원", "복리후생비", "면세", False, (11.0, 0.7), False, ("직원 건강검진",)),
+    ("국세청", "세금과공과", "면세", False, (12.0, 1.0), False, ("부가세 납부", "원천세 납부")),
+    ("신한은행", "지급수수료", "면세", True, (7.5, 0.6), False, ("계좌이체 수수료", "해외송금 수수료")),
+    ("OO빌딩관리", "임차료", "과세", False, (14.2, 0.2), False, ("사무실 월세", "관리비")),
+    ("현대카드", "접대비", "과세", False, (11.9, 0.6), False, ("고객 접대 식사", "거래처 선물")),
+]
+# 수입 거래처 - (빈도 순위, 거래처, 계정과목, 세금유형, 금액, 메모 후보)
+_INCOME: List[Tuple[int, str, str, str, Tuple[float, float], Tuple[str, ...]]] = [
+    (2, "스마트스토어 정산", "상품매출", "과세", (12.5, 0.8), ("네이버 정산금", "매출 입금")),
+    (5, "쿠팡 정산", "상품매출", "과세", (12.8, 0.9), ("쿠팡 판매대금",)),
+    (14, "해외 고객사", "수출매출", "영세", (14.5, 0.8), ("수출 대금 입금", "용역 수출")),
+    (9, "ABC 컨설팅", "용역매출", "과세", (14.0, 0.6), ("프로젝트 대금", "월 자문료")),
+]
+# 롱테일 상호 (접두 × 업종 조합)
+_TAIL_PREFIX = ["한빛", "대성", "미래", "새롬", "우리", "동방", "청솔", "푸른", "백두", "한울", "다온", "가람",
+                "늘봄", "누리", "세종", "태평", "명성", "신세계", "제일", "삼정", "하나", "으뜸", "온누리", "금강"]
+_TAIL_KIND = [("상사", "소모품비", (10.5, 0.9)), ("식당", "복리후생비", (10.0, 0.5)), ("인쇄", "도서인쇄비", (11.0, 0.7)),
+              ("컴퓨터", "비품", (12.5, 0.9)), ("철물", "수선비", (10.3, 0.8)), ("정육점", "복리후생비", (10.8, 0.6)),
+              ("꽃집", "접대비", (10.8, 0.4)), ("주유소", "차량유지비", (11.0, 0.4)), ("세탁", "지급수수료", (9.5, 0.4)),
+              ("카센터", "차량유지비", (11.6, 0.7)), ("한의원", "복리후생비", (10.5, 0.5)), ("학원", "교육훈련비", (12.0, 0.4))]
+_TAX_FREE_KINDS = {"정육점", "한의원", "학원"}
+_PAY_NOTES = ["", "", "카드", "법인카드", "계좌이체", "현금영수증", "간이영수증"]
+
+class _Vendor:
+    __slots__ = ("name", "account", "tax_type", "branches", "mu", "sigma", "income", "memos")
+
+    def __init__(self, name, account, tax_type, branches, mu_sigma, income, memos):
+        self.name, self.account, self.tax_type, self.branches = name, account, tax_type, branches
+        self.mu, self.sigma = mu_sigma
+        self.income, self.memos = income, memos
+
+def _catalog(rng: random.Random, tail_size: int) -> List[_Vendor]:
+    """빈도 순위대로 정렬된 거래처 목록 (앞쪽일수록 자주 등장)"""
+    vendors = [_Vendor(n, a, t, b, ms, False, m) for n, a, t, b, ms, _, m in _CATALOG]
+    for rank, n, a, t, ms, m in _INCOME:
+        vendors.insert(rank, _Vendor(n, a, t, False, ms, True, m))
+    names = set()
+    while len(names) < tail_size:
+        prefix, (kind, account, ms) = rng.choice(_TAIL_PREFIX), rng.choice(_TAIL_KIND)
+        name = f"{prefix}{kind}" if rng.random() < 0.6 else f"{prefix}{kind} {rng.choice(_DISTRICTS)}점"
+        if name in names:
+            name = f"{name} {len(names)}"
+        names.add(name)
+        vendors.append(_Vendor(name, account, "면세" if kind in _TAX_FREE_KINDS else "과세", False, ms, False,
+                               (f"{kind} 이용", "업무용", "")))
+    return vendors
+
+def _daily_counts(rows: int, start: date, months: int) -> List[Tuple[date, int]]:
+    """총 행 수를 계절성/요일 가중치로 일자별 배분 (최대 잔여 방식이라 합계가 정확히 rows)"""
+    days = []
+    y, m = start.year, start.month
+    for _ in range(months):
+        for d in range(1, calendar.monthrange(y, m)[1] + 1):
+            day = date(y, m, d)
+            days.append((day, SEASONALITY[m] * (WEEKEND_FACTOR if day.weekday() >= 5 else 1.0)))
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+    total = sum(w for _, w in days)
+    exact = [rows * w / total for _, w in days]
+    counts = [int(x) for x in exact]
+    short = rows - sum(counts)
+    for i in sorted(range(len(days)), key=lambda i: exact[i] - counts[i], reverse=True)[:short]:
+        counts[i] += 1
+    return [(day, n) for (day, _), n in zip(days, counts)]
+
+def generate_rows(rows: int, seed: int = 42, start: str = "2025-01", months: int = 12,
+                  tail_size: int = 5000, zipf_s: float = 1.1, labels: bool = False) -> Iterator[tuple]:
+    """(date, vendor, amount, vat, memo[, account_code, tax_type]) 튜플 스트림
+
+    지출은 음수, 수입은 양수 금액. 과세 거래의 부가세는 합계금액의 1/11 (원 단위 반올림), 영세/면세는 0.
+    """
+    rng = random.Random(seed)
+    y, m = map(int, start.split("-")[:2])
+    vendors = _catalog(rng, tail_size)
+    cum, acc = [], 0.0
+    for rank in range(len(vendors)):
+        acc += 1.0 / (rank + 1) ** zipf_s
+        cum.append(acc)
+    for day, n in _daily_counts(rows, date(y, m, 1), months):
+        iso = day.isoformat()
+        for _ in range(n):
+            v = vendors[bisect.bisect_left(cum, rng.random() * acc)]
+            gross = max(int(rng.lognormvariate(v.mu, v.sigma)) // 10 * 10, 100)
+            if rng.random() < 0.15:
+                gross = round(gross, -4) or gross  # 정액 거래 (월세, 자문료 등)
+            vat = round(gross / 11) if v.tax_type == "과세" else 0
+            if v.tax_type == "과세" and rng.random() < 0.03:
+                vat = 0  # 부가세 칸 누락된 원본 자료
+            name = f"{v.name} {rng.choice(_DISTRICTS)}점" if v.branches else v.name
+            memo = " ".join(p for p in (rng.choice(v.memos), rng.choice(_PAY_NOTES)) if p)
+            sign = 1 if v.income else -1
+            row = (iso, name, sign * gross, sign * vat, memo)
+            yield row + (v.account, v.tax_type) if labels else row
+
+def write_csv(path: str, rows: Iterator[tuple], encoding: str = "utf-8", labels: bool = False) -> int:
+    count = 0
+    # CP949 로 표현할 수 없는 문자는 '?' 로 (실제 국내 은행/카드사 내보내기 파일과 같은 동작)
+    with open(path, "w", encoding=encoding, errors="replace", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER + (LABEL_HEADER if labels else []))
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+def write_xlsx(path: str, rows: Iterator[tuple], labels: bool = False) -> int:
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise SystemExit("XLSX 출력에는 openpyxl 이 필요합니다: pip install openpyxl")
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("거래내역")
+    ws.append(HEADER + (LABEL_HEADER if labels else []))
+    count = 0
+    for row in rows:
+        if count and count % 1_048_575 == 0:  # 엑셀 시트 최대 행 (헤더 제외) - 다음 시트로
+            ws = wb.create_sheet(f"거래내역{len(wb.worksheets) + 1}")
+            ws.append(HEADER + (LABEL_HEADER if labels else []))
+        ws.append(list(row))
+        count += 1
+    wb.save(path)
+    return count
+
+def load_db(rows: Iterator[tuple], tenant: Optional[str] = None, seed: int = 42, batch: int = 20_000) -> Dict[str, int]:
+    """DB_URL 대상 DB 에 월별 RawFile + 엔트리로 직접 적재 (ORM 우회 배치 insert)"""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from sqlalchemy import insert
+    from api.db.database import SessionLocal, engine
+    from api.db.models import RawFile, NormalizedEntry
+    from api.db.tenancy import ensure_user, stamp
+    from api.db.utils import init_db
+
+    init_db()
+    db = SessionLocal()
+    user_id = stamp(tenant)
+    files: Dict[str, str] = {}
+    stats = {"rows": 0, "files": 0}
+    pending: List[dict] = []
+
+    def file_for(period: str) -> str:
+        if period not in files:
+            raw = RawFile(user_id=user_id, period=period, source="synthetic", mime="text/csv",
+                          checksum=f"synthetic-{seed}-{tenant or ''}-{period}-{time.time_ns()}")
+            db.add(raw)
+            db.commit()
+            files[period] = raw.id
+            stats["files"] += 1
+        return files[period]
+
+    def flush():
+        if pending:
+            with engine.begin() as conn:
+                conn.execute(insert(NormalizedEntry), pending)
+            stats["rows"] += len(pending)
+            pending.clear()
+
+    try:
+        ensure_user(db, tenant)
+        line = 0
+        for d, vendor, amount, vat, memo, *_ in rows:
+            line += 1
+            pending.append({"user_id": user_id, "file_id": file_for(d[:7]), "raw_line": line, "trx_date": d,
+                            "vendor": vendor, "amount": amount, "vat": vat, "memo": memo})
+            if len(pending) >= batch:
+                flush()
+        flush()
+    finally:
+        db.close()
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description='YouArePlan EasyTax v8 합성 장부 생성기')
+    parser.add_argument('--rows', type=int, default=100_000, help='생성할 거래 수')
+    parser.add_argument('--seed', type=int, default=42, help='난수 시드 (같은 시드 = 같은 데이터)')
+    parser.add_argument('--start', default='2025-01', help='시작 월 (YYYY-MM)')
+    parser.add_argument('--months', type=int, default=12, help='기간 (개월)')
+    parser.add_argument('--tail', type=int, default=5000, help='롱테일 거래처 수')
+    parser.add_argument('--zipf', type=float, default=1.1, help='거래처 빈도 Zipf 지수 (클수록 상위 집중)')
+    parser.add_argument('--format', choices=['csv', 'xlsx', 'db'], default='csv', help='출력 형식')
+    parser.add_argument('--encoding', default='utf-8', choices=['utf-8', 'utf-8-sig', 'cp949'], help='CSV 인코딩')
+    parser.add_argument('--labels', action='store_true', help='정답 계정과목/세금유형 컬럼 포함 (분류 정확도 평가용)')
+    parser.add_argument('--tenant', help='DB 적재 시 user_id')
+    parser.add_argument('--output', help='출력 파일 경로 (csv/xlsx)')
+    args = parser.parse_args()
+
+    if args.format != "db" and not args.output:
+        parser.error("--output 이 필요합니다")
+
+    started = time.perf_counter()
+    rows = generate_rows(args.rows, args.seed, args.start, args.months, args.tail, args.zipf,
+                         labels=args.labels and args.format != "db")
+    print(f"🧾 합성 장부 생성: {args.rows:,}행, {args.start}부터 {args.months}개월, 시드 {args.seed}")
+    if args.format == "csv":
+        count = write_csv(args.output, rows, args.encoding, args.labels)
+    elif args.format == "xlsx":
+        count = write_xlsx(args.output, rows, args.labels)
+    else:
+        count = load_db(rows, args.tenant, args.seed)["rows"]
+    elapsed = time.perf_counter() - started
+    print(f"✅ {count:,}행 완료 ({elapsed:.1f}초, {count / elapsed:,.0f}행/초)"
+          + (f" → {args.output}" if args.output else ""))
+
+if __name__ == "__main__":
+    main()
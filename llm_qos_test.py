@@ -96,6 +96,31 @@ class LLMQoSTester:
                 }
             }
     
+    def run_batch_test(self) -> Dict[str, Any]:
+        """같은 샘플을 /ai/classify-batch 한 번으로 분류 (단건 반복 대비 왕복 시간 비교)"""
+        payload = {
+            "items": [{"vendor": s["vendor"], "amount": s["amount"], "memo": s["memo"]} for s in self.test_samples],
+            "use_llm": True
+        }
+        start_time = time.time()
+        try:
+            response = requests.post(f"{self.base_url}/ai/classify-batch", json=payload, timeout=120)
+            elapsed_ms = (time.time() - start_time) * 1000
+            if response.status_code != 200:
+                return {"success": False, "error": f"HTTP {response.status_code}", "response_time_ms": elapsed_ms}
+            data = response.json()
+            return {
+                "success": True,
+                "items": data.get("count", 0),
+                "unique": data.get("unique", 0),
+                "paths": data.get("paths", {}),
+                "tokens": data.get("tokens", {}),
+                "response_time_ms": elapsed_ms,
+                "per_item_ms": elapsed_ms / max(data.get("count", 0), 1)
+            }
+        except Exception as e:
+            return {"success": False, "error": str(e), "response_time_ms": (time.time() - start_time) * 1000}
+
     def run_qos_test(self) -> Dict[str, Any]:
         """20건 LLM QoS 테스트 실행"""
         print("🧠 LLM QoS 메트릭 테스트 시작 (20건 샘플)")
@@ -175,6 +200,14 @@ def main():
     # QoS 테스트 실행
     qos_metrics = tester.run_qos_test()
     
+    # 일괄 분류 비교 (요청 1회)
+    batch = tester.run_batch_test()
+    qos_metrics["batch_comparison"] = batch
+    if batch["success"]:
+        print(f"📦 일괄 분류: {batch['items']}건 {batch['response_time_ms']:.2f}ms (건당 {batch['per_item_ms']:.2f}ms), 경로 {batch['paths']}")
+    else:
+        print(f"⚠️ 일괄 분류 실패: {batch['error']}")
+    
     # 결과 저장
     output_path = "reports/llm_qos_metrics.json"
     with open(output_path, 'w', encoding='utf-8') as f:
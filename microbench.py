@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+YouArePlan EasyTax v8 - 핫패스 마이크로 벤치마크 (서버 없이 프로세스 내 직접 호출)
+
+합성 장부(1k/100k/1M행)를 임시 SQLite DB 에 만들고 주요 함수를 직접 반복 측정한다.
+기준값(baseline)을 저장해 두면 이후 실행에서 중앙값이 임계치 이상 느려진 항목이 있을 때 실패(exit 1)한다.
+
+사용법:
+    python microbench.py                                   # 1k, 100k
+    python microbench.py --sizes 1k,100k,1m --only rules_classify,detect_signals
+    python microbench.py --save-baseline                    # 기준값 저장
+    python microbench.py --threshold 0.2                    # 기준 대비 20% 이상 느려지면 실패
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import platform
+import statistics
+from datetime import datetime
+from typing import Callable, Dict, List, Any, Optional
+from ledger_generator import generate_rows
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reports", "microbench_baseline.json")
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+def _prepare_env(workdir: str):
+    """api 패키지 import 전에 호출 - 임시 DB/로그, 데모 LLM 응답 사용"""
+    os.environ["DB_URL"] = f"sqlite:///{workdir}/bench.db"
+    os.environ["LOG_DIR"] = os.path.join(workdir, "logs")
+    os.environ.setdefault("OPENAI_API_KEY", "sk-proj-demo-microbench")
+    os.environ["MAX_FILE_SIZE"] = str(1 << 31)
+    os.chdir(workdir)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+BENCH_PERIOD = "2025-09"
+
+def synthetic_rows(n: int, seed: int = 7):
+    """벤치마크 기간(한 달)의 합성 장부 - ledger_generator 와 같은 분포"""
+    return generate_rows(n, seed=seed, start=BENCH_PERIOD, months=1)
+
+def synthetic_csv(n: int, seed: int = 7) -> bytes:
+    lines = ["date,vendor,amount,vat,memo"]
+    lines += [f"{d},{v},{a},{t},{m}" for d, v, a, t, m in synthetic_rows(n, seed)]
+    return "\n".join(lines).encode("utf-8")
+
+class Dataset:
+    """크기별 벤치마크 DB - 파일 하나(file_id)에 n행"""
+
+    def __init__(self, n: int):
+        from sqlalchemy import insert
+        from api.db.database import SessionLocal, engine
+        from api.db.models import RawFile, NormalizedEntry, ClassifiedEntry, PrepItem
+        from api.db.utils import init_db
+        from api.services import analytics, neighbors
+
+        init_db()
+        self.n = n
+        self.db = SessionLocal()
+        for model in (ClassifiedEntry, PrepItem, NormalizedEntry, RawFile):
+            self.db.query(model).delete()
+        self.db.commit()
+        raw = RawFile(period=BENCH_PERIOD, source="microbench", mime="text/csv", checksum=f"microbench-{n}")
+        self.db.add(raw)
+        self.db.commit()
+        self.file_id = raw.id
+        rows, batch = iter(synthetic_rows(n)), 50_000
+        with engine.begin() as conn:
+            for i in range(0, n, batch):
+                conn.execute(insert(NormalizedEntry), [
+                    {"file_id": self.file_id, "raw_line": i + j + 1, "trx_date": d, "vendor": v,
+                     "amount": a, "vat": t, "memo": m}
+                    for j, (d, v, a, t, m) in zip(range(min(batch, n - i)), rows)])
+        analytics.invalidate()
+        neighbors.invalidate()
+        # rules_classify 는 vendor/memo 속성만 읽으므로 ORM 객체 대신 가벼운 Row 로 충분
+        self.entries = self.db.query(NormalizedEntry.vendor, NormalizedEntry.memo).all()
+        self.csv = synthetic_csv(n)
+
+    def close(self):
+        self.db.close()
+
+class Bench:
+    """측정 대상 - fn(dataset) 한 번이 1라운드, max_size 보다 큰 데이터셋은 건너뜀"""
+
+    def __init__(self, name: str, fn: Callable[[Dataset], Any], max_size: Optional[int] = None):
+        self.name = name
+        self.fn = fn
+        self.max_size = max_size
+
+def _bench_rules_classify(ds: Dataset):
+    from api.services.classification import rules_classify
+    for e in ds.entries:
+        rules_classify(e)
+
+def _bench_classify_file(ds: Dataset):
+    from api.services.classification import classify_entries_for_file
+    classify_entries_for_file(ds.db, ds.file_id)
+
+_upload_round = 0
+
+def _bench_upload_csv(ds: Dataset):
+    """업로드 엔드포인트 함수 직접 호출 (라운드마다 내용을 바꿔 중복 파일 단축 경로를 피한다)"""
+    global _upload_round
+    from io import BytesIO
+    from starlette.datastructures import UploadFile, Headers
+    from api.routers.ingest import upload_file
+    _upload_round += 1
+    upload = UploadFile(file=BytesIO(ds.csv + b"\n" * _upload_round), filename="bench.csv",
+                        headers=Headers({"content-type": "text/csv"}))
+    asyncio.run(upload_file(period=BENCH_PERIOD, source="microbench", file=upload, db=ds.db, user_id=""))
+
+def _bench_vat_estimate(ds: Dataset):
+    from api.routers.tax import _calculate_vat_estimate
+    _calculate_vat_estimate("", BENCH_PERIOD, ds.db)
+
+def _bench_vat_estimate_cold(ds: Dataset):
+    from api.services import analytics
+    analytics.invalidate()
+    _bench_vat_estimate(ds)
+
+def _bench_detect_signals(ds: Dataset):
+    from api.services import prep
+    with prep._memo_lock:
+        prep._memo.clear()
+    prep.detect_signals(ds.db, BENCH_PERIOD, "")
+
+def _bench_log_jsonl(ds: Dataset):
+    from api.utils.logger import log_jsonl, flush_logs
+    record = {"event": "openai_call", "model": "gpt-4o-mini", "usage": {"prompt_tokens": 150}, "ok": True}
+    for i in range(ds.n):
+        log_jsonl(dict(record, i=i), name="microbench")
+    flush_logs(timeout=60)
+
+BENCHES = [
+    Bench("rules_classify", _bench_rules_classify),
+    Bench("classify_entries_for_file", _bench_classify_file, max_size=100_000),
+    Bench("vat_estimate", _bench_vat_estimate),
+    Bench("vat_estimate_cold", _bench_vat_estimate_cold),
+    Bench("detect_signals", _bench_detect_signals),
+    Bench("log_jsonl", _bench_log_jsonl),
+    # 업로드는 데이터셋에 행을 추가하므로 항상 마지막에 실행
+    Bench("upload_csv", _bench_upload_csv, max_size=100_000),
+]
+
+def measure(fn: Callable[[], Any], rounds: int, max_time: float, warmup: bool = True) -> Dict[str, Any]:
+    """라운드별 소요 시간(초) 통계 - rounds 회 또는 max_time 초까지 (최소 1회)"""
+    if warmup:
+        fn()
+    times = []
+    started = time.perf_counter()
+    while len(times) < rounds and (not times or time.perf_counter() - started < max_time):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return {
+        "rounds": len(times),
+        "min_s": round(min(times), 6),
+        "median_s": round(statistics.median(times), 6),
+        "mean_s": round(statistics.mean(times), 6),
+        "stddev_s": round(statistics.stdev(times), 6) if len(times) > 1 else 0.0,
+    }
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[Dict[str, Any]]:
+    """기준 대비 중앙값 변화 - ratio > 1 + threshold 면 회귀"""
+    rows = []
+    for key, cur in results.items():
+        base = baseline.get(key)
+        if not base or not base.get("median_s"):
+            continue
+        ratio = cur["median_s"] / base["median_s"]
+        rows.append({"bench": key, "baseline_s": base["median_s"], "current_s": cur["median_s"],
+                     "ratio": round(ratio, 3), "regressed": ratio > 1 + threshold})
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description='YouArePlan EasyTax v8 마이크로 벤치마크')
+    parser.add_argument('--sizes', default='1k,100k', help=f"데이터셋 크기 (쉼표 구분: {', '.join(SIZES)})")
+    parser.add_argument('--only', help='실행할 벤치마크 이름 (쉼표 구분)')
+    parser.add_argument('--rounds', type=int, default=5, help='벤치마크별 최대 라운드 수')
+    parser.add_argument('--max-time', type=float, default=10.0, help='벤치마크별 최대 측정 시간(초)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='기준값 파일')
+    parser.add_argument('--save-baseline', action='store_true', help='이번 결과를 기준값으로 저장')
+    parser.add_argument('--threshold', type=float, default=0.25, help='허용 회귀율 (0.25 = 25%%)')
+    parser.add_argument('--output', help='결과 JSON 저장 경로')
+    args = parser.parse_args()
+
+    sizes = [s.strip().lower() for s in args.sizes.split(",") if s.strip()]
+    unknown = [s for s in sizes if s not in SIZES]
+    if unknown:
+        parser.error(f"지원하지 않는 크기: {', '.join(unknown)}")
+    only = {s.strip() for s in args.only.split(",")} if args.only else None
+    benches = [b for b in BENCHES if not only or b.name in only]
+
+    workdir = tempfile.mkdtemp(prefix="microbench_")
+    baseline_path = os.path.abspath(args.baseline)
+    output_path = os.path.abspath(args.output) if args.output else None
+    _prepare_env(workdir)
+
+    print(f"⚡ YouArePlan EasyTax v8 마이크로 벤치마크")
+    print(f"📂 작업 디렉터리: {workdir}")
+    print("=" * 60)
+
+    results: Dict[str, Dict] = {}
+    for label in sizes:
+        n = SIZES[label]
+        print(f"\n📦 데이터셋 {label} ({n:,}행) 생성 중...", end="", flush=True)
+        t0 = time.perf_counter()
+        ds = Dataset(n)
+        print(f" {time.perf_counter() - t0:.1f}초")
+        try:
+            for bench in benches:
+                if bench.max_size and n > bench.max_size:
+                    continue
+                key = f"{bench.name}[{label}]"
+                stats = measure(lambda: bench.fn(ds), args.rounds, args.max_time)
+                results[key] = stats
+                print(f"   {key:<36} 중앙값 {stats['median_s'] * 1000:>10.2f}ms "
+                      f"(최소 {stats['min_s'] * 1000:.2f}ms, {stats['rounds']}회)")
+        finally:
+            ds.close()
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+    exit_code = 0
+    if os.path.exists(baseline_path) and not args.save_baseline:
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+        rows = compare(results, baseline, args.threshold)
+        report["comparison"] = rows
+        print(f"\n📐 기준 대비 ({baseline_path}, 허용 {args.threshold:.0%})")
+        for r in rows:
+            mark = "❌" if r["regressed"] else "✅"
+            print(f"   {mark} {r['bench']:<36} {r['baseline_s'] * 1000:>10.2f} → {r['current_s'] * 1000:>10.2f}ms (x{r['ratio']})")
+        regressed = [r["bench"] for r in rows if r["regressed"]]
+        if regressed:
+            print(f"\n❌ 성능 회귀 {len(regressed)}건: {', '.join(regressed)}")
+            exit_code = 1
+
+    if args.save_baseline:
+        previous = {}
+        if os.path.exists(baseline_path):
+            with open(baseline_path, "r", encoding="utf-8") as f:
+                previous = json.load(f).get("results", {})
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(dict(report, results={**previous, **results}), f, indent=2, ensure_ascii=False)
+        print(f"\n💾 기준값 저장: {baseline_path}")
+
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"📄 결과 저장: {output_path}")
+
+    sys.exit(exit_code)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+YouArePlan EasyTax v8 - OpenAI 호환 모의 서버 (표준 라이브러리만 사용)
+
+LLM 정제 파이프라인/재시도/캐시를 실제 API 없이 현실적인 지연과 장애 속에서 부하 테스트하기 위한 서버.
+POST /v1/chat/completions 를 흉내 내며 지연 분포, 429 레이트 리밋, 5xx, 응답 없는 타임아웃,
+깨진 JSON 응답을 확률적으로 주입한다. response_format(json_schema/json_object) 을 흉내 내며,
+--structured 로 지원 범위를 줄이면 구형 모델처럼 400 으로 거부한다. 실행 중에도 POST /_mock/config 로 설정을 바꿀 수 있다.
+
+사용법:
+    python mock_openai_server.py --port 8090 --latency lognormal:400,0.6 --rate-limit 20 --malformed-rate 0.05
+    OPENAI_BASE_URL=http://localhost:8090/v1 uvicorn api.main:app
+
+    curl -X POST localhost:8090/_mock/config -d '{"error_5xx_rate": 0.3}'   # 실행 중 장애 주입
+    curl localhost:8090/_mock/stats
+"""
+
+import re
+import json
+import math
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """지연 분포 (ms) - fixed:200 | uniform:100,400 | exp:300 | lognormal:<중앙값>,<sigma>"""
+    kind, _, args = spec.partition(":")
+    values = [float(x) for x in args.split(",") if x.strip()]
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "exp":
+        return lambda rng: rng.expovariate(1.0 / values[0])
+    if kind == "lognormal":
+        mu = math.log(values[0])
+        return lambda rng: rng.lognormvariate(mu, values[1] if len(values) > 1 else 0.5)
+    raise ValueError(f"지원하지 않는 지연 분포: {spec}")
+
+class MockConfig:
+    """주입할 지연/장애 설정 - 모든 확률은 요청 단위"""
+
+    FIELDS = {"latency": str, "slow_rate": float, "slow_ms": float, "per_token_ms": float,
+              "rate_limit": float, "error_429_rate": float, "error_5xx_rate": float,
+              "timeout_rate": float, "hang_seconds": float, "malformed_rate": float, "structured": str}
+
+    def __init__(self, **values):
+        self.latency = "lognormal:300,0.5"
+        self.slow_rate = 0.0        # 꼬리 지연 비율
+        self.slow_ms = 5000.0
+        self.per_token_ms = 0.0     # 생성 토큰당 추가 지연
+        self.rate_limit = 0.0       # 초당 허용 요청 (0 = 무제한), 초과 시 429 + Retry-After
+        self.error_429_rate = 0.0
+        self.error_5xx_rate = 0.0
+        self.timeout_rate = 0.0     # 응답 없이 hang_seconds 동안 붙잡고 있다가 연결 종료
+        self.hang_seconds = 120.0
+        self.malformed_rate = 0.0   # JSON 을 요구한 요청에 깨진/어긋난 JSON 응답
+        self.structured = "json_schema"  # 지원하는 response_format 상한 (json_schema > json_object > none), 넘으면 400
+        self.update(values)
+
+    def update(self, values: Dict[str, Any]):
+        for key, value in values.items():
+            if key in self.FIELDS and value is not None:
+                setattr(self, key, self.FIELDS[key](value))
+        self.sample_latency = parse_latency(self.latency)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {k: getattr(self, k) for k in self.FIELDS}
+
+class TokenBucket:
+    def __init__(self):
+        self.tokens: Optional[float] = None  # 첫 요청 때 가득 찬 상태로 시작
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self, rate: float) -> Optional[float]:
+        """허용되면 None, 아니면 다음 토큰까지 남은 초"""
+        if rate <= 0:
+            return None
+        with self.lock:
+            now = time.monotonic()
+            if self.tokens is None:
+                self.tokens = rate
+            self.tokens = min(rate, self.tokens + (now - self.updated) * rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return None
+            return (1 - self.tokens) / rate
+
+# 분류 응답용 키워드 → (계정과목, 세금유형)
+_RULES = [(("커피", "카페", "식대", "회식", "점심", "간식"), "복리후생비", "과세"),
+          (("문구", "사무", "용품", "토너"), "소모품비", "과세"),
+          (("통신", "인터넷", "전화", "휴대폰"), "통신비", "과세"),
+          (("월세", "임대", "관리비"), "임차료", "과세"),
+          (("택시", "항공", "출장", "이동"), "여비교통비", "과세"),
+          (("접대", "선물"), "접대비", "불공제"),
+          (("도서", "서적"), "도서인쇄비", "면세"),
+          (("보험", "검진", "병원"), "복리후생비", "면세")]
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 2)
+
+class MockOpenAI:
+    def __init__(self, config: MockConfig, seed: int = 0):
+        self.config = config
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.bucket = TokenBucket()
+        self.stats: Dict[str, int] = {}
+        self.stats_lock = threading.Lock()
+
+    def count(self, key: str):
+        with self.stats_lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def random(self) -> float:
+        with self.rng_lock:
+            return self.rng.random()
+
+    def latency_ms(self) -> float:
+        with self.rng_lock:
+            base = self.config.sample_latency(self.rng)
+            return base + (self.config.slow_ms if self.rng.random() < self.config.slow_rate else 0.0)
+
+    def content(self, messages: List[dict], malformed: bool, response_format: str = "") -> str:
+        text = " ".join(str(m.get("content", "")) for m in messages)
+        user = " ".join(str(m.get("content", "")) for m in messages if m.get("role") == "user")
+        if "JSON" not in text and "json" not in text:
+            lines = re.findall(r"-\s*([A-Z_]+):\s*(.+)", user)
+            items = [f"- {desc.strip()} 확인" for _, desc in lines] or ["- 증빙 자료 정리", "- 매입/매출 세금계산서 대조"]
+            return "\n".join(items + ["- 신고 기한 전 최종 검토"])
+        account, tax_type = "기타비용", "과세"
+        for keywords, acc, tax in _RULES:
+            if any(k in user for k in keywords):
+                account, tax_type = acc, tax
+                break
+        obj = {"account_code": account, "tax_type": tax_type,
+               "confidence": round(0.6 + 0.35 * self.random(), 2),
+               "reason": "모의 서버 키워드 분류", "flags": []}
+        body = json.dumps(obj, ensure_ascii=False)
+        if not malformed:
+            return body
+        # json_schema 는 형식이 보장되고 max_tokens 잘림만 남는다, json_object 는 펜스/설명 없이 JSON 만
+        mode = 0 if response_format == "json_schema" else int(self.random() * 4)
+        if response_format == "json_object" and mode == 1:
+            mode = 3
+        if mode == 0:
+            return body[: max(1, len(body) // 2)]                       # 잘린 JSON
+        if mode == 1:
+            return f"분류 결과입니다.\n```json\n{body}\n```\n참고하세요."  # 설명 + 코드 펜스
+        if mode == 2:
+            return json.dumps({"account_code": account}, ensure_ascii=False)  # 필수 키 누락
+        return body.replace(tax_type, "영세율") + ","                    # 허용되지 않는 값 + 꼬리 쉼표
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    server_version = "MockOpenAI/1.0"
+    mock: MockOpenAI = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, obj: Any, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: int, kind: str, message: str, headers: Optional[Dict[str, str]] = None):
+        self.mock.count(f"status_{status}")
+        self._send_json(status, {"error": {"message": message, "type": kind, "code": kind}}, headers)
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b"{}"
+        return json.loads(raw or b"{}")
+
+    def do_GET(self):
+        if self.path in ("/health", "/_mock/health"):
+            return self._send_json(200, {"ok": True})
+        if self.path == "/_mock/stats":
+            return self._send_json(200, {"stats": dict(self.mock.stats), "config": self.mock.config.to_dict()})
+        if self.path.rstrip("/").endswith("/models"):
+            return self._send_json(200, {"object": "list", "data": [
+                {"id": m, "object": "model", "owned_by": "mock"} for m in ("gpt-4o-mini", "gpt-4o", "gpt-4.1-mini")]})
+        self._error(404, "not_found", f"unknown path {self.path}")
+
+    def do_POST(self):
+        try:
+            payload = self._read_json()
+        except ValueError:
+            return self._error(400, "invalid_request_error", "request body is not JSON")
+        if self.path == "/_mock/config":
+            self.mock.config.update(payload)
+            return self._send_json(200, self.mock.config.to_dict())
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._error(404, "not_found", f"unknown path {self.path}")
+        self._chat(payload)
+
+    def _chat(self, payload: Dict[str, Any]):
+        mock, cfg = self.mock, self.mock.config
+        mock.count("requests")
+        wait = mock.bucket.take(cfg.rate_limit)
+        if wait is not None:
+            return self._error(429, "rate_limit_exceeded", "Rate limit reached (mock)",
+                               {"Retry-After": f"{max(wait, 0.001):.3f}"})
+        if mock.random() < cfg.error_429_rate:
+            return self._error(429, "rate_limit_exceeded", "Rate limit reached (mock, injected)",
+                               {"Retry-After": "1"})
+        if mock.random() < cfg.timeout_rate:
+            mock.count("timeouts")
+            time.sleep(cfg.hang_seconds)
+            self.close_connection = True
+            return
+        if mock.random() < cfg.error_5xx_rate:
+            return self._error(503 if mock.random() < 0.5 else 500, "server_error", "The server had an error (mock)")
+
+        response_format = (payload.get("response_format") or {}).get("type", "")
+        levels = ("none", "json_object", "json_schema")
+        supported = levels.index(cfg.structured) if cfg.structured in levels else 0
+        if response_format in levels and levels.index(response_format) > supported:
+            return self._error(400, "invalid_request_error",
+                               f"Invalid parameter: 'response_format' of type '{response_format}' is not supported with this model.")
+        messages = payload.get("messages") or []
+        malformed = mock.random() < cfg.malformed_rate
+        if malformed:
+            mock.count("malformed")
+        content = mock.content(messages, malformed, response_format)
+        prompt_tokens = sum(_tokens(str(m.get("content", ""))) for m in messages)
+        completion_tokens = _tokens(content)
+        # 스트리밍은 첫 조각까지만 기다리고 생성 시간은 조각 사이에 나눠 쓴다
+        gen_ms = 0.0 if payload.get("stream") else cfg.per_token_ms * completion_tokens
+        time.sleep((mock.latency_ms() + gen_ms) / 1000.0)
+
+        model = payload.get("model", "gpt-4o-mini")
+        rid = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+        mock.count("status_200")
+        if payload.get("stream"):
+            return self._stream(rid, model, content, usage)
+        self._send_json(200, {
+            "id": rid, "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    def _stream(self, rid: str, model: str, content: str, usage: Dict[str, int]):
+        """SSE 스트리밍 (chunked) - 몇 글자씩 delta 로 보낸다"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def chunk(obj):
+            data = f"data: {obj if isinstance(obj, str) else json.dumps(obj, ensure_ascii=False)}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        base = {"id": rid, "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+        step = max(1, len(content) // 8)
+        for i in range(0, len(content), step):
+            chunk(dict(base, choices=[{"index": 0, "delta": {"content": content[i:i + step]}, "finish_reason": None}]))
+            time.sleep(self.mock.config.per_token_ms * _tokens(content[i:i + step]) / 1000.0)
+        chunk(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}], usage=usage))
+        chunk("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+def serve(host: str, port: int, config: MockConfig, seed: int = 0) -> ThreadingHTTPServer:
+    """서버 생성 (serve_forever 는 호출자가) - 테스트/벤치마크 스크립트에서 스레드로 띄울 때 사용"""
+    handler = type("MockHandler", (Handler,), {"mock": MockOpenAI(config, seed)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description='OpenAI 호환 모의 서버 (지연/장애 주입)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--latency', default='lognormal:300,0.5',
+                        help='지연 분포 ms (fixed:200 | uniform:100,400 | exp:300 | lognormal:중앙값,sigma)')
+    parser.add_argument('--slow-rate', type=float, default=0.0, help='꼬리 지연 비율')
+    parser.add_argument('--slow-ms', type=float, default=5000.0, help='꼬리 지연 추가 시간(ms)')
+    parser.add_argument('--per-token-ms', type=float, default=0.0, help='생성 토큰당 지연(ms)')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='초당 허용 요청 (0 = 무제한)')
+    parser.add_argument('--error-429-rate', type=float, default=0.0, help='무작위 429 비율')
+    parser.add_argument('--error-5xx-rate', type=float, default=0.0, help='무작위 500/503 비율')
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help='응답 없이 붙잡는 요청 비율')
+    parser.add_argument('--hang-seconds', type=float, default=120.0, help='타임아웃 주입 시 대기 시간(초)')
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help='깨진 JSON 응답 비율')
+    parser.add_argument('--structured', default='json_schema', choices=('json_schema', 'json_object', 'none'),
+                        help='지원하는 response_format 상한 (넘는 요청은 400)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    config = MockConfig(**{k: getattr(args, k) for k in MockConfig.FIELDS})
+    server = serve(args.host, args.port, config, args.seed)
+    print(f"🤖 OpenAI 모의 서버: http://{args.host}:{args.port}/v1")
+    print(f"   설정: {json.dumps(config.to_dict(), ensure_ascii=False)}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n종료")
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,726 @@
+#!/usr/bin/env python3
+"""
+YouArePlan EasyTax v8 - 회귀 확인 스크립트 (서버 없이 프로세스 내 직접 호출)
+
+리뷰에서 나온 동작(회로 탐색 반납 등)을 임시 SQLite DB 위에서 확인한다.
+하나라도 실패하면 exit 1.
+
+사용법:
+    python regression_checks.py
+    python regression_checks.py --only circuit_probe_release
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import traceback
+from typing import Callable, List
+
+def _prepare_env(workdir: str):
+    """api 패키지 import 전에 호출 - 임시 DB/로그, 데모 LLM 응답 사용"""
+    os.environ["DB_URL"] = f"sqlite:///{workdir}/checks.db"
+    os.environ["LOG_DIR"] = os.path.join(workdir, "logs")
+    os.environ.setdefault("OPENAI_API_KEY", "sk-proj-demo-checks")
+    os.chdir(workdir)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+class Check:
+    def __init__(self, name: str, fn: Callable[[], None], doc: str):
+        self.name = name
+        self.fn = fn
+        self.doc = doc
+
+CHECKS: List[Check] = []
+
+def check(fn: Callable[[], None]) -> Callable[[], None]:
+    CHECKS.append(Check(fn.__name__.lstrip("_"), fn, (fn.__doc__ or "").strip()))
+    return fn
+
+@check
+def circuit_probe_release():
+    """반개방 탐색이 취소돼도 자리를 반납해 회로가 계속 닫힐 수 있다"""
+    import threading
+    from api.clients import circuit, openai_client
+
+    circuit.reset()
+    b = circuit.breaker("check-model")
+    b._transition(circuit.HALF_OPEN)
+    for _ in range(circuit.LLM_CB_HALF_OPEN_PROBES):
+        b.before_call()
+        b.release()
+    b.before_call()  # 반납하지 않았다면 여기서 CircuitOpenError
+    b.record(True, 0.1)
+    assert b.state == circuit.CLOSED, b.state
+
+    # call_openai 의 취소 경로 - 헤지에 진 호출이 탐색 자리를 남기지 않는다
+    cancel = threading.Event()
+    b._transition(circuit.HALF_OPEN)
+
+    def cancelled_call(model, messages, **kwargs):
+        cancel.set()
+        raise ConnectionError("aborted")
+
+    saved = (openai_client.OPENAI_BASE_URL, openai_client._call_http, openai_client._sdk_available)
+    openai_client.OPENAI_BASE_URL = "http://127.0.0.1:9"
+    openai_client._call_http = cancelled_call
+    openai_client._sdk_available = lambda: False
+    try:
+        for _ in range(circuit.LLM_CB_HALF_OPEN_PROBES + 1):
+            cancel.clear()
+            try:
+                openai_client.call_openai("check-model", [{"role": "user", "content": "x"}], cancel=cancel)
+            except RuntimeError as e:
+                assert "cancelled" in str(e), e
+    finally:
+        openai_client.OPENAI_BASE_URL, openai_client._call_http, openai_client._sdk_available = saved
+    assert b.state == circuit.HALF_OPEN and b._probes == 0, (b.state, b._probes)
+    circuit.reset()
+
+def _add_entries(db, user_id, rows, period="2025-09"):
+    """테넌트 user_id 의 파일 하나에 (날짜, 거래처, 금액, 메모) 행 추가 → NormalizedEntry 목록"""
+    import uuid
+    from api.db.models import RawFile, NormalizedEntry
+    from api.db.tenancy import ensure_user, stamp
+    ensure_user(db, user_id)
+    raw = RawFile(user_id=stamp(user_id), period=period, source="checks", mime="text/csv", checksum=uuid.uuid4().hex)
+    db.add(raw)
+    db.flush()
+    entries = [NormalizedEntry(user_id=stamp(user_id), file_id=raw.id, raw_line=i + 1, trx_date=d, vendor=v,
+                               amount=a, vat=round(a / 11), memo=m)
+               for i, (d, v, a, m) in enumerate(rows)]
+    db.add_all(entries)
+    db.commit()
+    return entries
+
+@check
+def hedge_does_not_wait_for_unabortable_primary():
+    """SDK 처럼 끊을 수 없는 주 모델 호출이어도 헤지가 이기면 바로 돌아온다"""
+    import time
+    from api.clients import hedging
+
+    def call(model, messages, cancel=None, **kwargs):
+        time.sleep(1.5 if model == "slow" else 0.01)  # cancel 을 무시 - 진행 중인 SDK 요청
+        return {"model": model}
+
+    hedging._policies["checks"] = hedging.Policy("checks", fixed_delay=0.05, fallback="fast")
+    try:
+        started = time.perf_counter()
+        resp, parsed, model, outcome = hedging.run(call, "checks", "slow", [], lambda r: r, abortable=False)
+        elapsed = time.perf_counter() - started
+    finally:
+        hedging._policies.pop("checks", None)
+    assert (model, outcome) == ("fast", "hedge_won"), (model, outcome)
+    assert elapsed < 1.0, f"진 주 모델 호출을 {elapsed:.2f}s 기다림"
+
+@check
+def classify_cache_per_tenant():
+    """LLM 분류 캐시는 테넌트별 - cached_only 예산 단계의 테넌트가 다른 테넌트의 결과를 받지 않는다"""
+    from api.clients import budget, openai_client
+
+    first = openai_client.classify_transaction("캐시문구점", -12000, "사무 용품", user_id="cache-a")
+    assert first.get("cache") != "hit"
+    again = openai_client.classify_transaction("캐시문구점", -9000, "사무 용품", user_id="cache-a")
+    assert again.get("cache") == "hit", "같은 테넌트의 같은 거래가 캐시되지 않음"
+
+    saved = budget.mode
+    budget.mode = lambda tenant: budget.CACHED_ONLY
+    try:
+        openai_client.classify_transaction("캐시문구점", -12000, "사무 용품", user_id="cache-b")
+        raise AssertionError("다른 테넌트의 LLM 결과를 cached_only 단계에서 사용함")
+    except budget.BudgetExceeded:
+        pass
+    finally:
+        budget.mode = saved
+    income = openai_client.classify_transaction("캐시문구점", 12000, "사무 용품", user_id="cache-a")
+    assert income.get("cache") != "hit", "입금 거래가 출금 거래의 분류를 재사용함"
+
+@check
+def classify_prompt_from_registry():
+    """분류 프롬프트는 템플릿 레지스트리에서 렌더하고, 템플릿이 바뀌면 LLM 결과 캐시도 새로 묻는다"""
+    from api.clients import openai_client
+    from api.services import prompts
+
+    tpl = prompts.get_template(openai_client.CLASSIFY_PROMPT)
+    messages = openai_client.classification_messages("프롬프트문구점", -12000, "사무 용품")
+    assert messages == tpl.messages(vendor="프롬프트문구점", amount=-12000, memo="사무 용품")
+    assert messages[1]["content"] == "거래처: 프롬프트문구점, 금액: -12,000원, 메모: 사무 용품"
+
+    openai_client.classify_transaction("프롬프트문구점", -12000, "사무 용품", user_id="prompt-a")
+    assert openai_client.classify_transaction("프롬프트문구점", -12000, "사무 용품",
+                                              user_id="prompt-a").get("cache") == "hit"
+    changed = prompts.PromptTemplate(tpl.name, tpl.system + "\n추가 지침", tpl.user_template)
+    saved = prompts.REGISTRY._templates
+    prompts.REGISTRY._templates = dict(saved, **{tpl.name: changed})
+    try:
+        again = openai_client.classify_transaction("프롬프트문구점", -12000, "사무 용품", user_id="prompt-a")
+    finally:
+        prompts.REGISTRY._templates = saved
+    assert again.get("cache") != "hit", "템플릿이 바뀌었는데 이전 프롬프트의 캐시 결과를 씀"
+
+@check
+def metrics_shards_retired():
+    """끝난 스레드의 메트릭 샤드는 합계에 합쳐지고 목록에서 빠진다 (수집 비용이 스레드 수만큼 늘지 않음)"""
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from api.utils.metrics import Counter, Histogram
+
+    counter = Counter("checks_shards_total", "확인용", ("kind",))
+    hist = Histogram("checks_shards_seconds", "확인용")
+
+    def work(_=None):
+        for _ in range(10):
+            counter.inc(kind="a")
+            hist.observe(0.2)
+
+    threads = [threading.Thread(target=work) for _ in range(50)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        list(pool.map(work, range(20)))
+    assert counter._shards.live() == 0 and hist._shards.live() == 0, (counter._shards.live(), hist._shards.live())
+    assert counter.values() == {("a",): 700.0}, counter.values()
+    assert "checks_shards_seconds_count 700" in hist.collect()
+
+@check
+def refine_deferred_keeps_failed_rows():
+    """LLM 보정에 실패한 보류 행은 보류 표시와 model_used 를 유지하고 다시 시도된다"""
+    from api.db.database import SessionLocal
+    from api.db.models import ClassifiedEntry
+    from api.clients import circuit, openai_client
+    from api.services.classification import refine_deferred, DEFERRED_FLAG
+
+    db = SessionLocal()
+    try:
+        entries = _add_entries(db, "refine-tenant", [("2025-09-01", "알수없음상회", 12000, "기타")])
+        db.add(ClassifiedEntry(entry_id=entries[0].id, account_code="기타비용", tax_type="과세", confidence="0.4",
+                               model_used="rules-v1", reason="룰 | LLM 보류(예산)",
+                               flags=f'["{DEFERRED_FLAG}"]'))
+        db.commit()
+
+        def circuit_open(*args, **kwargs):
+            raise circuit.CircuitOpenError("check-model", 5.0)
+
+        saved = openai_client.call_hedged
+        openai_client.call_hedged = circuit_open
+        try:
+            result = refine_deferred(db, "refine-tenant")
+        finally:
+            openai_client.call_hedged = saved
+        assert result["refined"] == 0 and result["failed"] == 1 and result["remaining"] == 1, result
+        db.expire_all()
+        ce = db.get(ClassifiedEntry, entries[0].id)
+        assert DEFERRED_FLAG in ce.flags and ce.model_used == "rules-v1", (ce.flags, ce.model_used)
+    finally:
+        db.close()
+
+@check
+def analytics_tenant_isolation():
+    """분석 스토어는 테넌트별 - 다른 테넌트의 쓰기는 재적재를 일으키지 않고, 다른 워커의 금액 수정은 바로 보인다"""
+    from api.db.database import SessionLocal
+    from api.db.models import NormalizedEntry
+    from api.services import analytics
+
+    db = SessionLocal()
+    try:
+        _add_entries(db, "tenant-a", [("2025-09-02", "스타벅스", -5500, "커피")])
+        _add_entries(db, "tenant-b", [("2025-09-03", "이마트", -33000, "소모품")])
+        store_a = analytics.get_store(db, "tenant-a")
+        assert analytics.totals(db, user_id="tenant-a")["count"] == 1
+
+        _add_entries(db, "tenant-b", [("2025-09-04", "쿠팡", -12000, "사무용품")])
+        analytics.invalidate("tenant-b")
+        assert analytics.get_store(db, "tenant-a") is store_a, "다른 테넌트 쓰기로 재적재됨"
+        assert analytics.totals(db, user_id="tenant-b")["count"] == 2
+
+        # invalidate 없이 수정 (다른 워커) - updated_at 으로 버전이 바뀐다
+        entry = db.query(NormalizedEntry).filter(NormalizedEntry.user_id == "tenant-a").one()
+        entry.amount = -7700
+        db.commit()
+        assert analytics.totals(db, user_id="tenant-a")["amount"] == -7700
+    finally:
+        db.close()
+
+@check
+def prep_signals_tenant_version():
+    """prep 신호 메모는 테넌트 데이터 버전으로만 무효화 - 다른 테넌트의 쓰기는 재계산을 일으키지 않는다"""
+    from api.db.database import SessionLocal, engine
+    from api.services import analytics, prep
+    from sqlalchemy import text
+
+    db = SessionLocal()
+    try:
+        _add_entries(db, "prep-a", [("2025-09-06", "스타벅스", -5500, "커피")])
+        before = analytics.data_version(db, "prep-a")
+        first = prep.detect_signals(db, "2025-09", "prep-a")
+        _add_entries(db, "prep-b", [("2025-09-06", "이마트", -33000, "소모품")] * 3)
+        analytics.invalidate("prep-b")
+        assert analytics.data_version(db, "prep-a") == before
+
+        calls = []
+        saved = prep.evaluate
+        prep.evaluate = lambda *a, **kw: calls.append(a) or saved(*a, **kw)
+        try:
+            assert prep.detect_signals(db, "2025-09", "prep-a") == first
+        finally:
+            prep.evaluate = saved
+        assert not calls, "다른 테넌트 쓰기로 신호를 다시 계산함"
+    finally:
+        db.close()
+    if engine.dialect.name == "sqlite":
+        with engine.connect() as conn:
+            plan = " ".join(str(r[-1]) for r in conn.execute(text(
+                "EXPLAIN QUERY PLAN SELECT count(id), max(id), max(updated_at) FROM normalized_entries "
+                "WHERE user_id = 'prep-a'")))
+        assert "ix_normalized_entries_user" in plan, plan
+
+@check
+def period_mismatch_skips_blank_dates():
+    """날짜가 빈 행은 과세기간 불일치로 세지 않는다"""
+    from api.db.database import SessionLocal
+    from api.services import prep
+
+    db = SessionLocal()
+    try:
+        entries = _add_entries(db, "prep-dates", [("", "이마트", -33000, "소모품"), ("  ", "다이소", -5000, "소모품"),
+                                                  ("2025-09-30", "GS25", -3000, "음료"),
+                                                  ("2025-10-02", "교보문고", -18000, "도서")], period="2025-10")
+        signals = {s["code"]: s for s in prep.detect_signals(db, "2025-10", "prep-dates")}
+        mismatch = signals.get("PERIOD_MISMATCH")
+        assert mismatch and mismatch["count"] == 1, mismatch
+        assert mismatch["refs"] == [entries[2].id], mismatch
+    finally:
+        db.close()
+
+@check
+def missing_vat_taxable_expenses_only():
+    """MISSING_VAT 는 부가세가 0 인 과세 지출만 센다 - 면세/불공제/미분류 지출과 수입은 제외"""
+    from api.db.database import SessionLocal
+    from api.db.models import ClassifiedEntry
+    from api.services import prep
+
+    db = SessionLocal()
+    try:
+        entries = _add_entries(db, "prep-vat", [("2025-09-01", "이마트", -33000, "소모품"),
+                                                ("2025-09-02", "교보문고", -18000, "도서"),
+                                                ("2025-09-03", "스타벅스", -5500, "접대"),
+                                                ("2025-09-04", "거래처A", 550000, "매출"),
+                                                ("2025-09-05", "GS25", -3000, "음료")])
+        for e in entries:
+            e.vat = 0
+        db.add_all([ClassifiedEntry(entry_id=e.id, account_code=code, tax_type=tax, confidence="1.0",
+                                    model_used="user", reason="사용자 수정", flags="[]")
+                    for e, (code, tax) in zip(entries, [("소모품비", "과세"), ("도서인쇄비", "면세"),
+                                                        ("접대비", "불공제"), ("매출", "과세")])])
+        db.commit()
+        signal = {s["code"]: s for s in prep.detect_signals(db, "2025-09", "prep-vat")}.get("MISSING_VAT")
+        assert signal and signal["count"] == 1 and signal["refs"] == [entries[0].id], signal
+    finally:
+        db.close()
+
+@check
+def corrections_cross_worker_and_commit():
+    """다른 워커가 저장한 수정이 보이고, 롤백된 수정은 캐시에 남지 않으며, 적중 수는 조회 때 쌓인다"""
+    from api.db.database import SessionLocal
+    from api.db.models import ClassificationMemory
+    from api.services import corrections
+    from api.services.classification import vendor_index
+
+    saved = corrections.CORRECTION_RECHECK_SECONDS
+    corrections.CORRECTION_RECHECK_SECONDS = 0
+    worker_a, worker_b = corrections.CorrectionMemory(), corrections.CorrectionMemory()
+    index = vendor_index()
+    db = SessionLocal()
+    try:
+        assert worker_b.lookup(db, "corr-a", "스타벅스", "커피", index) is None  # B 가 빈 표를 캐시
+        worker_a.learn(db, "corr-a", "스타벅스", "커피", "복리후생비", "과세", index)
+        db.commit()
+        assert worker_b.lookup(db, "corr-a", "스타벅스", "커피", index) == ("복리후생비", "과세"), \
+            "다른 워커의 수정이 보이지 않음"
+
+        corrections.MEMORY.lookup(db, "corr-a", "이마트", "소모품", index)  # 전역 캐시에 올려 둠
+        corrections.MEMORY.learn(db, "corr-a", "이마트", "소모품", "소모품비", "과세", index)
+        db.rollback()
+        assert corrections.MEMORY.lookup(db, "corr-a", "이마트", "소모품", index) is None, "롤백된 수정이 캐시에 남음"
+
+        for _ in range(3):
+            worker_b.lookup(db, "corr-a", "스타벅스", "커피", index)
+        worker_b.flush_hits(db)
+        db.commit()
+        row = db.query(ClassificationMemory).filter(ClassificationMemory.user_id == "corr-a").one()
+        assert row.hits == 4, row.hits
+    finally:
+        corrections.CORRECTION_RECHECK_SECONDS = saved
+        db.close()
+
+@check
+def anomalies_empty_selection():
+    """엔트리가 없는 테넌트나 기간의 이상 거래 조회는 빈 결과를 돌려준다"""
+    from api.db.database import SessionLocal
+    from api.services import anomalies
+
+    db = SessionLocal()
+    try:
+        _add_entries(db, "anomaly-a", [("2025-09-01", "이마트", -33000, "소모품")] * 2)
+        for user_id, period in (("nobody", None), ("anomaly-a", "2030-01")):
+            result = anomalies.report(db, user_id, period)
+            assert result["counts"] == {"duplicates": 0, "vat_mismatch": 0, "outliers": 0}, result
+            assert result["duplicates"] == result["vat_mismatch"] == result["outliers"] == []
+    finally:
+        db.close()
+
+@check
+def snapshot_full_rebuild_safety():
+    """전체 스냅샷은 스냅샷이 아닌 디렉터리를 거부하고, 실패해도 기존 스냅샷을 남긴다"""
+    from api.services import snapshot
+    if not snapshot._pyarrow_available():
+        print("   (pyarrow 없음 - 건너뜀)")
+        return
+    from api.db.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        _add_entries(db, "snap-tenant", [("2025-09-05", "교보문고", -18000, "도서")])
+        other = tempfile.mkdtemp(prefix="not_a_snapshot_")
+        keep = os.path.join(other, "important.txt")
+        with open(keep, "w") as f:
+            f.write("keep")
+        try:
+            snapshot.write_snapshot(db, other, incremental=False)
+            raise AssertionError("스냅샷이 아닌 디렉터리를 지움")
+        except ValueError:
+            pass
+        assert os.path.exists(keep)
+
+        out = os.path.join(tempfile.mkdtemp(prefix="snap_"), "snapshots")
+        first = snapshot.write_snapshot(db, out, incremental=False)
+        saved = snapshot._write_partitions
+
+        def fail(*args, **kwargs):
+            raise RuntimeError("disk full")
+
+        snapshot._write_partitions = fail
+        try:
+            snapshot.write_snapshot(db, out, incremental=False)
+            raise AssertionError("실패가 전파되지 않음")
+        except RuntimeError:
+            pass
+        finally:
+            snapshot._write_partitions = saved
+        assert snapshot.load_state(out)["created_at"] == first["created_at"]
+        assert snapshot.monthly_vat_by_account(out, "snap-tenant"), "기존 스냅샷이 사라짐"
+        assert os.listdir(os.path.dirname(out)) == ["snapshots"], os.listdir(os.path.dirname(out))
+
+        second = snapshot.write_snapshot(db, out, incremental=False)
+        assert second["snapshots"] == first["snapshots"] + 1 and second["rows_written"] == first["rows_written"]
+        assert os.listdir(os.path.dirname(out)) == ["snapshots"], os.listdir(os.path.dirname(out))
+    finally:
+        db.close()
+
+@check
+def snapshot_incremental_updates():
+    """증분 스냅샷은 제자리 수정·재분류와 워터마크보다 늦게 commit 된 행을 중복 없이 반영한다"""
+    from api.services import snapshot
+    if not snapshot._pyarrow_available():
+        print("   (pyarrow 없음 - 건너뜀)")
+        return
+    import datetime
+    from sqlalchemy import update
+    from api.db.database import SessionLocal
+    from api.db.models import ClassifiedEntry, NormalizedEntry
+
+    db = SessionLocal()
+    try:
+        entries = _add_entries(db, "snap-incr", [("2025-09-01", "교보문고", -11000, "도서"),
+                                                 ("2025-09-02", "이마트", -22000, "소모품"),
+                                                 ("2025-09-03", "GS25", -3300, "음료")])
+        db.add(ClassifiedEntry(entry_id=entries[1].id, account_code="소모품비", tax_type="과세",
+                               confidence="0.8", model_used="rules", reason="", flags="[]"))
+        db.commit()
+        out = os.path.join(tempfile.mkdtemp(prefix="snap_"), "snapshots")
+        state = snapshot.write_snapshot(db, out, incremental=False)
+
+        entries[0].vat = 1500  # 제자리 수정
+        db.query(ClassifiedEntry).filter(ClassifiedEntry.entry_id == entries[1].id).update(
+            {"account_code": "복리후생비"})
+        # 워터마크보다 이른 updated_at 으로 늦게 commit 된 트랜잭션
+        late = datetime.datetime.fromisoformat(state["last_updated_at"]) - datetime.timedelta(seconds=60)
+        db.execute(update(NormalizedEntry).where(NormalizedEntry.id == entries[2].id)
+                   .values(amount=-4400, updated_at=late))
+        db.commit()
+        _add_entries(db, "snap-incr", [("2025-09-04", "다이소", -5000, "소모품")])
+
+        snapshot.write_snapshot(db, out)
+        snapshot.write_snapshot(db, out)  # 같은 구간을 다시 읽어도 중복 없음
+        table = snapshot.open_dataset(out).to_table()
+        rows = {r["entry_id"]: r for r in table.to_pylist() if r["user_id"] == "snap-incr"}
+        assert len(rows) == sum(1 for r in table.to_pylist() if r["user_id"] == "snap-incr"), "중복 행"
+        assert len(rows) == 4, sorted(rows)
+        assert rows[entries[0].id]["vat"] == 1500, "제자리 수정 누락"
+        assert rows[entries[1].id]["account_code"] == "복리후생비", "재분류 누락"
+        assert rows[entries[2].id]["amount"] == -4400, "늦게 commit 된 행 누락"
+        parts = os.listdir(os.path.join(out, "user_id=snap-incr", "month=2025-09"))
+        assert len(parts) == 1 and not parts[0].startswith("."), parts
+    finally:
+        db.close()
+
+_LOG_WORKER = """
+import sys
+from api.utils.logger import log_jsonl, flush_logs, shutdown_logs, log_stats
+for i in range(int(sys.argv[1])):
+    log_jsonl({"event": "check", "worker": sys.argv[2], "i": i, "pad": "x" * 200}, name="rotation")
+    if i % 50 == 0:
+        flush_logs()
+shutdown_logs()
+assert log_stats()["dropped"] == 0
+"""
+
+@check
+def log_rotation_multi_worker():
+    """여러 워커 프로세스가 같은 로그를 로테이션해도 줄을 잃지 않는다"""
+    import glob, gzip, subprocess
+    log_dir = tempfile.mkdtemp(prefix="logs_")
+    env = dict(os.environ, LOG_DIR=log_dir, LOG_MAX_BYTES="20000", LOG_BACKUP_COUNT="0",
+               PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    workers, per_worker = 4, 600
+    procs = [subprocess.Popen([sys.executable, "-c", _LOG_WORKER, str(per_worker), str(w)], env=env)
+             for w in range(workers)]
+    assert all(p.wait(timeout=120) == 0 for p in procs)
+    seen = set()
+    files = glob.glob(os.path.join(log_dir, "rotation*.jsonl*"))
+    for path in files:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                r = json.loads(line)
+                seen.add((r["worker"], r["i"]))
+    assert len(files) > 2, files
+    assert len(seen) == workers * per_worker, f"{workers * per_worker - len(seen)}줄 유실"
+
+@check
+def stream_usage_and_disconnect():
+    """스트리밍 분류는 실제 usage 를 돌려주고, 클라이언트가 끊어도 반개방 탐색 자리를 반납한다"""
+    from api.clients import circuit, openai_client
+
+    content = '{"account_code": "복리후생비", "tax_type": "불공제", "confidence": 0.9, "reason": "커피"}'
+
+    def fake_stream(model, messages, usage, **kwargs):
+        for i in range(0, len(content), 8):
+            yield content[i:i + 8]
+        usage.update(prompt_tokens=321, completion_tokens=45, total_tokens=366)
+
+    saved = (openai_client.OPENAI_BASE_URL, openai_client._stream_http, openai_client._sdk_available)
+    openai_client.OPENAI_BASE_URL = "http://127.0.0.1:9"
+    openai_client._stream_http = fake_stream
+    openai_client._sdk_available = lambda: False
+    circuit.reset()
+    try:
+        events = list(openai_client.classify_transaction_stream("스트림카페", 4500, "usage-check"))
+        result = events[-1][2]
+        assert result["usage"]["prompt_tokens"] == 321 and result["usage"]["completion_tokens"] == 45, result
+
+        b = circuit.breaker(openai_client.OPENAI_MODEL_CLASSIFY)
+        b._transition(circuit.HALF_OPEN)
+        for _ in range(circuit.LLM_CB_HALF_OPEN_PROBES + 1):
+            stream = openai_client.stream_openai(openai_client.OPENAI_MODEL_CLASSIFY, [{"role": "user", "content": "x"}])
+            next(stream)
+            stream.close()  # 클라이언트 연결 끊김 → GeneratorExit
+        assert b.state == circuit.HALF_OPEN and b._probes == 0, (b.state, b._probes)
+    finally:
+        openai_client.OPENAI_BASE_URL, openai_client._stream_http, openai_client._sdk_available = saved
+        circuit.reset()
+
+@check
+def vendor_aliases_and_branch_suffix():
+    """저장된 거래처 매핑이 정규화에 쓰이고, 업종명(…서점/…음식점)은 지점 접미사로 잘리지 않는다"""
+    from api.db.database import SessionLocal
+    from api.db.models import Vendor, VendorAlias
+    from api.services.rulesets import current_ruleset
+    from api.services.vendors import normalize_vendor, load_aliases
+
+    assert normalize_vendor("영풍 서점") == "영풍 서점"
+    assert normalize_vendor("김밥 음식점") == "김밥 음식점"
+    assert normalize_vendor("(주)이마트 성수역점") == "이마트"
+    index = current_ruleset().vendor_index
+    assert index.canonical("스타벅스 강남점") == "스타벅스"
+
+    db = SessionLocal()
+    try:
+        vendor = Vendor(name="스타벅스")
+        db.add(vendor)
+        db.flush()
+        db.add(VendorAlias(raw_name="별다방 역삼", vendor_id=vendor.id))
+        db.commit()
+        assert index.canonical("별다방 역삼") == "별다방 역삼"
+        load_aliases(db, force=True)
+        assert index.canonical("별다방 역삼") == "스타벅스"
+        assert current_ruleset().classify("별다방 역삼", "")["account_code"] == \
+            current_ruleset().classify("스타벅스", "")["account_code"]
+    finally:
+        db.close()
+
+@check
+def neighbors_tenant_isolation():
+    """kNN 색인은 테넌트별로 잠그고 무효화하며, 같은 텍스트로 합쳐진 행에서는 자기 몫만 빠진다"""
+    from api.db.database import SessionLocal
+    from api.db.models import ClassifiedEntry, NormalizedEntry
+    from api.services import neighbors
+
+    db = SessionLocal()
+    try:
+        rows = [("2025-09-0%d" % d, "쿠팡", -12000, "사무용품") for d in (1, 2, 3)]
+        entries = _add_entries(db, "knn-a", rows) + _add_entries(db, "knn-b", rows)
+        db.add_all([ClassifiedEntry(entry_id=e.id, account_code="소모품비", tax_type="과세", confidence="1.0",
+                                    model_used="user", reason="사용자 수정", flags="[]") for e in entries])
+        db.commit()
+        neighbors.invalidate()
+
+        probe = NormalizedEntry(user_id="knn-a", vendor="쿠팡", memo="사무용품")
+        assert neighbors.predict_many(db, [probe])[0]["account_code"] == "소모품비"
+        # 자기 몫을 빼면 형제 2건뿐이라 KNN_MIN_VOTES(3)에 못 미친다
+        assert neighbors.predict_many(db, [entries[0]]) == [None]
+        # 형제가 3건이면 자기 몫만 빠지고 형제들의 표는 그대로 남는다
+        siblings = _add_entries(db, "knn-c", rows + [("2025-09-04", "쿠팡", -12000, "사무용품")])
+        db.add_all([ClassifiedEntry(entry_id=e.id, account_code="소모품비", tax_type="과세", confidence="1.0",
+                                    model_used="user", reason="사용자 수정", flags="[]") for e in siblings])
+        lone = _add_entries(db, "knn-c", [("2025-09-05", "다이소", -3000, "청소용품")])[0]
+        db.add(ClassifiedEntry(entry_id=lone.id, account_code="복리후생비", tax_type="과세", confidence="1.0",
+                               model_used="user", reason="사용자 수정", flags="[]"))
+        db.commit()
+        assert neighbors.predict_many(db, [siblings[0]])[0]["account_code"] == "소모품비"
+        assert neighbors.predict_many(db, [lone]) == [None], "혼자 든 행이 자기 자신과 매칭됨"
+
+        index_a = neighbors.get_index(db, "knn-a")
+        neighbors.invalidate("knn-b")
+        assert neighbors.get_index(db, "knn-a") is index_a, "다른 테넌트 수정으로 색인을 다시 만듦"
+
+        # 다른 테넌트가 재적재 중(잠금 보유)이어도 기다리지 않는다
+        neighbors.invalidate("knn-a")
+        with neighbors._versions.lock("knn-b"):
+            assert neighbors.get_index(db, "knn-a") is not index_a
+    finally:
+        db.close()
+
+@check
+def search_tenant_indexed():
+    """검색 색인은 테넌트 키로만 읽고(2글자 포함), 수정/삭제/Core 삽입도 반영된다 - DB 색인과 Python 대체 색인 모두"""
+    from sqlalchemy import insert, select
+    from api.db.database import SessionLocal, engine
+    from api.db.models import NormalizedEntry
+    from api.services import search
+
+    assert search.ensure_search_index(engine) == "bigram", search._backend
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = 'entries_fts'").first() is None
+    db = SessionLocal()
+    try:
+        for backend in ("bigram", "python"):
+            search._backend = backend
+            a_id, b_id = f"search-{backend}-a", f"search-{backend}-b"
+            a = _add_entries(db, a_id, [("2025-09-01", "스타벅스 강남점", -5500, "아이스커피"),
+                                        ("2025-09-02", "김밥천국", -8000, "식대"),
+                                        ("2025-09-03", "Coupang", -12000, "사무용품")])
+            _add_entries(db, b_id, [("2025-09-01", "스타벅스", -5500, "커피")])
+
+            def ids(q, user_id=a_id):
+                return sorted(i for (i,) in db.query(NormalizedEntry.id).filter(search.search_filter(db, q, user_id)))
+
+            assert ids("커피") == [a[0].id], f"{backend}: 단어 중간의 2글자 검색어를 못 찾거나 다른 테넌트 행이 섞임"
+            assert ids("식대") == [a[1].id] and ids("스타벅스") == [a[0].id] and ids("벅스강") == []
+            assert ids("co") == [a[2].id] and ids("COUP") == [a[2].id], f"{backend}: ASCII 대소문자 무시가 LIKE 와 다름"
+            assert ids("스타 커피") == [a[0].id] and ids("스타벅스 식대") == []
+            assert ids("커피", b_id) != ids("커피")
+
+            if backend == "bigram":
+                # 테넌트 행을 먼저 고르고 (user_id, gram) 기본키 범위만 읽는다 - 전체 테넌트 매칭이 없다
+                compiled = select(NormalizedEntry.id).where(search.search_filter(db, "스타벅스 커피", a_id)) \
+                    .compile(engine)
+                plan = " | ".join(str(r[-1]) for r in db.connection().exec_driver_sql(
+                    "EXPLAIN QUERY PLAN " + str(compiled), tuple(compiled.params[k] for k in compiled.positiontup)))
+                assert "entries_fts" not in plan and "SCAN entry_bigrams" not in plan, plan
+                assert "SEARCH entry_bigrams USING PRIMARY KEY (user_id=? AND gram=?)" in plan, plan
+
+            a[0].memo = "라떼"
+            db.commit()
+            assert ids("커피") == [] and ids("라떼") == [a[0].id], f"{backend}: 수정이 색인에 반영되지 않음"
+            db.delete(a[1])
+            db.commit()
+            assert ids("식대") == [], f"{backend}: 삭제가 색인에 반영되지 않음"
+            with engine.begin() as conn:
+                conn.execute(insert(NormalizedEntry), [{"user_id": a_id, "file_id": a[0].file_id, "raw_line": 9,
+                                                        "trx_date": "2025-09-04", "vendor": "이디야", "memo": "커피"}])
+            assert len(ids("커피")) == 1, f"{backend}: Core 대량 삽입이 색인에 반영되지 않음"
+    finally:
+        search.ensure_search_index(engine)
+        db.close()
+
+# DB 를 모두 비우므로 마지막에 둔다
+@check
+def clear_data_resets_caches():
+    """clear-data 는 학습/거래처 테이블까지 지우고 인메모리 캐시도 비워, 지운 사용자가 다음 요청에서 다시 생성된다"""
+    from api.db.database import SessionLocal
+    from api.db.models import ClassificationMemory, User, Vendor, VendorAlias
+    from api.db.tenancy import ensure_user
+    from api.routers.debug import clear_all_data
+    from api.services import corrections
+    from api.services.classification import vendor_index
+
+    saved = corrections.CORRECTION_RECHECK_SECONDS
+    corrections.CORRECTION_RECHECK_SECONDS = 3600  # 캐시 재확인으로 우연히 통과하지 않도록
+    index = vendor_index()
+    db = SessionLocal()
+    try:
+        ensure_user(db, "clear-a")
+        corrections.MEMORY.learn(db, "clear-a", "교보문고", "도서", "도서인쇄비", "면세", index)
+        db.add(Vendor(name="교보문고"))
+        db.commit()
+        db.add(VendorAlias(raw_name="교보문고 광화문", vendor_id=db.query(Vendor.id).filter(Vendor.name == "교보문고").scalar()))
+        db.commit()
+        assert corrections.MEMORY.lookup(db, "clear-a", "교보문고", "도서", index) == ("도서인쇄비", "면세")
+
+        assert clear_all_data(db).success
+        for model in (ClassificationMemory, Vendor, VendorAlias, User):
+            assert db.query(model).count() == 0, model.__tablename__
+        assert corrections.MEMORY.lookup(db, "clear-a", "교보문고", "도서", index) is None, "지운 학습이 캐시에 남음"
+        ensure_user(db, "clear-a")
+        assert db.get(User, "clear-a") is not None, "지운 사용자가 다시 생성되지 않음"
+    finally:
+        corrections.CORRECTION_RECHECK_SECONDS = saved
+        db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='YouArePlan EasyTax v8 회귀 확인')
+    parser.add_argument('--only', help='실행할 확인 이름 (쉼표 구분)')
+    args = parser.parse_args()
+    only = {s.strip() for s in args.only.split(",")} if args.only else None
+    checks = [c for c in CHECKS if not only or c.name in only]
+
+    workdir = tempfile.mkdtemp(prefix="checks_")
+    _prepare_env(workdir)
+    from api.db import models  # noqa - init_db 가 만들 테이블 등록
+    from api.db.utils import init_db
+    init_db()
+
+    print(f"🔎 YouArePlan EasyTax v8 회귀 확인 ({len(checks)}건)")
+    print(f"📂 작업 디렉터리: {workdir}")
+    print("=" * 60)
+    failed = []
+    for c in checks:
+        try:
+            c.fn()
+            print(f"✅ {c.name}: {c.doc}")
+        except Exception:
+            failed.append(c.name)
+            print(f"❌ {c.name}: {c.doc}")
+            traceback.print_exc()
+    print("=" * 60)
+    if failed:
+        print(f"❌ 실패 {len(failed)}건: {', '.join(failed)}")
+        sys.exit(1)
+    print("✅ 모두 통과")
+
+if __name__ == "__main__":
+    main()
@@ -45,20 +45,20 @@ class TransactionListManager {
         if (typeFilter) {
             typeFilter.addEventListener('change', () => {
                 this.filters.type = typeFilter.value;
-                this.applyFilters();
+                this.loadTransactions();
             });
         }
 
         if (searchInput) {
             searchInput.addEventListener('input', this.debounce(() => {
                 this.filters.search = searchInput.value;
-                this.applyFilters();
+                this.loadTransactions();
             }, 300));
 
             searchInput.addEventListener('keypress', (e) => {
                 if (e.key === 'Enter') {
                     this.filters.search = searchInput.value;
-                    this.applyFilters();
+                    this.loadTransactions();
                 }
             });
         }
@@ -66,7 +66,7 @@ class TransactionListManager {
         if (searchButton) {
             searchButton.addEventListener('click', () => {
                 this.filters.search = searchInput?.value || '';
-                this.applyFilters();
+                this.loadTransactions();
             });
         }
 
@@ -108,12 +108,24 @@ class TransactionListManager {
         }
     }
 
+    // 서버 검색/정렬/유형 필터 파라미터 구성 (전체 원장을 내려받지 않음)
+    buildListQuery() {
+        const params = new URLSearchParams({ per_page: '200' });
+        const search = (this.filters.search || '').trim();
+        if (search) params.set('q', search);
+        if (this.filters.type !== 'all') params.set('type', this.filters.type);
+
+        const sortMap = { date: 'date', vendor: 'vendor', amount: 'amount' };
+        if (sortMap[this.sortField]) params.set('sort', `${sortMap[this.sortField]}_${this.sortOrder}`);
+        return `/entries/list?${params.toString()}`;
+    }
+
     // API에서 거래 데이터 로드
     async loadTransactions() {
         this.showLoading(true);
 
         try {
-            const response = await this.apiCall('/entries/list?per_page=100');
+            const response = await this.apiCall(this.buildListQuery());
 
             if (response.success) {
                 this.allTransactions = response.data.map(entry => ({
@@ -189,19 +201,7 @@ class TransactionListManager {
             }
         }
 
-        // 거래 유형 필터
-        if (this.filters.type !== 'all') {
-            filtered = filtered.filter(transaction => transaction.type === this.filters.type);
-        }
-
-        // 검색 필터
-        if (this.filters.search) {
-            const searchTerm = this.filters.search.toLowerCase();
-            filtered = filtered.filter(transaction =>
-                (transaction.vendor || '').toLowerCase().includes(searchTerm) ||
-                (transaction.memo || '').toLowerCase().includes(searchTerm)
-            );
-        }
+        // 거래 유형/검색 필터는 서버(/entries/list?type=&q=)에서 적용됨
 
         this.filteredTransactions = filtered;
         this.currentPage = 1;
@@ -219,9 +219,8 @@ class TransactionListManager {
             this.sortOrder = 'desc';
         }
 
-        this.sortTransactions();
-        this.renderCurrentPage();
         this.updateSortIndicators();
+        this.loadTransactions();
     }
 
     // 거래 데이터 정렬
@@ -583,7 +582,7 @@ class TransactionListManager {
         if (typeFilter) typeFilter.value = 'all';
         if (searchInput) searchInput.value = '';
 
-        this.applyFilters();
+        this.loadTransactions();
     }
 
     // 로딩 상태 표시